@@ -29,9 +29,21 @@ class Settings:
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     API_V1_STR: str = os.getenv("API_V1_STR", "/api/v1")
 
+    # Logging (见 app/core/logging_config.py)
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "DEBUG" if DEBUG else "INFO")
+    LOG_LEVELS: Optional[str] = os.getenv("LOG_LEVELS") # 按模块设置级别，如 "app.mqtt=WARNING,app.services=INFO"
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text" if DEBUG else "json") # json 或 text
+    LOG_SAMPLE_RATES: Optional[str] = os.getenv("LOG_SAMPLE_RATES", "mqtt.status=0.01") # 高频事件采样比例
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", 10000)) # 日志队列上限，满了直接丢弃，不阻塞事件循环
+
     # MongoDB
     MONGO_URI: Optional[str] = os.getenv("MONGO_URI")
     MONGO_DB_NAME: Optional[str] = os.getenv("MONGO_DB_NAME")
+    # 查询形态分析器 (见 app/db/query_profiler.py)，运行时可通过管理接口开关
+    MONGO_PROFILER_ENABLED: bool = os.getenv("MONGO_PROFILER_ENABLED", "False").lower() == "true"
+    MONGO_SLOW_MS: float = float(os.getenv("MONGO_SLOW_MS", 100)) # 超过该耗时的命令记慢日志
+    # 启动时自动补齐缺失索引 (默认仅开发环境)；生产环境使用 `python -m scripts.migrate_indexes`
+    MONGO_ENSURE_INDEXES_ON_STARTUP: bool = os.getenv("MONGO_ENSURE_INDEXES_ON_STARTUP", str(DEBUG)).lower() == "true"
 
     # MQTT
     MQTT_BROKER_HOST: Optional[str] = os.getenv("MQTT_BROKER_HOST")
@@ -39,10 +51,79 @@ class Settings:
     MQTT_USERNAME: Optional[str] = os.getenv("MQTT_USERNAME")
     MQTT_PASSWORD: Optional[str] = os.getenv("MQTT_PASSWORD")
     MQTT_CLIENT_ID_PREFIX: str = os.getenv("MQTT_CLIENT_ID_PREFIX", "backend_client_")
+    # 固定的 client id 使 Broker 能保留持久会话；未设置时为 前缀+主机名。
+    # 同一主机上运行多个连接 MQTT 的进程时必须为每个进程设置不同的值，否则会互相踢下线
+    MQTT_CLIENT_ID: Optional[str] = os.getenv("MQTT_CLIENT_ID")
+    MQTT_KEEPALIVE_SECONDS: int = int(os.getenv("MQTT_KEEPALIVE_SECONDS", 60))
+    MQTT_RECONNECT_MIN_SECONDS: float = float(os.getenv("MQTT_RECONNECT_MIN_SECONDS", 1))
+    MQTT_RECONNECT_MAX_SECONDS: float = float(os.getenv("MQTT_RECONNECT_MAX_SECONDS", 60))
+    MQTT_MAX_INFLIGHT_MESSAGES: int = int(os.getenv("MQTT_MAX_INFLIGHT_MESSAGES", 1000)) # 受 Broker 的 receive-maximum 限制
+    MQTT_RPC_TIMEOUT_SECONDS: float = float(os.getenv("MQTT_RPC_TIMEOUT_SECONDS", 10)) # call_device 默认等待设备响应的时间
+    MQTT_OUTBOX_SIZE: int = int(os.getenv("MQTT_OUTBOX_SIZE", 1000)) # 断线期间缓冲的下发消息上限
     MQTT_TLS_ENABLED: bool = os.getenv("MQTT_TLS_ENABLED", "False").lower() == "true"
     MQTT_CA_CERTS: Optional[str] = os.getenv("MQTT_CA_CERTS")
     MQTT_CERTFILE: Optional[str] = os.getenv("MQTT_CERTFILE")
     MQTT_KEYFILE: Optional[str] = os.getenv("MQTT_KEYFILE")
+    # 入站消息日志 (见 app/mqtt/journal.py)，设置目录即启用
+    MQTT_JOURNAL_DIR: Optional[str] = os.getenv("MQTT_JOURNAL_DIR")
+    MQTT_JOURNAL_SEGMENT_MB: int = int(os.getenv("MQTT_JOURNAL_SEGMENT_MB", 64))
+    MQTT_JOURNAL_MAX_SEGMENTS: int = int(os.getenv("MQTT_JOURNAL_MAX_SEGMENTS", 20)) # 每个进程保留的段文件数
+    # 设备事件去重 (见 app/mqtt/idempotency.py)：已处理事件标识的保留时间、进程内跟踪的设备数上限
+    MQTT_DEDUP_TTL_SECONDS: int = int(os.getenv("MQTT_DEDUP_TTL_SECONDS", 86400))
+    MQTT_DEDUP_MAX_DEVICES: int = int(os.getenv("MQTT_DEDUP_MAX_DEVICES", 100000))
+    # 离线设备指令队列 (见 app/services/outbox_service.py)
+    DEVICE_OUTBOX_TTL_SECONDS: int = int(os.getenv("DEVICE_OUTBOX_TTL_SECONDS", 7 * 86400))
+    DEVICE_OUTBOX_BATCH_LIMIT: int = int(os.getenv("DEVICE_OUTBOX_BATCH_LIMIT", 50)) # 一条 batch 消息最多包含的指令数
+    # 设备配置增量同步 (见 app/services/config_sync_service.py)
+    CONFIG_SYNC_MAX_CHANGES: int = int(os.getenv("CONFIG_SYNC_MAX_CHANGES", 200)) # 超过则改为全量快照
+    CONFIG_CHANGELOG_TTL_SECONDS: int = int(os.getenv("CONFIG_CHANGELOG_TTL_SECONDS", 30 * 86400))
+    # 设备解绑后的级联删除 (见 app/services/device_unbind_service.py)：每批删除条数、批间暂停、未完成任务的扫描间隔
+    DEVICE_CASCADE_BATCH_SIZE: int = int(os.getenv("DEVICE_CASCADE_BATCH_SIZE", 500))
+    DEVICE_CASCADE_BATCH_PAUSE_SECONDS: float = float(os.getenv("DEVICE_CASCADE_BATCH_PAUSE_SECONDS", 0.05))
+    DEVICE_CASCADE_SWEEP_INTERVAL_SECONDS: float = float(os.getenv("DEVICE_CASCADE_SWEEP_INTERVAL_SECONDS", 300))
+    # 数据保留 (见 app/services/retention_service.py)，天数 <= 0 表示永久保留
+    NOTIFICATION_RETENTION_DAYS: int = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 365))
+    NOTIFICATION_READ_RETENTION_DAYS: int = int(os.getenv("NOTIFICATION_READ_RETENTION_DAYS", 90))
+    NOTIFICATION_RETENTION_DAYS_BY_TYPE: str = os.getenv("NOTIFICATION_RETENTION_DAYS_BY_TYPE", "LowBattery=30,DeviceOffline=30")
+    SOS_RESOLVED_RETENTION_DAYS: int = int(os.getenv("SOS_RESOLVED_RETENTION_DAYS", 365))
+    # 设置后保留任务把到期文档先归档为 gzip NDJSON 分段再删除；不设置则直接删除
+    RETENTION_ARCHIVE_DIR: Optional[str] = os.getenv("RETENTION_ARCHIVE_DIR")
+    RETENTION_ARCHIVE_SEGMENT_DOCS: int = int(os.getenv("RETENTION_ARCHIVE_SEGMENT_DOCS", 100000))
+    # expireAt TTL 索引的 expireAfterSeconds：保留任务未运行时兜底删除的延迟，与是否归档无关 (修改后由 migrate_indexes 通过 collMod 生效)
+    RETENTION_TTL_GRACE_SECONDS: int = int(os.getenv("RETENTION_TTL_GRACE_SECONDS", 7 * 86400))
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", 1000))
+    RETENTION_BATCH_PAUSE_SECONDS: float = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", 0.1))
+    RETENTION_JOB_ENABLED: bool = os.getenv("RETENTION_JOB_ENABLED", "False").lower() == "true" # 只在一个实例上开启
+    RETENTION_INTERVAL_SECONDS: float = float(os.getenv("RETENTION_INTERVAL_SECONDS", 3600))
+    # 流式导出 (见 app/services/export_service.py)：游标每批读取条数、输出块大小
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+    EXPORT_CHUNK_BYTES: int = int(os.getenv("EXPORT_CHUNK_BYTES", 64 * 1024))
+    # 语音合成 (见 app/services/tts_service.py)：local 为本地替身引擎，aliyun 调用阿里云 NLS
+    TTS_ENGINE: str = os.getenv("TTS_ENGINE", "aliyun" if os.getenv("ALIYUN_NLS_APPKEY") else "local")
+    TTS_VOICE: str = os.getenv("TTS_VOICE", "xiaoyun")
+    TTS_CACHE_DIR: str = os.getenv("TTS_CACHE_DIR", str(BASE_DIR / "tts_cache"))
+    TTS_PREGENERATE_ON_STARTUP: bool = os.getenv("TTS_PREGENERATE_ON_STARTUP", "True").lower() == "true"
+    TTS_PREGENERATE_CONCURRENCY: int = int(os.getenv("TTS_PREGENERATE_CONCURRENCY", 4))
+    # 设备方言 -> 合成音色 (阿里云 NLS 方言发音人)；未列出的方言使用 TTS_VOICE
+    TTS_DIALECT_VOICES: str = os.getenv("TTS_DIALECT_VOICES", "cantonese=shanshan,sichuan=xiaoyue,dongbei=dahu,tianjin=aikan")
+    # 联系人称呼语音的后台合成队列：每批最多取出的条数、同时合成数、每秒最多请求 TTS 后端的次数
+    TTS_QUEUE_BATCH_SIZE: int = int(os.getenv("TTS_QUEUE_BATCH_SIZE", 20))
+    TTS_QUEUE_CONCURRENCY: int = int(os.getenv("TTS_QUEUE_CONCURRENCY", 4))
+    TTS_QUEUE_RATE_PER_SECOND: float = float(os.getenv("TTS_QUEUE_RATE_PER_SECOND", 5))
+    TTS_CONTACT_AUDIO_WAIT_SECONDS: float = float(os.getenv("TTS_CONTACT_AUDIO_WAIT_SECONDS", 30)) # 下发通讯录前等待称呼语音合成的最长时间
+    # 设备下载音频等场景使用的对外访问地址，如 https://api.example.com；生产环境必须设置，
+    # 未设置时下发给手表的语音URL是相对路径 (手表无法下载)，首次生成URL时会记录警告
+    PUBLIC_BASE_URL: str = os.getenv("PUBLIC_BASE_URL", "")
+    ALIYUN_ACCESS_KEY_ID: Optional[str] = os.getenv("ALIYUN_ACCESS_KEY_ID")
+    ALIYUN_ACCESS_KEY_SECRET: Optional[str] = os.getenv("ALIYUN_ACCESS_KEY_SECRET")
+    ALIYUN_NLS_APPKEY: Optional[str] = os.getenv("ALIYUN_NLS_APPKEY")
+    ALIYUN_NLS_REGION: str = os.getenv("ALIYUN_NLS_REGION", "cn-shanghai")
+    # 事件处理失败后的死信重试 (见 app/services/dead_letter_service.py)
+    DEAD_LETTER_MAX_ATTEMPTS: int = int(os.getenv("DEAD_LETTER_MAX_ATTEMPTS", 8))
+    DEAD_LETTER_BASE_DELAY_SECONDS: float = float(os.getenv("DEAD_LETTER_BASE_DELAY_SECONDS", 5))
+    DEAD_LETTER_MAX_DELAY_SECONDS: float = float(os.getenv("DEAD_LETTER_MAX_DELAY_SECONDS", 3600))
+    DEAD_LETTER_POLL_SECONDS: float = float(os.getenv("DEAD_LETTER_POLL_SECONDS", 5))
+    DEAD_LETTER_BATCH_SIZE: int = int(os.getenv("DEAD_LETTER_BATCH_SIZE", 50))
 
 
     # JWT
@@ -64,6 +145,9 @@ class Settings:
     WX_SUB_ID_BILLING: Optional[str] = os.getenv("WX_SUB_ID_BILLING")
     WX_SUB_ID_LOW_BATT: Optional[str] = os.getenv("WX_SUB_ID_LOW_BATT")
 
+    # 管理接口 (/api/v1/admin)，请求头 X-Admin-Token 需与之一致；未设置时管理接口不可用
+    ADMIN_API_TOKEN: Optional[str] = os.getenv("ADMIN_API_TOKEN")
+
     # CORS
     BACKEND_CORS_ORIGINS_STR: Optional[str] = os.getenv("BACKEND_CORS_ORIGINS")
     BACKEND_CORS_ORIGINS: List[str] = []
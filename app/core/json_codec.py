@@ -0,0 +1,73 @@
+# app/core/json_codec.py
+# 全项目统一的JSON编解码：优先使用 orjson，不可用时回退到标准库 json
+import json
+import uuid
+from datetime import date, datetime, time
+from typing import Any, Union
+
+from bson import Decimal128, ObjectId
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError: # orjson 是可选依赖
+    orjson = None
+
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，统一捕获这个即可
+JSONDecodeError = json.JSONDecodeError
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+if orjson is not None:
+    def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """直接解析字节串 (无需先 .decode())，非法UTF-8同样抛出 JSONDecodeError"""
+        return orjson.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        """序列化为紧凑的UTF-8字节串 (中文不转义)，原生支持 datetime/UUID"""
+        return orjson.dumps(obj)
+
+    def dumps_document(doc: Any) -> bytes:
+        """序列化直接从 Mongo 读出的文档 (导出/归档)：ObjectId/Decimal128 输出为字符串"""
+        return orjson.dumps(doc, default=_bson_default)
+else:
+    def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        try:
+            return json.loads(data)
+        except UnicodeDecodeError as e:
+            # 与 orjson 的行为保持一致：非法UTF-8也视为JSON解析错误
+            raise JSONDecodeError(f"Invalid UTF-8: {e}", "", 0) from e
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+    def dumps_document(doc: Any) -> bytes:
+        return json.dumps(doc, ensure_ascii=False, separators=(",", ":"), default=_document_default).encode("utf-8")
+
+    def _default(obj: Any) -> Any:
+        # 与 orjson 的原生类型支持对齐 (datetime/date/time/UUID)，其余类型同样抛 TypeError
+        if isinstance(obj, (datetime, date, time)):
+            return obj.isoformat()
+        if isinstance(obj, uuid.UUID):
+            return str(obj)
+        raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+    def _document_default(obj: Any) -> Any:
+        if isinstance(obj, (ObjectId, Decimal128)):
+            return str(obj)
+        return _default(obj)
+
+def _bson_default(obj: Any) -> Any:
+    # 经 model_dump 写入的文档 _id 是驱动生成的 ObjectId
+    if isinstance(obj, (ObjectId, Decimal128)):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class FastJSONResponse(JSONResponse):
+    """用作 FastAPI 的 default_response_class，列表接口的渲染走 orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
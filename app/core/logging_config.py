@@ -0,0 +1,207 @@
+# app/core/logging_config.py
+# 结构化日志子系统：
+#   - 业务代码 (事件循环线程) 只负责把 LogRecord 放入有界队列，真正的格式化/脱敏/写 stdout 在后台线程完成
+#   - 队列满时直接丢弃并计数，绝不阻塞事件循环
+#   - 支持按模块设置级别 (LOG_LEVELS="app.mqtt=WARNING,app.services=INFO")
+#   - 高频事件按 sample 键采样 (LOG_SAMPLE_RATES="mqtt.status=0.01")
+#   - 输出前对 token / openid 等敏感字段脱敏
+#
+# 用法：
+#   logger = logging.getLogger(__name__)
+#   logger.info("Device status updated", extra={"imei": imei, "sample": "mqtt.status"})
+# extra 中的字段会作为结构化字段输出 (json 格式下为顶层键)。
+import atexit
+import logging
+import queue
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from app.core import json_codec
+from app.core.config import settings
+
+# LogRecord 的标准属性，其余属性视为通过 extra 传入的结构化字段
+_STANDARD_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+# 需要脱敏的字段名 (不区分大小写)
+REDACTED_KEYS = frozenset({
+    "token", "access_token", "refresh_token", "authorization", "session_key", "secret", "password",
+    "openid", "wxopenid", "unionid", "wxunionid", "touser", "touser_openid",
+})
+REDACTED = "***"
+
+# 消息文本中的敏感片段：JWT、以及 key=value / key: value 形式的 openid、token 等
+_JWT_PATTERN = re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]+")
+_KV_PATTERN = re.compile(
+    r"(?i)(\b(?:access_token|refresh_token|token|session_key|secret|openid|wxOpenid|unionid|wxUnionid)\b['\"]?\s*[:=]\s*['\"]?)([^\s'\",}&]+)"
+)
+
+def redact_text(text: str) -> str:
+    text = _JWT_PATTERN.sub(REDACTED, text)
+    return _KV_PATTERN.sub(lambda m: m.group(1) + REDACTED, text)
+
+def redact_value(key: str, value: Any) -> Any:
+    if key.lower() in REDACTED_KEYS and value is not None:
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: redact_value(str(k), v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact_value(key, v) for v in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+class SamplingFilter(logging.Filter):
+    """
+    对带有 sample 属性的记录按配置比例采样 (例如每100条心跳只保留1条)。
+    采用计数器而非随机数，开销恒定且结果可预测；WARNING 及以上级别不参与采样。
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._counters: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(key)
+        if rate is None or rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        count = self._counters.get(key, 0)
+        self._counters[key] = count + 1
+        return count % round(1 / rate) == 0
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """队列满时丢弃记录并计数，不阻塞调用方；记录的完整格式化推迟到监听线程"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只合并 msg % args，固定消息内容；格式化、脱敏交给后台线程
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructuredFormatter(logging.Formatter):
+    """在监听线程中运行：脱敏并输出为单行JSON或可读文本"""
+
+    def __init__(self, fmt: str = "json"):
+        super().__init__()
+        self.fmt = fmt
+
+    @staticmethod
+    def extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+        return {
+            key: redact_value(key, value)
+            for key, value in record.__dict__.items()
+            if key not in _STANDARD_RECORD_ATTRS and key != "sample"
+        }
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = redact_text(record.getMessage())
+        fields = self.extra_fields(record)
+        exc_text = self.formatException(record.exc_info) if record.exc_info else None
+
+        if self.fmt == "json":
+            entry: Dict[str, Any] = {
+                "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": message,
+            }
+            entry.update(fields)
+            if exc_text:
+                entry["exc"] = exc_text
+            try:
+                return json_codec.dumps(entry).decode("utf-8")
+            except TypeError: # extra 中有无法序列化的对象时退化为 str()
+                return json_codec.dumps({
+                    k: v if isinstance(v, (str, int, float, bool, type(None), dict, list)) else str(v)
+                    for k, v in entry.items()
+                }).decode("utf-8")
+
+        ts = datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        line = f"{ts} {record.levelname:<7} [{record.name}] {message}"
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if exc_text:
+            line += "\n" + exc_text
+        return line
+
+
+def _parse_mapping(raw: Optional[str]) -> Dict[str, str]:
+    """解析 "a=1,b=2" 形式的配置"""
+    result: Dict[str, str] = {}
+    for item in (raw or "").split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            result[key.strip()] = value.strip()
+    return result
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_setup_lock = threading.Lock()
+
+def setup_logging() -> None:
+    """配置根日志器 (幂等)。gunicorn 的每个 worker 导入 app.main 时各自调用一次。"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        sample_rates = {key: float(value) for key, value in _parse_mapping(settings.LOG_SAMPLE_RATES).items()}
+        _queue_handler.addFilter(SamplingFilter(sample_rates))
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(StructuredFormatter(settings.LOG_FORMAT))
+
+        root = logging.getLogger()
+        root.handlers = [_queue_handler]
+        root.setLevel(settings.LOG_LEVEL.upper())
+        for module, level in _parse_mapping(settings.LOG_LEVELS).items():
+            logging.getLogger(module).setLevel(level.upper())
+
+        # uvicorn/gunicorn 自带的 handler 改为向上传递到根日志器，统一走队列
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access", "gunicorn.error"):
+            uv_logger = logging.getLogger(name)
+            uv_logger.handlers = []
+            uv_logger.propagate = True
+
+        _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+def shutdown_logging() -> None:
+    """停止后台线程并刷新队列中剩余的日志"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            if _queue_handler is not None and _queue_handler.dropped:
+                sys.stdout.write(f"[logging] {_queue_handler.dropped} log records dropped because the queue was full\n")
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
@@ -0,0 +1,164 @@
+# app/core/metrics.py
+# Prometheus 指标：HTTP、MQTT、MongoDB、微信API
+#
+# 通过 GET /metrics 暴露 (见 app/main.py)。
+# gunicorn 多 worker 部署时需设置环境变量 PROMETHEUS_MULTIPROC_DIR 指向一个空目录，
+# /metrics 会聚合所有 worker 的数据；未设置时只返回当前 worker 的指标。
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from pymongo import monitoring
+
+# 毫秒级操作为主，桶从1ms到10s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# --- HTTP ---
+HTTP_REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+
+# --- MQTT ---
+MQTT_MESSAGES_RECEIVED = Counter("mqtt_messages_received_total", "Inbound MQTT messages", ["event_type"])
+MQTT_MESSAGES_HANDLED = Counter("mqtt_messages_handled_total", "MQTT messages handled successfully", ["event_type"])
+MQTT_MESSAGES_FAILED = Counter("mqtt_messages_failed_total", "MQTT messages whose decoding or handler failed", ["event_type"])
+MQTT_HANDLER_LATENCY = Histogram(
+    "mqtt_handler_duration_seconds", "MQTT event handler latency", ["event_type"], buckets=LATENCY_BUCKETS,
+)
+# result: ok / buffered (断线或发送失败时暂存，重连后补发) / dropped (缓冲区满被丢弃)
+MQTT_MESSAGES_PUBLISHED = Counter("mqtt_messages_published_total", "Outbound MQTT publishes", ["kind", "result"])
+MQTT_RPC_LATENCY = Histogram(
+    "mqtt_rpc_duration_seconds", "Server-to-device request/response latency", ["action", "outcome"], buckets=LATENCY_BUCKETS,
+)
+DEVICE_OUTBOX_COMMANDS = Counter("device_outbox_commands_total", "Commands stored for or delivered to offline devices", ["outcome"])
+MQTT_CONNECTED = Gauge("mqtt_connected", "1 while connected to the MQTT broker", multiprocess_mode="livesum")
+MQTT_RECONNECTS = Counter("mqtt_reconnects_total", "MQTT reconnect attempts")
+MQTT_MESSAGES_DUPLICATE = Counter("mqtt_messages_duplicate_total", "Redelivered MQTT events skipped by deduplication", ["event_type", "layer"])
+# outcome: recorded / unsaved / resolved / retry_failed / exhausted
+MQTT_DEAD_LETTERS = Counter("mqtt_dead_letters_total", "Failed MQTT events moved through the dead-letter store", ["event_type", "outcome"])
+
+# --- MongoDB ---
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ["collection", "command"], buckets=LATENCY_BUCKETS,
+)
+MONGO_COMMAND_FAILED = Counter("mongo_command_failed_total", "Failed MongoDB commands", ["collection", "command"])
+
+# --- 设备配置同步 ---
+CONFIG_SYNC_RESPONSES = Counter("config_sync_responses_total", "Device config sync responses", ["mode"]) # current / delta / snapshot
+CONFIG_SYNC_BYTES = Counter("config_sync_bytes_total", "Bytes of device config sync payloads", ["mode"])
+DEVICE_CASCADES = Counter("device_cascades_total", "Background cascade deletions after device unbind", ["outcome"]) # completed / failed
+DEVICE_CASCADE_DELETED = Counter("device_cascade_deleted_total", "Documents deleted by device unbind cascades", ["collection"])
+EXPORT_ROWS = Counter("export_rows_total", "Rows written by streaming exports", ["kind", "format"])
+RETENTION_DOCUMENTS = Counter("retention_documents_total", "Expired documents handled by the retention job", ["collection", "outcome"])
+
+# --- 语音合成 ---
+TTS_REQUESTS = Counter("tts_requests_total", "TTS audio lookups", ["cache"])
+TTS_QUEUE_ITEMS = Counter("tts_queue_items_total", "Background TTS queue items", ["outcome"]) # queued / coalesced / done / failed
+TTS_SYNTHESIS_LATENCY = Histogram(
+    "tts_synthesis_duration_seconds", "TTS synthesis latency (cache misses only)", ["engine", "outcome"], buckets=LATENCY_BUCKETS,
+)
+
+# --- 第三方API ---
+WECHAT_API_LATENCY = Histogram(
+    "wechat_api_duration_seconds", "WeChat API call latency", ["api", "outcome"], buckets=LATENCY_BUCKETS,
+)
+
+
+@contextmanager
+def track_wechat_call(api: str):
+    """记录一次微信API调用的耗时，抛出异常时 outcome=error"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        WECHAT_API_LATENCY.labels(api, outcome).observe(time.perf_counter() - start)
+
+
+def topic_kind(topic: str) -> str:
+    """devices/{imei}/action/play_audio -> action/play_audio (去掉IMEI，控制标签基数)"""
+    parts = topic.split("/")
+    if len(parts) > 2 and parts[0] == "devices":
+        return "/".join(parts[2:])
+    return topic
+
+
+class PrometheusMiddleware:
+    """纯ASGI中间件：按路由模板 (而非实际路径) 记录请求延迟"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # FastAPI 匹配成功后会把 APIRoute 放进 scope["route"]；未匹配的路径统一归为 unmatched
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_LATENCY.labels(scope["method"], route_path, str(status_code)).observe(time.perf_counter() - start)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    pymongo 命令监听器，创建 AsyncIOMotorClient 时通过 event_listeners 注册。
+    started 事件里才有集合名，按 (connection_id, request_id) 暂存到 succeeded/failed 事件取出。
+    回调在 motor 的执行线程中同步调用，必须足够轻量。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Tuple[object, int], str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def collection_of(command_name: str, command) -> str:
+        if command_name == "getMore":
+            return str(command.get("collection", "-"))
+        value = command.get(command_name)
+        return value if isinstance(value, str) else "-"
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = self.collection_of(event.command_name, event.command)
+        with self._lock:
+            self._inflight[(event.connection_id, event.request_id)] = collection
+
+    def _pop(self, event) -> str:
+        with self._lock:
+            return self._inflight.pop((event.connection_id, event.request_id), "-")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        collection = self._pop(event)
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self._pop(event)
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILED.labels(collection, event.command_name).inc()
+
+
+def render_latest() -> Tuple[bytes, str]:
+    """返回 (指标文本, Content-Type)；多进程模式下聚合所有 worker"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
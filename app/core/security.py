@@ -1,4 +1,5 @@
 # app/core/security.py
+import logging
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Any, Union # Union 추가
 from passlib.context import CryptContext
@@ -10,6 +11,8 @@ from cryptography.hazmat.backends import default_backend
 from app.core.config import settings
 from app.models.user_models import TokenPayload # TokenPayload用于解码和类型提示
 
+logger = logging.getLogger(__name__)
+
 # 密码哈希上下文
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -38,19 +41,19 @@ def get_public_key_from_private(private_key_pem: str) -> Optional[str]:
             return pem_public_key.decode()
         return None
     except Exception as e:
-        print(f"Error deriving public key from private key: {e}")
+        logger.error("Error deriving public key from private key: %s", e)
         return None
 
 JWT_PRIVATE_KEY = settings.RSA_PRIVATE_KEY
 JWT_PUBLIC_KEY = settings.RSA_PUBLIC_KEY
 
 if settings.ALGORITHM.startswith("RS") and JWT_PRIVATE_KEY and not JWT_PUBLIC_KEY:
-    print("Attempting to derive public key from private key for JWT verification...")
+    logger.info("Attempting to derive public key from private key for JWT verification...")
     JWT_PUBLIC_KEY = get_public_key_from_private(JWT_PRIVATE_KEY)
     if not JWT_PUBLIC_KEY:
         # 生产环境中，如果公钥无法派生，应该是一个严重错误
         # raise ValueError("Failed to derive public key. Ensure RSA_PUBLIC_KEY_PATH is set or the private key is valid.")
-        print("CRITICAL: Failed to derive public key. JWT verification will fail if public key is not explicitly provided.")
+        logger.critical("Failed to derive public key. JWT verification will fail if public key is not explicitly provided.")
 
 
 def create_access_token(subject: Union[str, Any], expires_delta: Optional[timedelta] = None) -> str:
@@ -98,11 +101,11 @@ def decode_token(token: str) -> Optional[TokenPayload]:
         return TokenPayload(**payload_dict) # 将解码后的字典转换为TokenPayload模型
     
     except JWTError as e:
-        print(f"JWT Error: {e}") 
+        logger.info("JWT Error: %s", e)
         return None
     except ValueError as e: 
-        print(f"Token Configuration or Validation Error: {e}")
+        logger.warning("Token Configuration or Validation Error: %s", e)
         return None
     except Exception as e: # 捕获其他可能的错误
-        print(f"An unexpected error occurred during token decoding: {e}")
+        logger.exception("An unexpected error occurred during token decoding: %s", e)
         return None
@@ -0,0 +1,29 @@
+# app/db/bulk_utils.py
+# 批量写入：一次 bulk_write (unordered) 提交多种操作，单条失败不影响其他条目
+from typing import Any, Dict, List, Optional, Set
+
+from pymongo.errors import BulkWriteError
+
+from app.models.common_models import BulkItemResult, PyObjectId
+
+
+async def bulk_write_unordered(collection, requests: List[Any]) -> Dict[int, str]:
+    """执行 bulk_write，返回失败的请求下标 -> 错误信息 (全部成功时为空)"""
+    if not requests:
+        return {}
+    try:
+        await collection.bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        return {error["index"]: error.get("errmsg", "write error") for error in e.details.get("writeErrors", [])}
+    return {}
+
+
+def reject_bulk_target(op: str, index: int, item_id: PyObjectId, original: Optional[Dict[str, Any]],
+                       seen_ids: Set[str]) -> Optional[BulkItemResult]:
+    """修改/删除的目标不存在 (或不属于该设备)、或在同一请求中重复出现时返回对应结果；否则登记并返回 None"""
+    if original is None:
+        return BulkItemResult(op=op, index=index, id=item_id, status="not_found")
+    if str(item_id) in seen_ids:
+        return BulkItemResult(op=op, index=index, id=item_id, status="error", error="Duplicate id in request")
+    seen_ids.add(str(item_id))
+    return None
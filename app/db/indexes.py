@@ -0,0 +1,154 @@
+# app/db/indexes.py
+# 索引定义与迁移
+#
+# INDEX_SPECS 是所有集合索引的唯一来源。ensure_indexes() 对比数据库中已有的索引：
+#   - 缺失的索引才创建 (MongoDB 4.2+ 建索引不会长时间锁集合，可在线执行)
+#   - 键相同、只有 TTL (expireAfterSeconds) 不同的索引通过 collMod 原地修改
+#   - 键相同但其他选项不同 (unique/sparse 等) 的索引只报告冲突，不做修改，需人工处理
+#   - 定义中已不存在的旧索引只报告；显式传入 drop_extra=True 才删除
+# 生产环境通过 `python -m scripts.migrate_indexes` 执行；开发环境启动时自动执行 (MONGO_ENSURE_INDEXES_ON_STARTUP)。
+# 索引名沿用 MongoDB 默认生成的名字 (如 userId_1_time_-1)，与旧版 create_db_indexes 建出的索引一致。
+import logging
+from typing import Any, Dict, List, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+IndexKey = Tuple[Tuple[str, int], ...]
+
+# 到期文档由保留任务归档/删除，TTL 索引只做兜底；延迟固定，不随执行迁移的环境是否配置归档而变
+_RETENTION_TTL_SECONDS = settings.RETENTION_TTL_GRACE_SECONDS
+
+# 集合 -> [(索引键, 选项)]
+# 每个索引后注明依赖它的查询，scripts/check_query_plans.py 会验证这些查询都能命中索引
+INDEX_SPECS: Dict[str, List[Tuple[IndexKey, Dict[str, Any]]]] = {
+    "users": [
+        ((("wxOpenid", ASCENDING),), {"unique": True}), # user_service.get_user_by_openid
+        ((("wxUnionid", ASCENDING),), {"unique": True, "sparse": True}),
+    ],
+    "devices": [
+        ((("deviceId", ASCENDING),), {"unique": True}), # IMEI: get_device_by_imei / update_device_status_by_imei
+        ((("userId", ASCENDING),), {}), # get_devices_for_user
+        ((("cascadeLeaseUntil", ASCENDING),), {"sparse": True}), # device_unbind_service.claim_tombstone (只有墓碑有此字段)
+    ],
+    "contacts": [
+        ((("deviceId", ASCENDING),), {}), # get_contacts_for_device, 解绑时级联删除
+    ],
+    "reminders": [
+        ((("deviceId", ASCENDING),), {}),
+        ((("nextTriggerAt", ASCENDING), ("isEnabled", ASCENDING)), {}), # 组合索引，用于调度查询
+    ],
+    "entertainment_items": [
+        ((("deviceId", ASCENDING),), {}),
+    ],
+    "notifications": [
+        # get_notifications_for_user: 按 userId 过滤、按 time 倒序分页，组合索引避免内存排序 (export_service.find_notifications 正序读取)
+        ((("userId", ASCENDING), ("time", DESCENDING)), {}),
+        # mark_all_notifications_read_for_user: 只扫描未读通知
+        ((("userId", ASCENDING), ("isRead", ASCENDING)), {}),
+        ((("deviceId", ASCENDING),), {}),
+        ((("expireAt", ASCENDING),), {"expireAfterSeconds": _RETENTION_TTL_SECONDS}), # 数据保留，见 retention_service
+    ],
+    "sos_alerts": [
+        # export_service.find_sos_alerts: 按设备过滤、按 timestamp 排序；也覆盖只按 deviceId 的查询 (解绑时级联删除)
+        ((("deviceId", ASCENDING), ("timestamp", ASCENDING)), {}),
+        ((("timestamp", ASCENDING),), {}),
+        ((("expireAt", ASCENDING),), {"expireAfterSeconds": _RETENTION_TTL_SECONDS}),
+        ((("status", ASCENDING), ("expireAt", ASCENDING)), {}), # retention_service.mark_resolved_sos_alerts
+    ],
+    "mqtt_dead_letters": [
+        # dead_letter_service.claim_due_dead_letters: 按状态取到期的记录，按 nextAttemptAt 排序
+        ((("status", ASCENDING), ("nextAttemptAt", ASCENDING)), {}),
+        ((("createdAt", DESCENDING),), {}), # 管理接口列表
+    ],
+    "mqtt_processed_events": [
+        # 事件去重记录 (app/mqtt/idempotency.py)，唯一性由 _id 保证；TTL 控制集合大小
+        ((("createdAt", ASCENDING),), {"expireAfterSeconds": settings.MQTT_DEDUP_TTL_SECONDS}),
+    ],
+    "device_outbox": [
+        # outbox_service.enqueue_command 按 (deviceImei, collapseKey) 合并；claim_pending_commands 按 deviceImei 取
+        ((("deviceImei", ASCENDING), ("collapseKey", ASCENDING)), {"unique": True}),
+        ((("expiresAt", ASCENDING),), {"expireAfterSeconds": 0}), # 到期即删除
+    ],
+    "device_config_changes": [
+        # config_sync_service.get_config_delta: 按设备取某版本之后的变更
+        ((("deviceId", ASCENDING), ("version", ASCENDING)), {"unique": True}),
+        # 过期的变更记录自动删除，手表落后太久时改为全量同步
+        ((("createdAt", ASCENDING),), {"expireAfterSeconds": settings.CONFIG_CHANGELOG_TTL_SECONDS}),
+    ],
+}
+
+# 比较索引是否一致时关心的选项
+_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _options_of(index_info: Dict[str, Any]) -> Dict[str, Any]:
+    # 用 is 比较：expireAfterSeconds=0 是有效的 TTL，不能当作 False 忽略
+    return {key: index_info[key] for key in _COMPARED_OPTIONS if index_info.get(key) is not None and index_info.get(key) is not False}
+
+def _ttl_only_change(index_info: Dict[str, Any], options: Dict[str, Any]) -> bool:
+    # 已有 TTL 索引只改 expireAfterSeconds 时可以 collMod；新增或去掉 TTL 仍需重建索引
+    current, wanted = _options_of(index_info), _options_of(options)
+    if "expireAfterSeconds" not in current or "expireAfterSeconds" not in wanted or current == wanted:
+        return False
+    current.pop("expireAfterSeconds")
+    wanted.pop("expireAfterSeconds")
+    return current == wanted
+
+def _key_of(index_info: Dict[str, Any]) -> IndexKey:
+    return tuple((field, int(direction)) for field, direction in index_info["key"].items())
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase, dry_run: bool = False, drop_extra: bool = False) -> List[Dict[str, Any]]:
+    """
+    按 INDEX_SPECS 同步索引，返回执行 (或 dry_run 时将要执行) 的操作列表：
+    {"collection", "action": create|modify|drop|extra|conflict|ok, "key", "options"}
+    """
+    actions: List[Dict[str, Any]] = []
+    for collection_name, specs in INDEX_SPECS.items():
+        collection = db[collection_name]
+        existing: Dict[IndexKey, Dict[str, Any]] = {}
+        async for index_info in collection.list_indexes():
+            existing[_key_of(index_info)] = index_info
+
+        for key, options in specs:
+            current = existing.pop(key, None)
+            if current is None:
+                actions.append({"collection": collection_name, "action": "create", "key": key, "options": options})
+                if not dry_run:
+                    await collection.create_index(list(key), **options)
+            elif _ttl_only_change(current, options):
+                actions.append({
+                    "collection": collection_name, "action": "modify", "key": key, "options": options,
+                    "existing": {"name": current["name"], **_options_of(current)},
+                })
+                if not dry_run:
+                    await db.command({
+                        "collMod": collection_name,
+                        "index": {"name": current["name"], "expireAfterSeconds": options["expireAfterSeconds"]},
+                    })
+            elif _options_of(current) != _options_of(options):
+                actions.append({
+                    "collection": collection_name, "action": "conflict", "key": key, "options": options,
+                    "existing": {"name": current["name"], **_options_of(current)},
+                })
+            else:
+                actions.append({"collection": collection_name, "action": "ok", "key": key, "options": options})
+
+        for key, index_info in existing.items():
+            if index_info["name"] == "_id_":
+                continue
+            actions.append({"collection": collection_name, "action": "drop" if drop_extra else "extra", "key": key, "options": _options_of(index_info)})
+            if drop_extra and not dry_run:
+                await collection.drop_index(index_info["name"])
+
+    for action in actions:
+        if action["action"] == "conflict":
+            logger.warning("Index option conflict, left unchanged", extra=action)
+        elif action["action"] != "ok":
+            logger.info("Index %s%s", action["action"], " (dry run)" if dry_run else "", extra=action)
+    return actions
@@ -1,6 +1,13 @@
 # app/db/mongodb_utils.py
+import logging
+
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from app.core.config import settings # 确保路径正确
+from app.core.metrics import MongoCommandMetrics
+from app.db.indexes import ensure_indexes
+from app.db.query_profiler import query_profiler
+
+logger = logging.getLogger(__name__)
 
 class MongoDB:
     client: AsyncIOMotorClient = None
@@ -9,24 +16,29 @@ class MongoDB:
 db_manager = MongoDB()
 
 async def connect_to_mongo():
-    print(f"Connecting to MongoDB at {settings.MONGO_URI}...")
+    # 只输出主机部分，避免把连接串中的账号密码写进日志
+    logger.info("Connecting to MongoDB at %s...", str(settings.MONGO_URI).split("@")[-1])
     try:
-        db_manager.client = AsyncIOMotorClient(str(settings.MONGO_URI)) # 确保 MONGO_URI 是字符串
+        db_manager.client = AsyncIOMotorClient(
+            str(settings.MONGO_URI), # 确保 MONGO_URI 是字符串
+            # 按集合/命令记录延迟 (app/core/metrics.py)；按查询形态分析 (app/db/query_profiler.py)
+            event_listeners=[MongoCommandMetrics(), query_profiler]
+        )
         db_manager.db = db_manager.client[str(settings.MONGO_DB_NAME)] # 确保 MONGO_DB_NAME 是字符串
         # 尝试ping一下服务器，确认连接成功
         await db_manager.client.admin.command('ping')
-        print("Successfully connected to MongoDB!")
+        logger.info("Successfully connected to MongoDB!")
     except Exception as e:
-        print(f"Failed to connect to MongoDB: {e}")
+        logger.error("Failed to connect to MongoDB: %s", e)
         # 在实际应用中，这里可能需要更健壮的错误处理或重试机制
         # 或者在应用启动时如果连接失败则直接退出
         raise  # 重新抛出异常，让FastAPI知道启动失败
 
 async def close_mongo_connection():
     if db_manager.client:
-        print("Closing MongoDB connection...")
+        logger.info("Closing MongoDB connection...")
         db_manager.client.close()
-        print("MongoDB connection closed.")
+        logger.info("MongoDB connection closed.")
 
 def get_database() -> AsyncIOMotorDatabase:
     if db_manager.db is None:
@@ -55,45 +67,24 @@ def get_notification_collection():
 def get_sos_alert_collection():
     return get_database()["sos_alerts"]
 
-# 可以在应用启动时创建索引 (可选，但推荐)
+def get_dead_letter_collection():
+    return get_database()["mqtt_dead_letters"]
+
+def get_processed_event_collection():
+    return get_database()["mqtt_processed_events"]
+
+def get_outbox_collection():
+    return get_database()["device_outbox"]
+
+def get_config_change_collection():
+    return get_database()["device_config_changes"]
+
+# 索引定义与迁移逻辑见 app/db/indexes.py；生产环境使用 `python -m scripts.migrate_indexes`
 async def create_db_indexes():
-    print("Attempting to create database indexes...")
-    db = get_database()
+    logger.info("Ensuring database indexes...")
     try:
-        # User Collection
-        await db["users"].create_index("wxOpenid", unique=True)
-        await db["users"].create_index("wxUnionid", unique=True, sparse=True)
-        print("Indexes for 'users' collection ensured.")
-
-        # Device Collection
-        await db["devices"].create_index("deviceId", unique=True) # IMEI
-        await db["devices"].create_index("userId")
-        print("Indexes for 'devices' collection ensured.")
-
-        # Contacts Collection
-        await db["contacts"].create_index("deviceId")
-        print("Indexes for 'contacts' collection ensured.")
-
-        # Reminders Collection
-        await db["reminders"].create_index("deviceId")
-        await db["reminders"].create_index([("nextTriggerAt", 1), ("isEnabled", 1)]) # 组合索引，用于调度查询
-        print("Indexes for 'reminders' collection ensured.")
-
-        # Entertainment Items Collection
-        await db["entertainment_items"].create_index("deviceId")
-        print("Indexes for 'entertainment_items' collection ensured.")
-
-        # Notifications Collection
-        await db["notifications"].create_index("userId")
-        await db["notifications"].create_index("deviceId")
-        await db["notifications"].create_index([("time", -1), ("isRead", 1)]) # 按时间降序，未读优先
-        print("Indexes for 'notifications' collection ensured.")
-
-        # SOS Alerts Collection
-        await db["sos_alerts"].create_index("deviceId")
-        await db["sos_alerts"].create_index("timestamp")
-        print("Indexes for 'sos_alerts' collection ensured.")
-
-        print("Database indexes creation process completed.")
+        actions = await ensure_indexes(get_database())
+        created = sum(1 for action in actions if action["action"] == "create")
+        logger.info("Database indexes ensured (%d created).", created)
     except Exception as e:
-        print(f"Error creating database indexes: {e}")
+        logger.error("Error creating database indexes: %s", e)
@@ -0,0 +1,289 @@
+# app/db/query_profiler.py
+# MongoDB 查询形态 (query shape) 分析器
+#
+# 与 app/core/metrics.py 中按 集合/命令 聚合的 Prometheus 指标不同，这里按“查询形态”聚合：
+# 过滤条件/排序中的具体值被替换为 "?"，只保留字段名和操作符，
+# 例如 {"_id": "665f...", "userId": "6660..."} -> {"_id": "?", "userId": "?"}。
+# 每个形态记录次数、总耗时、p99、返回文档数，以及由哪些服务函数发起 (见 @profiled)。
+#
+# - 运行时开关：MONGO_PROFILER_ENABLED 设置初始状态，之后可通过 /admin/query-profile 开关/清空
+# - 慢操作日志：开启时耗时超过 MONGO_SLOW_MS 的命令记一条 WARNING
+# - docsExamined / keysExamined 只有服务端知道：导出时可选择读取 system.profile
+#   (需先通过管理接口把服务端 profiling level 设为1)，按同样的规则归一化后合并到对应形态
+# gunicorn 多 worker 下每个 worker 各自统计，管理接口只操作处理该请求的 worker。
+import contextvars
+import functools
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from app.core import json_codec
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 当前正在执行的服务函数 (由 @profiled 设置)。motor 在线程池中执行命令时会复制 contextvars，监听器回调里可以直接读取
+_current_source: contextvars.ContextVar[str] = contextvars.ContextVar("query_source", default="-")
+
+# 每个形态保留的最近耗时样本数，用于计算 p99
+LATENCY_SAMPLES = 1024
+# 未读完就被丢弃的游标不会再出现，映射表超过该大小时清空
+MAX_TRACKED_CURSORS = 10000
+
+# 这些操作符的值是数组，数组元素个数不影响查询形态
+_ARRAY_OPERATORS = frozenset({"$in", "$nin", "$all"})
+
+# 命令名 -> 该命令中过滤条件所在的字段
+_FILTER_FIELDS = {
+    "find": "filter", "count": "query", "distinct": "query", "findAndModify": "query",
+}
+
+
+def profiled(func):
+    """标记服务函数：其中发起的所有 MongoDB 命令归属到该函数 (嵌套调用归属到最内层)"""
+    source = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _current_source.set(source)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _current_source.reset(token)
+    return wrapper
+
+
+def _shape_value(value: Any) -> Any:
+    """把查询条件中的具体值替换为 "?"，保留字段名与操作符结构"""
+    if isinstance(value, dict):
+        return {key: _shape_operand(key, item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shape_value(item) for item in value]
+    return "?"
+
+def _shape_operand(key: str, value: Any) -> Any:
+    if key in _ARRAY_OPERATORS:
+        return ["?"]
+    if isinstance(value, (list, tuple)) and key not in ("$and", "$or", "$nor"):
+        return "?"
+    return _shape_value(value)
+
+
+def normalize_command(command_name: str, command: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    把一条命令归一化为 (集合名, 形态描述)。
+    形态描述是可读字符串，例如: find {"deviceId":"?"} sort={"time":-1}
+    """
+    collection = command.get(command_name)
+    collection = collection if isinstance(collection, str) else str(command.get("collection", "-"))
+
+    parts = [command_name]
+    if command_name in _FILTER_FIELDS:
+        parts.append(_dumps(_shape_value(command.get(_FILTER_FIELDS[command_name]) or {})))
+        if command_name == "distinct":
+            parts.append(f"key={command.get('key')}")
+    elif command_name in ("update", "delete"):
+        # 批量写只取第一条语句的形态 (本项目中都是单条)
+        statements = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        parts.append(_dumps(_shape_value(statements[0].get("q") or {})))
+        if command_name == "update":
+            update_doc = statements[0].get("u")
+            if isinstance(update_doc, dict):
+                parts.append("u=" + _dumps(sorted(update_doc)))
+    elif command_name == "aggregate":
+        parts.append(_dumps([
+            {name: _shape_value(body) if name == "$match" else "..." for name, body in stage.items()}
+            for stage in command.get("pipeline") or []
+        ]))
+    sort = command.get("sort")
+    if sort:
+        parts.append("sort=" + _dumps(dict(sort)))
+    return collection, " ".join(parts)
+
+def _dumps(value: Any) -> str:
+    return json_codec.dumps(value).decode("utf-8")
+
+
+def _docs_returned(command_name: str, reply: Dict[str, Any]) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+class ShapeStats:
+    __slots__ = ("collection", "shape", "count", "failed", "total_ms", "max_ms", "docs_returned", "sources", "samples")
+
+    def __init__(self, collection: str, shape: str):
+        self.collection = collection
+        self.shape = shape
+        self.count = 0
+        self.failed = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.docs_returned = 0
+        self.sources: Dict[str, int] = {}
+        self.samples: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, source: str, duration_ms: float, docs_returned: int, failed: bool) -> None:
+        self.count += 1
+        self.failed += failed
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.docs_returned += docs_returned
+        self.sources[source] = self.sources.get(source, 0) + 1
+        self.samples.append(duration_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] if ordered else 0.0
+        return {
+            "collection": self.collection,
+            "shape": self.shape,
+            "count": self.count,
+            "failed": self.failed,
+            "totalMs": round(self.total_ms, 3),
+            "avgMs": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p99Ms": round(p99, 3),
+            "maxMs": round(self.max_ms, 3),
+            "docsReturned": self.docs_returned,
+            "sources": dict(sorted(self.sources.items(), key=lambda item: -item[1])),
+        }
+
+
+class QueryProfiler(monitoring.CommandListener):
+    """
+    pymongo 命令监听器，与 MongoCommandMetrics 一起在创建 AsyncIOMotorClient 时注册。
+    关闭时每个回调只做一次布尔判断。
+    """
+
+    def __init__(self, enabled: bool = False, slow_ms: float = 100.0):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        # (connection_id, request_id) -> ((集合, 形态, 来源), getMore 的游标ID)
+        self._inflight: Dict[Tuple[object, int], Tuple[Tuple[str, str, str], Optional[int]]] = {}
+        self._stats: Dict[Tuple[str, str], ShapeStats] = {}
+        # getMore 没有过滤条件，按游标ID归属到发起该游标的 find/aggregate 形态
+        self._cursor_shapes: Dict[int, Tuple[str, str, str]] = {}
+
+    def configure(self, enabled: Optional[bool] = None, slow_ms: Optional[float] = None, reset: bool = False) -> None:
+        if enabled is not None:
+            self.enabled = enabled
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if reset:
+            self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._cursor_shapes.clear()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if not self.enabled:
+            return
+        cursor_id = event.command.get("getMore") if event.command_name == "getMore" else None
+        key = self._cursor_shapes.get(cursor_id) if cursor_id else None
+        if key is None:
+            collection, shape = normalize_command(event.command_name, event.command)
+            key = (collection, shape, _current_source.get())
+        with self._lock:
+            self._inflight[(event.connection_id, event.request_id)] = (key, cursor_id)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, _docs_returned(event.command_name, event.reply), failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, 0, failed=True)
+
+    def _finish(self, event, docs_returned: int, failed: bool) -> None:
+        if not self._inflight:
+            return
+        with self._lock:
+            inflight = self._inflight.pop((event.connection_id, event.request_id), None)
+            if inflight is None:
+                return
+            key, getmore_cursor_id = inflight
+            collection, shape, source = key
+            duration_ms = event.duration_micros / 1000
+            stats = self._stats.get((collection, shape))
+            if stats is None:
+                stats = self._stats[(collection, shape)] = ShapeStats(collection, shape)
+            stats.record(source, duration_ms, docs_returned, failed)
+
+            if getmore_cursor_id is not None:
+                # 游标ID为0表示结果已读完
+                if failed or not (event.reply.get("cursor") or {}).get("id"):
+                    self._cursor_shapes.pop(getmore_cursor_id, None)
+            elif not failed and event.command_name in ("find", "aggregate"):
+                cursor_id = (event.reply.get("cursor") or {}).get("id")
+                if cursor_id:
+                    if len(self._cursor_shapes) >= MAX_TRACKED_CURSORS:
+                        self._cursor_shapes.clear()
+                    self._cursor_shapes[cursor_id] = key
+
+        if duration_ms >= self.slow_ms:
+            logger.warning(
+                "Slow MongoDB operation: %s.%s took %.1f ms", collection, event.command_name, duration_ms,
+                extra={"shape": shape, "source": source, "duration_ms": round(duration_ms, 3), "docs_returned": docs_returned},
+            )
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """按总耗时降序导出所有形态的统计"""
+        with self._lock:
+            rows = [stats.to_dict() for stats in self._stats.values()]
+        rows.sort(key=lambda row: -row["totalMs"])
+        return rows
+
+
+def _profile_entry_command(entry: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """system.profile 文档 -> (命令名, 命令)；getMore 取发起游标的原始命令"""
+    command = entry.get("originatingCommand") if entry.get("op") == "getmore" else entry.get("command")
+    if not isinstance(command, dict) or not command:
+        return None
+    return next(iter(command)), command
+
+async def server_profile_summary(db, limit: int = 5000) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """读取 system.profile 最近的记录，按查询形态汇总 docsExamined / keysExamined / planSummary"""
+    summary: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    cursor = db["system.profile"].find({}, sort=[("$natural", -1)], limit=limit)
+    async for entry in cursor:
+        parsed = _profile_entry_command(entry)
+        if parsed is None:
+            continue
+        key = normalize_command(*parsed)
+        item = summary.setdefault(key, {"serverSamples": 0, "docsExamined": 0, "keysExamined": 0, "nreturned": 0, "planSummary": set()})
+        item["serverSamples"] += 1
+        item["docsExamined"] += entry.get("docsExamined", 0)
+        item["keysExamined"] += entry.get("keysExamined", 0)
+        item["nreturned"] += entry.get("nreturned", 0)
+        if entry.get("planSummary"):
+            item["planSummary"].add(entry["planSummary"])
+    for item in summary.values():
+        item["planSummary"] = sorted(item["planSummary"])
+    return summary
+
+
+async def dump(db=None, include_server: bool = False) -> Dict[str, Any]:
+    """管理接口使用：客户端统计 + (可选) 服务端 system.profile 汇总"""
+    rows = query_profiler.snapshot()
+    if include_server and db is not None:
+        server = await server_profile_summary(db)
+        for row in rows:
+            row.update(server.get((row["collection"], row["shape"]), {}))
+    return {
+        "enabled": query_profiler.enabled,
+        "slowMs": query_profiler.slow_ms,
+        "shapes": rows,
+    }
+
+
+# 单例，由 app/db/mongodb_utils.py 注册到 Motor 客户端
+query_profiler = QueryProfiler(enabled=settings.MONGO_PROFILER_ENABLED, slow_ms=settings.MONGO_SLOW_MS)
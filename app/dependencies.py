@@ -1,10 +1,14 @@
 # app/dependencies.py
-from fastapi import Depends, HTTPException, status
+import hmac
+
+from fastapi import Depends, Header, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer # 用于从请求头获取token
-from typing import Optional
+from pydantic import BaseModel
+from typing import FrozenSet, Optional, Type
 
 from app.core.config import settings
 from app.core import security # 导入我们自己的security模块
+from app.models.common_models import parse_fields
 from app.models.user_models import UserInDB, TokenPayload, UserPublic
 from app.services import user_service # 稍后会创建 user_service
 
@@ -62,3 +66,25 @@ async def get_current_user_id(payload: TokenPayload = Depends(get_current_user_p
     if not payload.sub:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid token subject for ID")
     return str(payload.sub) # PyObjectId to str
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """管理接口鉴权：请求头 X-Admin-Token 必须与 ADMIN_API_TOKEN 一致"""
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_API_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+
+def sparse_fields(model: Type[BaseModel]):
+    """列表接口的 fields= 查询参数 (如 fields=name,battery,isOnline)：返回选中的字段集合，未传时为 None (返回完整模型)"""
+    async def dependency(
+        fields: Optional[str] = Query(None, description=f"只返回这些字段 (逗号分隔，id 总是返回)，可选: {', '.join(model.model_fields)}")
+    ) -> Optional[FrozenSet[str]]:
+        if not fields:
+            return None
+        try:
+            return parse_fields(model, fields)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return dependency
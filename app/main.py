@@ -1,49 +1,78 @@
 # app/main.py
-from fastapi import FastAPI
+import asyncio
+import logging
+
+from fastapi import FastAPI, Response
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware # 引入CORS中间件
 
 from app.core.config import settings
+from app.core.json_codec import FastJSONResponse
+from app.core.metrics import PrometheusMiddleware, render_latest
+from app.core.logging_config import setup_logging, shutdown_logging
 from app.db.mongodb_utils import connect_to_mongo, close_mongo_connection, create_db_indexes # 引入创建索引函数
-from app.routers import auth_router, device_router, notification_router # 引入我们的路由模块
+from app.routers import admin_router, auth_router, device_router, notification_router, tts_router # 引入我们的路由模块
+from app.services import device_unbind_service, retention_service, tts_service
 from app.mqtt import mqtt_client # 引入MQTT客户端模块 (即使mqtt_client.py暂时为空)
 
+# 尽早配置日志：之后所有模块的日志都经由队列异步输出
+setup_logging()
+logger = logging.getLogger(__name__)
+
 # 使用 lifespan 管理应用生命周期事件
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    print("FastAPI application startup...")
+    logger.info("FastAPI application startup...")
     await connect_to_mongo()
-    if settings.DEBUG: # 开发模式下可以尝试创建索引，生产环境通常手动或迁移工具管理
+    if settings.MONGO_ENSURE_INDEXES_ON_STARTUP: # 默认仅开发环境；生产环境使用 scripts/migrate_indexes.py
         await create_db_indexes()
     
     # 启动MQTT客户端 (确保mqtt_client.py中有相应的启动函数)
     # 这个函数需要设计成非阻塞的，或者在后台线程运行
     try:
         await mqtt_client.start_mqtt_client() # 假设mqtt_client.py中有这个异步函数
-        print("MQTT client started successfully.")
+        logger.info("MQTT client started successfully.")
     except Exception as e:
-        print(f"Failed to start MQTT client: {e}")
+        logger.error("Failed to start MQTT client: %s", e)
         # 根据需求决定是否因为MQTT启动失败而阻止应用启动
         # raise # 如果MQTT是核心，则应该抛出异常
 
+    # 报时语音在后台预先合成，不阻塞启动；未就绪时设备收到纯文本回复
+    pregenerate_task = None
+    if settings.TTS_PREGENERATE_ON_STARTUP:
+        pregenerate_task = asyncio.create_task(tts_service.pregenerate_time_announcements())
+    # 继续执行之前未完成的设备解绑级联删除
+    cascade_sweep_task = asyncio.create_task(device_unbind_service.sweep_loop())
+    # 数据保留/归档任务只在一个实例上开启，也可改用 scripts/run_retention.py 定时执行
+    retention_task = asyncio.create_task(retention_service.retention_loop()) if settings.RETENTION_JOB_ENABLED else None
+
     yield
     # Shutdown
-    print("FastAPI application shutdown...")
+    logger.info("FastAPI application shutdown...")
+    if pregenerate_task and not pregenerate_task.done():
+        pregenerate_task.cancel()
+    cascade_sweep_task.cancel()
+    if retention_task:
+        retention_task.cancel()
+    await device_unbind_service.stop()
+    tts_service.tts_queue.stop()
     try:
         await mqtt_client.stop_mqtt_client() # 假设mqtt_client.py中有这个异步函数
-        print("MQTT client stopped.")
+        logger.info("MQTT client stopped.")
     except Exception as e:
-        print(f"Error stopping MQTT client: {e}")
+        logger.error("Error stopping MQTT client: %s", e)
     
     await close_mongo_connection()
-    print("FastAPI application shutdown complete.")
+    logger.info("FastAPI application shutdown complete.")
+    shutdown_logging() # 刷新队列中剩余的日志
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.PROJECT_VERSION,
     debug=settings.DEBUG,
     lifespan=lifespan,
+    default_response_class=FastJSONResponse, # orjson渲染响应 (未安装时回退到标准库json)
     openapi_url=f"{settings.API_V1_STR}/openapi.json" # API文档路径
 )
 
@@ -57,6 +86,9 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"], # 允许所有头部
     )
 
+# 记录每个路由的请求延迟 (/metrics 暴露)
+app.add_middleware(PrometheusMiddleware)
+
 # 根路径 (测试用)
 @app.get("/", summary="Root Endpoint")
 async def read_root():
@@ -66,9 +98,17 @@ async def read_root():
 app.include_router(auth_router.router, prefix=f"{settings.API_V1_STR}/auth", tags=["Authentication"])
 app.include_router(device_router.router, prefix=f"{settings.API_V1_STR}/devices", tags=["Devices & Management"])
 app.include_router(notification_router.router, prefix=f"{settings.API_V1_STR}/notifications", tags=["Notifications"])
+app.include_router(admin_router.router, prefix=f"{settings.API_V1_STR}/admin", tags=["Admin"])
+app.include_router(tts_router.router, prefix=f"{settings.API_V1_STR}/tts", tags=["TTS"])
 
 # 如果你有其他顶层路由，例如一个健康检查端点
 @app.get("/health", summary="Health Check")
 async def health_check():
-    # 可以在这里添加更复杂的健康检查，如数据库连接、MQTT连接等
-    return {"status": "healthy"}
+    # MQTT 断开时 HTTP 接口仍可用，返回 degraded 而不是失败，避免负载均衡摘除实例
+    mqtt_state = mqtt_client.mqtt_client.connection_state()
+    return {"status": "healthy" if mqtt_state["state"] == "connected" else "degraded", "mqtt": mqtt_state}
+
+@app.get("/metrics", summary="Prometheus Metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
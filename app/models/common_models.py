@@ -1,49 +1,103 @@
 # app/models/common_models.py
-from pydantic import BaseModel, Field
+from pydantic import (
+    BaseModel, ConfigDict, Field, GetCoreSchemaHandler, GetJsonSchemaHandler, TypeAdapter, create_model, field_serializer
+)
+from pydantic.json_schema import JsonSchemaValue
+from pydantic_core import core_schema
 from datetime import datetime
+from functools import lru_cache
+from typing import Any, FrozenSet, List, Optional, Type
 import uuid
 from bson import ObjectId
 
 class PyObjectId(str):
+    """
+    兼容 UUID 字符串和 ObjectId 的ID类型。
+    通过 Pydantic v2 的 core schema 实现，校验结果统一为 str，序列化时直接输出字符串。
+    """
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type: Any, handler: GetCoreSchemaHandler) -> core_schema.CoreSchema:
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(str, when_used="json-unless-none"),
+        )
+
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_json_schema__(cls, schema: core_schema.CoreSchema, handler: GetJsonSchemaHandler) -> JsonSchemaValue:
+        return handler(core_schema.str_schema())
 
     @classmethod
-    def validate(cls, v, field_info):
+    def validate(cls, v: Any) -> str:
         # 允许已经是ObjectId或UUID实例的情况
         if isinstance(v, ObjectId):
             return str(v)
         if isinstance(v, uuid.UUID):
             return str(v)
-        
+
         # 主要处理字符串输入
         if isinstance(v, str):
-            # 尝试将其验证为UUID字符串
+            # 24位十六进制是ObjectId，其余尝试按UUID解析 (先做廉价的长度判断，避免无谓的异常)
+            if len(v) == 24 and ObjectId.is_valid(v):
+                return v
             try:
                 uuid.UUID(v)
                 return v # 如果是有效的UUID字符串，直接返回
             except ValueError:
-                # 如果不是UUID，再尝试是否是有效的ObjectId字符串
-                try:
-                    ObjectId(v)
-                    return v
-                except Exception:
-                     raise TypeError(f"'{v}' is not a valid UUID or ObjectId string")
-        raise TypeError(f"Value must be a string, ObjectId or UUID, got {type(v)}")
+                raise ValueError(f"'{v}' is not a valid UUID or ObjectId string")
+        raise ValueError(f"Value must be a string, ObjectId or UUID, got {type(v)}")
 
 
 class BaseDBModel(BaseModel):
+    model_config = ConfigDict(
+        populate_by_name=True, # 允许使用alias _id
+        from_attributes=True,  # 允许从ORM对象属性创建模型 (虽然我们是NoSQL)
+    )
+
     id: PyObjectId = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
 
-    class Config:
-        populate_by_name = True # 允许使用alias _id
-        from_attributes = True  # Pydantic v2: 允许从ORM对象属性创建模型 (虽然我们是NoSQL)
-        json_encoders = { # Pydantic v1, v2中可以用 model_serializer_json
-            datetime: lambda dt: dt.isoformat(),
-            ObjectId: str, # 确保ObjectId能正确序列化为字符串
-            # PyObjectId: str # PyObjectId本身就是str
-        }
-        # Pydantic v2 推荐使用 @model_serializer 或 @field_serializer 进行更细致的序列化控制
+    @classmethod
+    def construct_from(cls, source: BaseModel, **overrides: Any):
+        """
+        受信数据的快速路径：source 已经过校验 (如 XxxInDB -> XxxPublic)，
+        直接 model_construct，跳过二次校验和中间的 model_dump。
+        仅用于字段类型一致的模型之间的转换，外部输入仍需走 model_validate。
+        (v2 中字段值保存在实例的 __dict__ 里，直接展开比 dict(source) 的逐字段迭代快一倍以上)
+        """
+        return cls.model_construct(**{**source.__dict__, **overrides})
+
+    @field_serializer("createdAt", "updatedAt", when_used="json")
+    def _serialize_timestamps(self, dt: datetime) -> str:
+        # 与旧版 json_encoders 保持一致，输出 isoformat (带时区时为 +00:00 而非 Z)
+        return dt.isoformat()
+
+
+class BulkItemResult(BaseModel):
+    """批量接口中单个条目的处理结果"""
+    op: str # create / update / delete
+    index: int # 在请求对应数组中的下标
+    id: Optional[PyObjectId] = None
+    status: str # created / updated / deleted / not_found / error
+    error: Optional[str] = None
+
+
+# --- 稀疏字段集 (列表接口的 fields= 参数) ---
+def parse_fields(model: Type[BaseModel], raw: str) -> FrozenSet[str]:
+    """解析逗号分隔的字段名 (id 总是包含)；有模型中不存在的字段时抛出 ValueError"""
+    fields = frozenset(name.strip() for name in raw.split(",") if name.strip()) | {"id"}
+    unknown = fields - model.model_fields.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(sorted(model.model_fields))}")
+    return fields
+
+@lru_cache(maxsize=128)
+def sparse_list_adapter(model: Type[BaseModel], fields: FrozenSet[str]) -> TypeAdapter:
+    """
+    只包含 fields 的 List[模型] 校验/序列化器，按 (模型, 字段集) 缓存。
+    字段定义 (类型、别名、默认值) 沿用原模型，序列化结果与完整模型的对应字段一致。
+    """
+    definitions = {name: (info.annotation, info) for name, info in model.model_fields.items() if name in fields}
+    partial = create_model(f"{model.__name__}Fields", __config__=ConfigDict(populate_by_name=True), **definitions)
+    return TypeAdapter(List[partial])
@@ -1,6 +1,6 @@
 # app/models/contact_models.py
-from typing import Optional
-from pydantic import BaseModel, Field
+from typing import List, Optional
+from pydantic import BaseModel, Field, TypeAdapter
 from app.models.common_models import BaseDBModel, PyObjectId
 
 class ContactBase(BaseModel):
@@ -28,4 +28,9 @@ class ContactPublic(BaseDBModel, ContactBase):
     id: PyObjectId
     deviceId: PyObjectId
     isSosForDisplay: bool = Field(default=False, description="此联系人是否为当前设备的SOS号码 (后端填充)") # 新增
+    nameAudioUrl: Optional[str] = Field(default=None, description="按设备方言合成的称呼语音，尚未合成时为空 (后端填充)")
     pass
+
+# --- 模块级缓存的 TypeAdapter ---
+CONTACT_IN_DB_LIST_ADAPTER = TypeAdapter(List[ContactInDB])
+CONTACT_PUBLIC_LIST_ADAPTER = TypeAdapter(List[ContactPublic])
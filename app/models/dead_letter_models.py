@@ -0,0 +1,27 @@
+# app/models/dead_letter_models.py
+from typing import Optional, Any, List
+from pydantic import BaseModel, Field, TypeAdapter
+from datetime import datetime
+from app.models.common_models import BaseDBModel, PyObjectId
+
+# 处理失败的 MQTT 设备事件 (死信)，由后台任务按指数退避重试
+class DeadLetterBase(BaseModel):
+    eventType: str # 'status', 'sos_alert', 'request_bill_help' 等，对应 AsyncMQTTClient 的处理函数
+    deviceImei: str
+    payload: Any = Field(default_factory=dict) # 解码后的原始payload (不一定是对象，也可能是数组/字符串等)
+    errorType: str
+    error: str
+    status: str = Field(default="pending", description="pending, retrying, resolved, exhausted")
+    attempts: int = 0 # 已执行的重试次数 (不含首次处理)
+    nextAttemptAt: Optional[datetime] = None
+    lastAttemptAt: Optional[datetime] = None
+    resolvedAt: Optional[datetime] = None
+
+class DeadLetterInDB(BaseDBModel, DeadLetterBase):
+    pass
+
+class DeadLetterPublic(BaseDBModel, DeadLetterBase):
+    id: PyObjectId
+
+# --- 模块级缓存的 TypeAdapter ---
+DEAD_LETTER_IN_DB_LIST_ADAPTER = TypeAdapter(List[DeadLetterInDB])
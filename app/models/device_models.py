@@ -1,7 +1,10 @@
 # app/models/device_models.py
 from typing import List, Optional, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from app.models.common_models import BaseDBModel, PyObjectId
+from app.models.contact_models import ContactPublic
+from app.models.entertainment_models import EntertainmentItemPublic
+from app.models.reminder_models import ReminderPublic
 from datetime import datetime
 
 class DeviceLocation(BaseModel):
@@ -22,6 +25,9 @@ class DeviceBase(BaseModel):
     sosSmsTemplate: str = Field(default="【安心通】设备[{deviceName}]发起了紧急呼叫！位置：{location}")
     autoBillRequestEnabled: bool = Field(default=True)
     billReminderContacts: List[str] = Field(default_factory=list, description="接收话费不足通知的子女手机号列表")
+    pendingCommands: int = Field(default=0, description="离线期间待下发的指令数 (见 outbox_service)")
+    configVersion: int = Field(default=0, description="通讯录/提醒/娱乐内容的配置版本，每次变更加1 (见 config_sync_service)")
+    dialect: str = Field(default="mandarin", description="老人使用的方言，决定联系人称呼语音的发音人 (见 tts_service.DIALECT_VOICES)")
 
 class DeviceCreateData(DeviceBase): # 用于创建设备时，不包含userId和deviceId (IMEI)
     pass
@@ -37,6 +43,7 @@ class DeviceUpdate(BaseModel): # 用于更新设备信息
     sosSmsTemplate: Optional[str] = None
     autoBillRequestEnabled: Optional[bool] = None
     billReminderContacts: Optional[List[str]] = None
+    dialect: Optional[str] = None
     # isOnline, battery, signal, firmwareVersion, lastLocation 由设备MQTT上报更新，不由API直接修改
 
 class DeviceInDB(BaseDBModel, DeviceCreate): # 存储在DB中的完整模型
@@ -55,3 +62,14 @@ class DeviceStatusUpdate(BaseModel):
     signal: Optional[int] = Field(None, ge=0, le=5)
     firmwareVersion: Optional[str] = None
     lastLocation: Optional[DeviceLocation] = None
+
+# 设备页一次性需要的全部数据 (GET /devices/{id}/snapshot)
+class DeviceSnapshot(BaseModel):
+    device: DevicePublic
+    contacts: List[ContactPublic]
+    reminders: List[ReminderPublic]
+    entertainment: List[EntertainmentItemPublic]
+
+# --- 模块级缓存的 TypeAdapter (构建一次，整批校验数据库文档列表) ---
+DEVICE_IN_DB_LIST_ADAPTER = TypeAdapter(List[DeviceInDB])
+DEVICE_PUBLIC_LIST_ADAPTER = TypeAdapter(List[DevicePublic])
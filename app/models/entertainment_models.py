@@ -1,6 +1,6 @@
 # app/models/entertainment_models.py
-from typing import Optional
-from pydantic import BaseModel, Field, HttpUrl
+from typing import List, Optional
+from pydantic import BaseModel, Field, HttpUrl, TypeAdapter
 from app.models.common_models import BaseDBModel, PyObjectId
 
 class EntertainmentItemBase(BaseModel):
@@ -23,3 +23,6 @@ class EntertainmentItemPublic(BaseDBModel, EntertainmentItemBase):
     id: PyObjectId
     deviceId: PyObjectId
     pass
+
+# --- 模块级缓存的 TypeAdapter ---
+ENTERTAINMENT_ITEM_IN_DB_LIST_ADAPTER = TypeAdapter(List[EntertainmentItemInDB])
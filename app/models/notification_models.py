@@ -1,6 +1,6 @@
 # app/models/notification_models.py
-from typing import Optional, Dict, Any, Union
-from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any, Union, List
+from pydantic import BaseModel, Field, TypeAdapter
 from datetime import datetime
 from app.models.common_models import BaseDBModel, PyObjectId
 from app.models.device_models import DeviceLocation # 导入DeviceLocation
@@ -63,3 +63,7 @@ class SosAlertPublic(BaseDBModel, SosAlertBase):
     id: PyObjectId
     deviceName: Optional[str] = None # 后端填充
     pass
+
+# --- 模块级缓存的 TypeAdapter ---
+NOTIFICATION_IN_DB_LIST_ADAPTER = TypeAdapter(List[NotificationInDB])
+NOTIFICATION_PUBLIC_LIST_ADAPTER = TypeAdapter(List[NotificationPublic])
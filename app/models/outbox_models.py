@@ -0,0 +1,23 @@
+# app/models/outbox_models.py
+from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, Field, TypeAdapter
+from datetime import datetime
+from app.models.common_models import BaseDBModel
+
+# 等待设备上线后下发的指令 (见 app/services/outbox_service.py)
+class OutboxCommandBase(BaseModel):
+    deviceImei: str
+    action: str # 下发到 devices/{imei}/action/{action}
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    collapseKey: str # 同一设备相同 collapseKey 的待发指令只保留最新一条
+    expiresAt: datetime # 过期未发送的指令由 TTL 索引删除
+    deliveryId: Optional[str] = None # 正在下发时的领取标识 (见 outbox_service.claim_pending_commands)
+    deliveringUntil: Optional[datetime] = None # 领取的租约到期时间
+
+class OutboxCommandInDB(BaseDBModel, OutboxCommandBase):
+    def to_device_message(self) -> Dict[str, Any]:
+        """设备收到的指令内容；commandId 供设备端去重"""
+        return {**self.payload, "commandId": self.id}
+
+# --- 模块级缓存的 TypeAdapter ---
+OUTBOX_COMMAND_IN_DB_LIST_ADAPTER = TypeAdapter(List[OutboxCommandInDB])
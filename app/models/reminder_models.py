@@ -1,6 +1,6 @@
 # app/models/reminder_models.py
 from typing import List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from datetime import datetime, time # 导入Python的time类型
 from app.models.common_models import BaseDBModel, PyObjectId
 
@@ -28,3 +28,6 @@ class ReminderPublic(BaseDBModel, ReminderBase):
     deviceId: PyObjectId
     repeatText: Optional[str] = None 
     pass
+
+# --- 模块级缓存的 TypeAdapter ---
+REMINDER_IN_DB_LIST_ADAPTER = TypeAdapter(List[ReminderInDB])
@@ -0,0 +1,167 @@
+# app/mqtt/broadcast.py
+# 向大量设备下发同一条指令 (如给某个固件版本的所有手表推送配置)
+#
+# 从 devices 集合的游标流式读取 IMEI (只投影 deviceId，不把全部设备载入内存)，
+# 通过有界的并发窗口 (max_in_flight 条 QoS 1 消息同时等待 PUBACK) 和令牌桶限速发布，
+# 进度与失败记录在 BroadcastJob 中，可通过 GET /admin/broadcasts/{id} 查询。
+# 任务只保存在当前进程内存中 (保留最近 MAX_JOBS 个)，进程重启后丢失。
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS = 100
+MAX_RECORDED_FAILURES = 100
+PROGRESS_LOG_INTERVAL = 10000
+
+
+class RateLimiter:
+    """令牌桶：平均每秒 rate 个，允许 burst 个突发；rate <= 0 表示不限速"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate / 10)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastJob:
+    def __init__(self, action: str, selector: Dict[str, Any], max_in_flight: int, rate: float):
+        self.id = uuid.uuid4().hex
+        self.action = action
+        self.selector = selector
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.state = "pending" # pending / running / completed / failed / cancelled
+        self.matched = 0
+        self.sent = 0
+        self.failed = 0
+        self.failures: List[Dict[str, str]] = [] # 只保留前 MAX_RECORDED_FAILURES 条
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def record_failure(self, device_imei: str, error: str) -> None:
+        self.failed += 1
+        if len(self.failures) < MAX_RECORDED_FAILURES:
+            self.failures.append({"imei": device_imei, "error": error})
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "id": self.id,
+            "action": self.action,
+            "selector": self.selector,
+            "state": self.state,
+            "matched": self.matched,
+            "sent": self.sent,
+            "failed": self.failed,
+            "inFlight": self.matched - self.sent - self.failed,
+            "elapsedSeconds": round(elapsed, 3),
+            "messagesPerSecond": round(self.sent / elapsed, 1) if elapsed else 0.0,
+            "failures": self.failures,
+            "error": self.error,
+        }
+
+
+# 发布单条消息：成功返回 None，失败返回错误描述
+PublishFunc = Callable[[str], Awaitable[Optional[str]]]
+
+async def run_broadcast(job: BroadcastJob, imeis: AsyncIterator[str], publish: PublishFunc) -> BroadcastJob:
+    job.state = "running"
+    job.started_at = time.time()
+    limiter = RateLimiter(job.rate)
+    window = asyncio.Semaphore(job.max_in_flight)
+    in_flight = set()
+
+    async def send(device_imei: str):
+        try:
+            error = await publish(device_imei)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finally:
+            window.release()
+        if error:
+            job.record_failure(device_imei, error)
+        else:
+            job.sent += 1
+
+    try:
+        async for device_imei in imeis:
+            await window.acquire() # 窗口满时暂停读取游标，内存占用与 max_in_flight 成正比
+            await limiter.acquire()
+            job.matched += 1
+            task = asyncio.create_task(send(device_imei))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            if job.matched % PROGRESS_LOG_INTERVAL == 0:
+                logger.info("Broadcast progress", extra={"broadcast_id": job.id, "matched": job.matched, "sent": job.sent, "failed": job.failed})
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        job.state = "completed"
+    except asyncio.CancelledError:
+        for task in in_flight:
+            task.cancel()
+        job.state = "cancelled"
+        raise
+    except Exception as e:
+        job.state = "failed"
+        job.error = str(e)
+        logger.exception("Broadcast failed", extra={"broadcast_id": job.id})
+    finally:
+        job.finished_at = time.time()
+        logger.info("Broadcast finished", extra={
+            "broadcast_id": job.id, "state": job.state, "matched": job.matched, "sent": job.sent, "failed": job.failed,
+        })
+    return job
+
+
+class BroadcastRegistry:
+    """当前进程中的广播任务 (按创建顺序保留最近 MAX_JOBS 个)"""
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, BroadcastJob]" = OrderedDict()
+
+    def start(self, job: BroadcastJob, imeis: AsyncIterator[str], publish: PublishFunc) -> BroadcastJob:
+        job.task = asyncio.create_task(run_broadcast(job, imeis, publish))
+        self._jobs[job.id] = job
+        while len(self._jobs) > MAX_JOBS:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.task and not oldest.task.done():
+                break
+            del self._jobs[oldest_id]
+        return job
+
+    def get(self, job_id: str) -> Optional[BroadcastJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[BroadcastJob]:
+        return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.task is None or job.task.done():
+            return False
+        job.task.cancel()
+        return True
+
+
+broadcasts = BroadcastRegistry()
@@ -0,0 +1,157 @@
+# app/mqtt/idempotency.py
+# 设备事件去重：订阅使用 qos=1，Broker 在重连/故障切换时会重投消息，同一条 SOS 不能产生两条告警和两次推送。
+#
+# 消息标识 (payload 中，按优先级):
+#   msgId / requestId   设备生成的唯一字符串 (sos_alert、request_* 已经携带 requestId)
+#   boot + seq          开机标识 + 递增序号；只有 seq 时仅做进程内去重 (设备重启后 seq 会从头开始)
+# 没有标识的消息不去重，行为与之前一致。
+#
+# 两层:
+#   1. 进程内每台设备一个滑动窗口：seq 用 64 位位图 (同 IPsec 防重放窗口)，字符串标识保留最近 64 个。
+#      检查与标记之间没有 await，同一进程内并发处理的重复消息也只有一条能通过。
+#   2. mqtt_processed_events 集合：以 "<imei>:<标识>" 作为 _id (唯一索引)，插入冲突即重复，
+#      覆盖多 worker/多实例以及进程重启；createdAt 上的 TTL 索引 (MQTT_DEDUP_TTL_SECONDS) 控制集合大小。
+#      status 是覆盖式快照，重复写入无副作用，只走第1层，不增加数据库往返。
+# 两层只拦截重投的消息；死信重试会再次执行整个处理函数，处理函数自己的写入用 event_document_id
+# 派生的确定 _id 插入，重试时已写入的步骤因主键冲突跳过 (如 SOS 告警和推送不会重复)。
+import logging
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from app.db.mongodb_utils import get_processed_event_collection
+from app.db.query_profiler import profiled
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SIZE = 64
+_WINDOW_MASK = (1 << WINDOW_SIZE) - 1
+
+# 只在进程内去重的事件类型
+MEMORY_ONLY_EVENTS = frozenset({"status"})
+
+# event_document_id 的 uuid5 命名空间 (固定值，修改后重试将无法识别之前写入的文档)
+_EVENT_DOCUMENT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "mqtt-event-documents")
+
+
+def message_key(payload: Any) -> Optional[Tuple[str, bool]]:
+    """
+    返回 (标识, 是否可跨进程持久化)；payload 没有标识时返回 None。
+    只有 seq 没有 boot 的标识不能持久化：设备重启后同一 seq 会代表另一条消息。
+    """
+    if not isinstance(payload, dict):
+        return None
+    msg_id = payload.get("msgId") or payload.get("requestId")
+    if msg_id is not None:
+        return str(msg_id), True
+    seq = payload.get("seq")
+    if isinstance(seq, int) and not isinstance(seq, bool):
+        boot = payload.get("boot")
+        return (f"{boot}#{seq}", True) if boot is not None else (f"#{seq}", False)
+    return None
+
+
+def event_document_id(device_imei: str, payload: Any, scope: str) -> Optional[str]:
+    """
+    由可持久化的消息标识派生该事件写入的文档 _id (UUID 字符串，符合 PyObjectId)，
+    同一事件的每次处理得到同一个 _id；scope 区分同一事件写入的不同文档。payload 没有可持久化的标识时返回 None。
+    """
+    key = message_key(payload)
+    if key is None or not key[1]:
+        return None
+    return str(uuid.uuid5(_EVENT_DOCUMENT_NAMESPACE, f"{scope}:{device_imei}:{key[0]}"))
+
+
+class DeviceWindow:
+    """单台设备最近的消息标识"""
+    __slots__ = ("boot", "highest", "mask", "recent_ids")
+
+    def __init__(self):
+        self.boot: Any = None
+        self.highest = -1
+        self.mask = 0 # 第 i 位表示 highest - i 已见过
+        self.recent_ids: "deque[str]" = deque(maxlen=WINDOW_SIZE)
+
+    def check_and_mark_seq(self, boot: Any, seq: int) -> bool:
+        """重复返回 True；否则记录并返回 False"""
+        if boot != self.boot:
+            self.boot, self.highest, self.mask = boot, -1, 0
+        if seq > self.highest:
+            self.mask = ((self.mask << (seq - self.highest)) | 1) & _WINDOW_MASK if self.highest >= 0 else 1
+            self.highest = seq
+            return False
+        offset = self.highest - seq
+        if offset >= WINDOW_SIZE:
+            # 远落后于窗口：设备未上报 boot 就重启了，从这个序号重新开始
+            self.highest, self.mask = seq, 1
+            return False
+        bit = 1 << offset
+        if self.mask & bit:
+            return True
+        self.mask |= bit
+        return False
+
+    def check_and_mark_id(self, msg_id: str) -> bool:
+        if msg_id in self.recent_ids:
+            return True
+        self.recent_ids.append(msg_id)
+        return False
+
+
+class EventDeduplicator:
+    def __init__(self, max_devices: int = 100000):
+        self.max_devices = max_devices
+        self._windows: Dict[str, DeviceWindow] = {}
+
+    def _window(self, device_imei: str) -> DeviceWindow:
+        window = self._windows.pop(device_imei, None)
+        if window is None:
+            window = DeviceWindow()
+            if len(self._windows) >= self.max_devices:
+                # dict 保持插入顺序，最久未活动的设备在最前面
+                del self._windows[next(iter(self._windows))]
+        self._windows[device_imei] = window
+        return window
+
+    def seen_locally(self, device_imei: str, payload: Any) -> Optional[bool]:
+        """第1层检查并标记；payload 没有标识时返回 None"""
+        key = message_key(payload)
+        if key is None:
+            return None
+        window = self._window(device_imei)
+        if payload.get("msgId") is None and payload.get("requestId") is None:
+            return window.check_and_mark_seq(payload.get("boot"), payload["seq"])
+        return window.check_and_mark_id(key[0])
+
+    async def is_duplicate(self, device_imei: str, event_type: str, payload: Any) -> Optional[str]:
+        """重复时返回判定重复的层 ("memory" / "db")，否则返回 None"""
+        seen = self.seen_locally(device_imei, payload)
+        if seen is None:
+            return None
+        if seen:
+            return "memory"
+        key, durable = message_key(payload)
+        if not durable or event_type in MEMORY_ONLY_EVENTS:
+            return None
+        try:
+            claimed = await claim_event(device_imei, key, event_type)
+        except Exception as e:
+            # 宁可重复处理也不丢事件 (at-least-once)
+            logger.warning("Idempotency check failed, processing event anyway: %s", e, extra={"imei": device_imei, "event_type": event_type})
+            return None
+        return None if claimed else "db"
+
+
+@profiled
+async def claim_event(device_imei: str, key: str, event_type: str) -> bool:
+    """登记已处理的事件；已存在 (其他进程或之前已处理) 时返回 False"""
+    try:
+        await get_processed_event_collection().insert_one(
+            {"_id": f"{device_imei}:{key}", "eventType": event_type, "createdAt": datetime.utcnow()}
+        )
+    except DuplicateKeyError:
+        return False
+    return True
@@ -0,0 +1,164 @@
+# app/mqtt/journal.py
+# MQTT 入站消息日志 (journal)：只追加写入，用于现场问题复现和真实流量压测 (见 scripts/replay_journal.py)
+#
+# 文件格式 (小端):
+#   段文件头:  b"MQJ1"
+#   每条记录:  <d 接收时间(unix秒)> <H 主题长度> <I payload长度> <I CRC32(主题+payload)> 主题(UTF-8) payload
+# 每条记录固定开销 18 字节。进程崩溃时末尾可能留下不完整的记录，读取时按长度/CRC校验后截断。
+#
+# 写入在后台线程完成：事件循环只把 (时间, 主题, payload) 放进有界队列，队列满时丢弃并计数，不阻塞消息处理。
+# 段文件按大小滚动 (MQTT_JOURNAL_SEGMENT_MB)，本进程的段文件超过 MQTT_JOURNAL_MAX_SEGMENTS 个时删除其中最旧的。
+# 文件名包含进程号，gunicorn 多 worker 可以共用同一个目录：每个进程只清理自己的段文件，不会删掉其他 worker
+# 正在写的段；已退出的进程留下的段文件不会被自动删除 (可能正需要回放)，由运维按需清理。
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MQJ1"
+RECORD_HEADER = struct.Struct("<dHII")
+SEGMENT_SUFFIX = ".mqj"
+
+# (接收时间, 主题, payload)
+JournalRecord = Tuple[float, str, bytes]
+
+
+class MessageJournal:
+    def __init__(self, directory: Union[str, Path], segment_bytes: int = 64 * 2**20, max_segments: int = 20,
+                 queue_size: int = 100000, flush_interval: float = 1.0):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue: "queue.Queue[Optional[JournalRecord]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._file_size = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="mqtt-journal", daemon=True)
+        self._thread.start()
+        logger.info("MQTT journal enabled", extra={"directory": str(self.directory)})
+
+    def append(self, topic: str, payload: bytes, received_at: Optional[float] = None) -> None:
+        """在事件循环中调用，只入队"""
+        try:
+            self._queue.put_nowait((received_at or time.time(), topic, payload))
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self) -> None:
+        """写完队列中剩余的记录后关闭当前段文件"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+        self._thread = None
+        if self.dropped:
+            logger.warning("MQTT journal dropped %d messages because the queue was full", self.dropped)
+
+    # --- 后台线程 ---
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = ...
+            if record is None:
+                break
+            if record is not ...:
+                try:
+                    self._write(*record)
+                except OSError as e:
+                    self.dropped += 1
+                    logger.error("Failed to write MQTT journal: %s", e)
+                    self._close_segment()
+            if self._file is not None and time.monotonic() - last_flush >= self.flush_interval:
+                self._file.flush()
+                last_flush = time.monotonic()
+        self._close_segment()
+
+    def _write(self, received_at: float, topic: str, payload: bytes) -> None:
+        topic_bytes = topic.encode("utf-8")
+        crc = zlib.crc32(payload, zlib.crc32(topic_bytes))
+        record = RECORD_HEADER.pack(received_at, len(topic_bytes), len(payload), crc) + topic_bytes + payload
+        if self._file is None or self._file_size + len(record) > self.segment_bytes:
+            self._open_segment()
+        self._file.write(record)
+        self._file_size += len(record)
+        self.written += 1
+
+    def _open_segment(self) -> None:
+        self._close_segment()
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        path = self.directory / f"journal-{stamp}-{os.getpid()}{SEGMENT_SUFFIX}"
+        self._file = open(path, "wb", buffering=1024 * 1024)
+        self._file.write(MAGIC)
+        self._file_size = len(MAGIC)
+        self._enforce_retention()
+
+    def _close_segment(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _enforce_retention(self) -> None:
+        suffix = f"-{os.getpid()}{SEGMENT_SUFFIX}"
+        segments = [path for path in list_segments(self.directory) if path.name.endswith(suffix)]
+        for path in segments[:max(0, len(segments) - self.max_segments)]:
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.warning("Failed to delete old journal segment %s: %s", path, e)
+
+
+# --- 读取 ---
+def list_segments(path: Union[str, Path]) -> List[Path]:
+    """目录下所有段文件 (按文件名即创建时间排序)；path 是单个文件时直接返回它"""
+    path = Path(path)
+    if path.is_file():
+        return [path]
+    return sorted(path.glob(f"*{SEGMENT_SUFFIX}"))
+
+def read_segment(path: Union[str, Path]) -> Iterator[JournalRecord]:
+    """通过 mmap 顺序读取一个段文件；遇到不完整或CRC不匹配的记录即停止 (写入中途崩溃留下的尾部)"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not an MQTT journal segment")
+            offset, end = len(MAGIC), len(data)
+            header_size = RECORD_HEADER.size
+            while offset + header_size <= end:
+                received_at, topic_len, payload_len, crc = RECORD_HEADER.unpack_from(data, offset)
+                body_start = offset + header_size
+                body_end = body_start + topic_len + payload_len
+                if body_end > end:
+                    break
+                topic = data[body_start:body_start + topic_len]
+                payload = data[body_start + topic_len:body_end]
+                if zlib.crc32(payload, zlib.crc32(topic)) != crc:
+                    logger.warning("Corrupted journal record in %s at offset %d, stopping", path, offset)
+                    break
+                yield received_at, topic.decode("utf-8"), payload
+                offset = body_end
+
+def read_journal(path: Union[str, Path]) -> Iterator[JournalRecord]:
+    for segment in list_segments(path):
+        yield from read_segment(segment)
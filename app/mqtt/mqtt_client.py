@@ -1,154 +1,370 @@
 # app/mqtt/mqtt_client.py (使用 aiomqtt 重构的最终完整版)
 
 import asyncio
-import json
+import logging
+import random
+import socket
 import ssl
+import time
 import uuid
-from typing import Optional, Any, Dict, List, Union
+from collections import deque
+from typing import Optional, Any, AsyncIterator, Dict, List, Set, Tuple, Union
 
 import aiomqtt  # 导入 aiomqtt
+from pymongo.errors import DuplicateKeyError
 
 from app.core.config import settings
+from app.core import metrics
+from app.mqtt import payload_codec
+from app.mqtt.broadcast import BroadcastJob, broadcasts
+from app.mqtt.idempotency import EventDeduplicator, event_document_id
+from app.mqtt.journal import MessageJournal
+from app.mqtt.rpc import DeviceRpcError, DeviceRpcTimeout, RpcTable
 from app.services import (
     device_service, 
     notification_service, 
-    third_party_services, 
     user_service, 
-    datetime_service
+    datetime_service,
+    dead_letter_service,
+    config_sync_service,
+    outbox_service,
+    tts_service
 )
-from app.models.device_models import DeviceStatusUpdate, DeviceLocation
+from app.db.mongodb_utils import get_sos_alert_collection
+from app.models.device_models import DeviceInDB, DeviceStatusUpdate, DeviceLocation
 from app.models.notification_models import NotificationCreate, SosAlertCreate
 from app.models.common_models import PyObjectId
+from app.models.dead_letter_models import DeadLetterInDB
+
+logger = logging.getLogger(__name__)
 
 class AsyncMQTTClient:
     def __init__(self):
         self.client: Optional[aiomqtt.Client] = None
-        self._main_task: Optional[asyncio.Task] = None
-        
-    async def connect(self):
-        """连接到MQTT Broker"""
-        if self.client and self.client.is_connected():
-            print("==> [MQTT] Client is already connected.")
-            return
-
-        print(f"==> [MQTT] Attempting to connect to {settings.MQTT_BROKER_HOST}:{settings.MQTT_BROKER_PORT}...")
+        self._supervisor_task: Optional[asyncio.Task] = None
+        # 连接状态 (见 connection_state)
+        self.client_id = settings.MQTT_CLIENT_ID or f"{settings.MQTT_CLIENT_ID_PREFIX}{socket.gethostname()}"
+        self.state = "stopped" # stopped / connecting / connected / reconnecting
+        self.connected_since: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._reconnect_attempt = 0
+        # 断线期间缓冲的下发消息 (topic, body, qos)
+        self._outbox: "deque[Tuple[str, Union[str, bytes], int]]" = deque(maxlen=settings.MQTT_OUTBOX_SIZE)
+        self.dropped_publishes = 0
+        self._dead_letter_task: Optional[asyncio.Task] = None
+        # 数据库不可用时暂存写入失败的死信，由后台任务稍后补写
+        self._unsaved_dead_letters: "deque[DeadLetterInDB]" = deque(maxlen=1000)
+        # 每台设备最近一次上报使用的payload格式 (json / msgpack)，下发指令时沿用
+        self._device_formats: Dict[str, str] = {}
+        self._handlers = {
+            "status": self._handle_device_status_update,
+            "sos_alert": self._handle_sos_alert,
+            "request_bill_help": self._handle_bill_request_help,
+            "request_time": self._handle_request_time,
+            "request_config_sync": self._handle_request_config_sync,
+        }
+        # 正在执行的事件处理任务 (保留引用，避免任务被垃圾回收；回放/关闭时可等待其完成)
+        self._handler_tasks: Set[asyncio.Task] = set()
+        self._deduplicator = EventDeduplicator(max_devices=settings.MQTT_DEDUP_MAX_DEVICES)
+        # 服务端 -> 设备的进行中请求 (见 call_device)
+        self._rpc = RpcTable()
+        self.journal: Optional[MessageJournal] = None
+        if settings.MQTT_JOURNAL_DIR:
+            self.journal = MessageJournal(
+                settings.MQTT_JOURNAL_DIR,
+                segment_bytes=settings.MQTT_JOURNAL_SEGMENT_MB * 2**20,
+                max_segments=settings.MQTT_JOURNAL_MAX_SEGMENTS,
+            )
         
-        # aiomqtt.Client 构造函数接受与Paho类似的参数
-        self.client = aiomqtt.Client(
+    # --- 连接管理 ---
+    def _build_client(self) -> aiomqtt.Client:
+        tls_params = None
+        if settings.MQTT_TLS_ENABLED:
+            tls_params = aiomqtt.TLSParameters(
+                ca_certs=settings.MQTT_CA_CERTS,
+                certfile=settings.MQTT_CERTFILE,
+                keyfile=settings.MQTT_KEYFILE,
+                cert_reqs=ssl.CERT_REQUIRED,
+            )
+        return aiomqtt.Client(
             hostname=settings.MQTT_BROKER_HOST,
             port=settings.MQTT_BROKER_PORT,
             username=settings.MQTT_USERNAME,
             password=settings.MQTT_PASSWORD,
-            client_id=f"{settings.MQTT_CLIENT_ID_PREFIX}{str(uuid.uuid4())}",
-            # 如果需要TLS，可以配置tls_params
-            # tls_params=aiomqtt.TLSParameters(...)
+            # 固定的 client id + clean_session=False：Broker 为我们保留会话，断线/重启期间的 QoS 1 消息不会丢
+            identifier=self.client_id,
+            clean_session=False,
+            keepalive=settings.MQTT_KEEPALIVE_SECONDS,
+            # 同时等待 PUBACK 的 QoS 1 消息数 (paho 默认只有20，会限制批量下发的吞吐)
+            max_inflight_messages=settings.MQTT_MAX_INFLIGHT_MESSAGES,
+            tls_params=tls_params,
         )
-        try:
-            await self.client.connect()
-            print("==> [MQTT] Successfully connected to Broker.")
-            # 启动主循环任务来监听消息
-            self._main_task = asyncio.create_task(self._main_loop())
-        except aiomqtt.MqttError as e:
-            print(f"[MQTT FATAL] Could not connect to Broker: {e}")
-            self.client = None
 
-    async def _main_loop(self):
-        """主循环，监听和处理消息"""
-        if not self.client: return
-        print("==> [MQTT] Starting message listener loop...")
-        
-        try:
-            # 订阅主题
-            await self.client.subscribe("devices/+/event/#", qos=1)
-            await self.client.subscribe("devices/+/status", qos=1)
-            print("==> [MQTT] Subscribed to device topics.")
-
-            async for message in self.client.messages:
-                # 这里的循环是异步的，完美集成
-                await self._handle_message(message)
-        except aiomqtt.MqttError as e:
-            print(f"[MQTT ERROR] Message listener loop stopped due to an error: {e}")
-        finally:
-            print("==> [MQTT] Message listener loop finished.")
+    def _reconnect_delay(self) -> float:
+        """指数退避，取 [delay/2, delay] 之间的随机值，避免多个实例同时重连"""
+        delay = min(settings.MQTT_RECONNECT_MIN_SECONDS * 2 ** self._reconnect_attempt, settings.MQTT_RECONNECT_MAX_SECONDS)
+        return random.uniform(delay / 2, delay)
+
+    async def connect(self):
+        """启动连接守护任务 (不等待首次连接成功，Broker 不可用时不阻塞应用启动)"""
+        if self._supervisor_task and not self._supervisor_task.done():
+            logger.info("MQTT client is already running")
+            return
+        if self.journal:
+            self.journal.start()
+        self._supervisor_task = asyncio.create_task(self._supervise())
+        self._dead_letter_task = asyncio.create_task(self._dead_letter_worker())
+
+    async def _supervise(self):
+        """连接 -> 订阅 -> 补发缓冲消息 -> 处理消息；任何 MqttError 后按退避间隔重连，直到 disconnect()"""
+        while True:
+            self.state = "connecting" if self._reconnect_attempt == 0 else "reconnecting"
+            logger.info("Connecting to MQTT broker", extra={
+                "host": settings.MQTT_BROKER_HOST, "port": settings.MQTT_BROKER_PORT,
+                "client_id": self.client_id, "attempt": self._reconnect_attempt,
+            })
+            try:
+                async with self._build_client() as client:
+                    self.client = client
+                    self.state = "connected"
+                    self.connected_since = time.time()
+                    self._reconnect_attempt = 0
+                    metrics.MQTT_CONNECTED.set(1)
+                    logger.info("Connected to MQTT broker", extra={"client_id": self.client_id})
+                    await self._subscribe(client)
+                    await self._flush_outbox()
+                    await self._main_loop(client)
+            except aiomqtt.MqttError as e:
+                self.last_error = str(e)
+                logger.error("MQTT connection lost: %s", e)
+            finally:
+                if self.client is not None:
+                    metrics.MQTT_CONNECTED.set(0)
+                self.client = None
+                self.connected_since = None
+            self.state = "reconnecting"
+            delay = self._reconnect_delay()
+            self._reconnect_attempt += 1
+            metrics.MQTT_RECONNECTS.inc()
+            logger.info("Reconnecting to MQTT broker in %.1fs", delay, extra={"attempt": self._reconnect_attempt})
+            await asyncio.sleep(delay)
+
+    async def _subscribe(self, client: aiomqtt.Client):
+        # 持久会话中订阅关系本就保留，重复订阅无副作用，同时覆盖会话过期的情况
+        await client.subscribe("devices/+/event/#", qos=1)
+        await client.subscribe("devices/+/status", qos=1)
+        await client.subscribe(f"devices/+/status/{payload_codec.MSGPACK_TOPIC_SUFFIX}", qos=1)
+        await client.subscribe("devices/+/response/#", qos=1)
+        logger.info("Subscribed to device topics")
+
+    async def _main_loop(self, client: aiomqtt.Client):
+        """监听和处理消息，连接断开时抛出 MqttError 交给 _supervise 重连"""
+        logger.info("Starting MQTT message listener loop")
+        async for message in client.messages:
+            await self._handle_message(message)
+
+    def connection_state(self) -> Dict[str, Any]:
+        """供 /health 使用的连接状态"""
+        return {
+            "state": self.state,
+            "clientId": self.client_id,
+            "connectedSince": self.connected_since,
+            "reconnectAttempt": self._reconnect_attempt,
+            "lastError": self.last_error,
+            "bufferedPublishes": len(self._outbox),
+            "droppedPublishes": self.dropped_publishes,
+        }
 
     async def _handle_message(self, message: aiomqtt.Message):
         """异步消息处理器"""
         topic = message.topic.value
-        try:
-            payload_data = json.loads(message.payload.decode())
-            print(f"\n--- [MQTT] Message Received ---")
-            print(f"  Topic: {topic}")
-            print(f"  Payload: {payload_data}")
-            print(f"-----------------------------")
-        except (json.JSONDecodeError, UnicodeDecodeError) as e:
-            print(f"[MQTT ERROR] Failed to decode payload from topic {topic}: {e}")
-            return
-
-        parts = topic.split('/')
+        if self.journal:
+            payload = message.payload
+            self.journal.append(topic, payload if isinstance(payload, bytes) else str(payload).encode("utf-8"))
+        # 主题末尾的格式后缀决定payload的编码 (见 payload_codec)
+        parts, payload_format = payload_codec.split_topic_format(topic.split('/'))
         if len(parts) >= 3 and parts[0] == "devices":
             device_imei = parts[1]
             event_type = parts[3] if len(parts) > 3 and parts[2] == "event" else parts[2]
-            
-            handler_map = {
-                "status": self._handle_device_status_update,
-                "sos_alert": self._handle_sos_alert,
-                "request_bill_help": self._handle_bill_request_help,
-                "request_time": self._handle_request_time,
-            }
-            handler = handler_map.get(event_type)
+            handler = self._handlers.get(event_type)
+            is_response = parts[2] == "response"
+            metric_event = event_type if handler or is_response else "unknown" # 未知事件类型统一归类，控制标签基数
+            metrics.MQTT_MESSAGES_RECEIVED.labels(metric_event).inc()
+
+            try:
+                # JSON 由 orjson 直接解析bytes；MessagePack 按事件类型的字段顺序还原为同样的字典
+                payload_data = payload_codec.decode(message.payload, payload_format, event_type)
+                # 每条消息一条DEBUG日志 (生产环境级别为INFO时几乎零开销)，status 心跳按 mqtt.status 采样
+                logger.debug(
+                    "MQTT message received",
+                    extra={"topic": topic, "format": payload_format, "payload": payload_data, "sample": f"mqtt.{event_type}"}
+                )
+            except payload_codec.PayloadDecodeError as e:
+                logger.warning("Failed to decode %s payload from topic %s: %s", payload_format, topic, e)
+                metrics.MQTT_MESSAGES_FAILED.labels(metric_event).inc()
+                return
+            self._device_formats[device_imei] = payload_format
+
+            if is_response:
+                # 设备对 call_device 请求的响应，直接完成等待中的 Future，不经过事件处理流程
+                if not self._rpc.resolve(device_imei, payload_data):
+                    logger.info("Dropping unmatched or late device response", extra={"topic": topic})
+                return
+
             if handler:
                 # 使用asyncio.create_task来并发处理，避免一个慢任务阻塞其他消息
-                asyncio.create_task(handler(device_imei, payload_data))
+                task = asyncio.create_task(self._run_handler(event_type, handler, device_imei, payload_data))
+                self._handler_tasks.add(task)
+                task.add_done_callback(self._handler_tasks.discard)
             else:
-                 print(f"[MQTT WARN] No handler for event type '{event_type}'")
+                logger.warning("No handler for event type '%s'", event_type, extra={"topic": topic})
+
+    async def _run_handler(self, event_type: str, handler, device_imei: str, payload_data: dict):
+        """执行事件处理函数，统一记录耗时、成功/失败计数和异常日志"""
+        start = time.perf_counter()
+        # QoS 1 重投的重复事件直接跳过 (payload 不带消息标识时不去重)
+        duplicate_layer = await self._deduplicator.is_duplicate(device_imei, event_type, payload_data)
+        if duplicate_layer:
+            metrics.MQTT_MESSAGES_DUPLICATE.labels(event_type, duplicate_layer).inc()
+            logger.info("Skipping duplicate '%s' event", event_type, extra={"imei": device_imei, "layer": duplicate_layer})
+            return
+        try:
+            await handler(device_imei, payload_data)
+        except Exception as e:
+            metrics.MQTT_MESSAGES_FAILED.labels(event_type).inc()
+            logger.exception("Error handling '%s' event", event_type, extra={"imei": device_imei})
+            await self._record_dead_letter(event_type, device_imei, payload_data, e)
+        else:
+            metrics.MQTT_MESSAGES_HANDLED.labels(event_type).inc()
+        finally:
+            metrics.MQTT_HANDLER_LATENCY.labels(event_type).observe(time.perf_counter() - start)
+
+    # --- 死信 ---
+    async def _record_dead_letter(self, event_type: str, device_imei: str, payload_data: dict, exc: Exception):
+        dead_letter = None
+        try:
+            dead_letter = dead_letter_service.build_dead_letter(event_type, device_imei, payload_data, exc)
+            await dead_letter_service.save_dead_letter(dead_letter)
+        except Exception as e:
+            if dead_letter is None:
+                metrics.MQTT_DEAD_LETTERS.labels(event_type, "dropped").inc()
+                logger.error("Failed to build dead letter, event dropped: %s", e, extra={"imei": device_imei, "event_type": event_type})
+                return
+            self._unsaved_dead_letters.append(dead_letter)
+            metrics.MQTT_DEAD_LETTERS.labels(event_type, "unsaved").inc()
+            logger.error("Failed to save dead letter, keeping it in memory: %s", e, extra={"imei": device_imei, "event_type": event_type})
+        else:
+            metrics.MQTT_DEAD_LETTERS.labels(event_type, "recorded").inc()
+
+    async def _dead_letter_worker(self):
+        """后台重试死信，与消息主循环相互独立，不阻塞实时消息处理"""
+        logger.info("Dead-letter retry worker started")
+        while True:
+            try:
+                # 一批取满说明还有积压，继续处理；否则等待下一轮
+                while await self.process_dead_letters() >= settings.DEAD_LETTER_BATCH_SIZE:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Dead-letter retry round failed: %s", e)
+            await asyncio.sleep(settings.DEAD_LETTER_POLL_SECONDS)
+
+    async def process_dead_letters(self) -> int:
+        """补写内存中暂存的死信，然后重试一批到期的死信，返回本批数量"""
+        while self._unsaved_dead_letters:
+            await dead_letter_service.save_dead_letter(self._unsaved_dead_letters[0])
+            self._unsaved_dead_letters.popleft()
+        batch = await dead_letter_service.claim_due_dead_letters(settings.DEAD_LETTER_BATCH_SIZE)
+        # 单条更新失败时该记录保持 retrying，租约过期后会被重新领取
+        await asyncio.gather(*(self._retry_dead_letter(dead_letter) for dead_letter in batch), return_exceptions=True)
+        return len(batch)
+
+    async def _retry_dead_letter(self, dead_letter: DeadLetterInDB):
+        event_type = dead_letter.eventType
+        handler = self._handlers.get(event_type)
+        try:
+            if handler is None:
+                raise KeyError(f"No handler for event type '{event_type}'")
+            await handler(dead_letter.deviceImei, dead_letter.payload)
+        except Exception as e:
+            new_status = await dead_letter_service.mark_dead_letter_failed(dead_letter, e)
+            metrics.MQTT_DEAD_LETTERS.labels(event_type, "exhausted" if new_status == "exhausted" else "retry_failed").inc()
+            logger.warning("Dead-letter retry %d failed: %s", dead_letter.attempts, e,
+                           extra={"dead_letter_id": dead_letter.id, "imei": dead_letter.deviceImei, "event_type": event_type, "status": new_status})
+        else:
+            await dead_letter_service.mark_dead_letter_resolved(dead_letter.id)
+            metrics.MQTT_DEAD_LETTERS.labels(event_type, "resolved").inc()
+            logger.info("Dead letter resolved after %d retries", dead_letter.attempts,
+                        extra={"dead_letter_id": dead_letter.id, "imei": dead_letter.deviceImei, "event_type": event_type})
 
     async def _handle_request_time(self, device_imei: str, payload_data: dict):
-        print(f"Handling time request from device {device_imei}")
+        logger.info("Handling time request", extra={"imei": device_imei})
         request_id = payload_data.get("requestId")
-        time_text = datetime_service.get_formatted_time_string()
-        audio_url = await third_party_services.text_to_speech(time_text)
-        
-        response_topic = f"devices/{device_imei}/action/play_audio"
-        error_topic = f"devices/{device_imei}/response/error"
-
+        time_text = datetime_service.get_time_announcement()
+        response_payload = {"text": time_text, "requestId": request_id}
+        # 只查缓存，不在消息处理中等待合成：报时语音通常已在启动时预先合成；
+        # 未命中时先回复纯文本 (设备本地播报/显示)，同时在后台合成，下一次请求即可命中
+        audio_url = tts_service.tts_cache.cached_url(time_text)
         if audio_url:
-            response_payload = {"url": audio_url, "requestId": request_id}
-            await self.publish_message(response_topic, response_payload, qos=1)
-            print(f"Sent 'play_audio' command for time back to device {device_imei}")
+            response_payload["url"] = audio_url
+            metrics.TTS_REQUESTS.labels("hit").inc()
         else:
-            error_payload = {"error": "Failed to generate voice report.", "requestId": request_id}
-            await self.publish_message(error_topic, error_payload)
-            print(f"TTS synthesis failed for time request from {device_imei}.")
+            tts_service.tts_cache.prefetch(time_text)
+            logger.warning("Time announcement audio not cached yet, replying with text", extra={"imei": device_imei})
+        await self.publish_message(f"devices/{device_imei}/action/play_audio", response_payload, qos=1)
+
+    async def _handle_request_config_sync(self, device_imei: str, payload_data: dict):
+        """手表带上已同步的配置版本，回复之后的增量 (或全量快照)，见 config_sync_service"""
+        device = await device_service.get_device_by_imei(device_imei)
+        if not device:
+            logger.warning("Config sync request from unknown device", extra={"imei": device_imei})
+            return
+        since_version = int(payload_data.get("version") or 0)
+        response_payload = await config_sync_service.get_config_delta(device, since_version)
+        response_payload["requestId"] = payload_data.get("requestId")
+        body = self.encode_for_device(device_imei, response_payload)
+        metrics.CONFIG_SYNC_BYTES.labels("snapshot" if response_payload["full"] else "delta").inc(len(body))
+        await self.publish_message(f"devices/{device_imei}/action/config_sync", body, qos=1)
 
     async def _handle_device_status_update(self, device_imei: str, payload_data: dict):
-        print(f"Handling status update from {device_imei}")
-        try:
-            status_update = DeviceStatusUpdate(**payload_data)
-            await device_service.update_device_status_by_imei(device_imei, status_update)
-        except Exception as e:
-            print(f"[MQTT ERROR] Error processing status update for {device_imei}: {e}")
+        logger.debug("Handling status update", extra={"imei": device_imei, "sample": "mqtt.status"})
+        # 校验或数据库异常由 _run_handler 统一记录并计入失败指标
+        status_update = DeviceStatusUpdate.model_validate(payload_data)
+        device = await device_service.update_device_status_by_imei(device_imei, status_update)
+        if device and device.isOnline and device.pendingCommands > 0:
+            await self._deliver_pending_commands(device_imei)
 
     async def _handle_sos_alert(self, device_imei: str, payload_data: dict):
-        print(f"Handling SOS alert from device {device_imei}")
+        logger.info("Handling SOS alert", extra={"imei": device_imei})
         device = await device_service.get_device_by_imei(device_imei)
         if not device:
-            print(f"[MQTT ERROR] SOS alert from unknown device IMEI: {device_imei}")
+            logger.error("SOS alert from unknown device", extra={"imei": device_imei})
             return
 
         sos_location = None
         if payload_data.get("location"):
             try:
-                sos_location = DeviceLocation(**payload_data["location"])
+                sos_location = DeviceLocation.model_validate(payload_data["location"])
             except Exception as e:
-                print(f"[MQTT ERROR] Invalid location data in SOS payload for {device_imei}: {e}")
+                logger.warning("Invalid location data in SOS payload: %s", e, extra={"imei": device_imei})
 
         sos_alert_create = SosAlertCreate(
             deviceId=device.id,
             userId=device.userId,
             location=sos_location,
         )
-        sos_alert_collection = notification_service.get_sos_alert_collection()
-        await sos_alert_collection.insert_one(json.loads(sos_alert_create.model_dump_json()))
+        sos_alert_collection = get_sos_alert_collection()
+        # mode="json" 直接得到可入库的基础类型字典，省去 dump_json -> json.loads 的往返
+        sos_alert_doc = sos_alert_create.model_dump(mode="json")
+        # 带消息标识时 _id 由事件派生：死信重试不会再插入一条告警，只补做之后失败的步骤
+        sos_alert_id = event_document_id(device_imei, payload_data, "sos_alert")
+        if sos_alert_id:
+            sos_alert_doc["_id"] = sos_alert_id
+        try:
+            await sos_alert_collection.insert_one(sos_alert_doc)
+        except DuplicateKeyError:
+            logger.info("SOS alert already recorded for this event", extra={"imei": device_imei, "sos_alert_id": sos_alert_id})
 
         notification_content = f"设备“{device.name}”发起了紧急呼叫！"
         notification_create = NotificationCreate(
@@ -159,13 +375,15 @@ class AsyncMQTTClient:
             content=notification_content,
             payload=payload_data.get("location") or {}
         )
-        await notification_service.create_notification(notification_create)
+        await notification_service.create_notification(
+            notification_create, event_document_id(device_imei, payload_data, "sos_notification")
+        )
 
     async def _handle_bill_request_help(self, device_imei: str, payload_data: dict):
-        print(f"Handling bill help request from device {device_imei}")
+        logger.info("Handling bill help request", extra={"imei": device_imei})
         device = await device_service.get_device_by_imei(device_imei)
         if not device:
-            print(f"[MQTT ERROR] Bill help request from unknown device IMEI: {device_imei}")
+            logger.error("Bill help request from unknown device", extra={"imei": device_imei})
             return
         
         notification_content = f"设备“{device.name}”话费不足，请求充值。"
@@ -176,27 +394,166 @@ class AsyncMQTTClient:
             type="Billing",
             content=notification_content
         )
-        await notification_service.create_notification(notification_create)
+        await notification_service.create_notification(
+            notification_create, event_document_id(device_imei, payload_data, "bill_help_notification")
+        )
 
-    async def publish_message(self, topic: str, payload: Union[str, dict, list], qos: int = 1):
-        if not self.client or not self.client.is_connected():
-            print(f"[MQTT WARN] Client not connected. Cannot publish to {topic}")
-            return
-        message_str = json.dumps(payload) if isinstance(payload, (dict, list)) else str(payload)
+    async def publish_message(self, topic: str, payload: Union[str, bytes, dict, list], qos: int = 1, buffer: bool = True) -> bool:
+        """
+        发布消息，成功返回 True。bytes 表示调用方已按该设备的格式编码 (见 encode_for_device)。
+        未连接或发送失败时：buffer=True 放入下发缓冲区等待重连后补发；buffer=False 直接返回 False (由调用方处理失败)。
+        """
+        if isinstance(payload, (dict, list, bytes)):
+            # 发往设备的主题沿用该设备上报时协商的格式 (msgpack 时主题追加后缀)
+            device_imei = payload_codec.device_imei_from_topic(topic)
+            payload_format = self._device_formats.get(device_imei, payload_codec.FORMAT_JSON)
+            message_body = payload if isinstance(payload, bytes) else payload_codec.encode(payload, payload_format)
+            topic = payload_codec.encode_topic(topic, payload_format)
+        else:
+            message_body = str(payload)
+        if self.client is None:
+            if buffer:
+                self._buffer_publish(topic, message_body, qos)
+            else:
+                metrics.MQTT_MESSAGES_PUBLISHED.labels(metrics.topic_kind(topic), "not_connected").inc()
+            return False
         try:
-            await self.client.publish(topic, message_str, qos=qos)
-            print(f"Successfully published to {topic}")
+            await self.client.publish(topic, message_body, qos=qos)
         except aiomqtt.MqttError as e:
-            print(f"Failed to publish to {topic}: {e}")
+            if buffer:
+                logger.error("Failed to publish MQTT message, buffering it: %s", e, extra={"topic": topic})
+                self._buffer_publish(topic, message_body, qos)
+            else:
+                metrics.MQTT_MESSAGES_PUBLISHED.labels(metrics.topic_kind(topic), "failed").inc()
+            return False
+        metrics.MQTT_MESSAGES_PUBLISHED.labels(metrics.topic_kind(topic), "ok").inc()
+        logger.debug("Published MQTT message", extra={"topic": topic})
+        return True
+
+    def encode_for_device(self, device_imei: str, payload: Union[dict, list]) -> bytes:
+        """按设备协商的格式编码，供需要先知道消息大小的调用方使用"""
+        return payload_codec.encode(payload, self._device_formats.get(device_imei, payload_codec.FORMAT_JSON))
+
+    def _buffer_publish(self, topic: str, message_body: Union[str, bytes], qos: int):
+        """断线期间的下发消息暂存在有界队列中，重连后按顺序补发；队列满时丢弃最旧的"""
+        if len(self._outbox) == self._outbox.maxlen:
+            dropped_topic = self._outbox[0][0]
+            self.dropped_publishes += 1
+            metrics.MQTT_MESSAGES_PUBLISHED.labels(metrics.topic_kind(dropped_topic), "dropped").inc()
+            logger.warning("MQTT outbound buffer full, dropping oldest message", extra={"topic": dropped_topic})
+        self._outbox.append((topic, message_body, qos))
+        metrics.MQTT_MESSAGES_PUBLISHED.labels(metrics.topic_kind(topic), "buffered").inc()
+
+    async def _flush_outbox(self):
+        if not self._outbox:
+            return
+        logger.info("Flushing %d buffered MQTT messages", len(self._outbox))
+        while self._outbox and self.client is not None:
+            topic, message_body, qos = self._outbox[0]
+            await self.client.publish(topic, message_body, qos=qos) # 失败时抛出 MqttError，消息留在队首
+            self._outbox.popleft()
+            metrics.MQTT_MESSAGES_PUBLISHED.labels(metrics.topic_kind(topic), "ok").inc()
+
+    async def call_device(self, device_imei: str, action: str, params: Optional[Dict[str, Any]] = None,
+                          timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        向设备发送指令 (devices/{imei}/action/{action}) 并等待其响应，返回响应payload。
+        超时抛出 DeviceRpcTimeout，设备返回 error 或未连接 Broker 时抛出 DeviceRpcError。
+        未连接或发布失败时直接失败而不进入下发缓冲区，避免调用方放弃后设备才执行指令。
+        """
+        if self.client is None:
+            raise DeviceRpcError("MQTT broker not connected")
+        timeout = timeout or settings.MQTT_RPC_TIMEOUT_SECONDS
+        request_id, future = self._rpc.register(device_imei)
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            published = await self.publish_message(
+                f"devices/{device_imei}/action/{action}", {**(params or {}), "requestId": request_id}, buffer=False
+            )
+            if not published: # 检查之后才断线：同样直接失败，不留到重连后再下发
+                raise DeviceRpcError("publish failed")
+            response = await self._rpc.wait(request_id, future, timeout)
+            outcome = "ok"
+            return response
+        except DeviceRpcTimeout:
+            outcome = "timeout"
+            raise
+        finally:
+            self._rpc.discard(request_id)
+            metrics.MQTT_RPC_LATENCY.labels(action, outcome).observe(time.perf_counter() - start)
+
+    def start_broadcast(self, imeis: AsyncIterator[str], action: str, payload: Dict[str, Any], selector: Dict[str, Any],
+                        max_in_flight: int, rate: float) -> BroadcastJob:
+        """
+        在后台向 imeis 中的每台设备发布 devices/{imei}/action/{action} (见 app/mqtt/broadcast.py)。
+        不使用下发缓冲区：断线期间的发布直接计为失败，避免十万条消息挤占缓冲区。
+        """
+        job = BroadcastJob(action, selector, max_in_flight, rate)
+        message = {**payload, "broadcastId": job.id}
+
+        async def publish(device_imei: str) -> Optional[str]:
+            sent = await self.publish_message(f"devices/{device_imei}/action/{action}", message, buffer=False)
+            return None if sent else ("not connected" if self.client is None else "publish failed")
+
+        return broadcasts.start(job, imeis, publish)
+
+    # --- 离线指令队列 ---
+    async def send_command(self, device: DeviceInDB, action: str, payload: Optional[Dict[str, Any]] = None,
+                           collapse_key: Optional[str] = None, ttl_seconds: Optional[float] = None) -> str:
+        """
+        向设备下发指令 (不等待响应)：设备在线且没有积压时直接发布，否则存入离线队列，
+        设备下次上报在线状态时批量下发 (见 outbox_service)。返回 "sent" / "queued"。
+        collapse_key 相同的待发指令只保留最新一条，如 "sync_contacts"。
+        """
+        if self.client is not None and device.isOnline and device.pendingCommands <= 0:
+            message = {**(payload or {}), "commandId": str(uuid.uuid4())}
+            if await self.publish_message(f"devices/{device.deviceId}/action/{action}", message, buffer=False):
+                return "sent"
+        await outbox_service.enqueue_command(device.deviceId, action, payload, collapse_key, ttl_seconds)
+        metrics.DEVICE_OUTBOX_COMMANDS.labels("queued").inc()
+        return "queued"
+
+    async def _deliver_pending_commands(self, device_imei: str):
+        """领取离线队列中的指令，合并为 devices/{imei}/action/batch 消息下发，发送成功后再从队列删除"""
+        limit = settings.DEVICE_OUTBOX_BATCH_LIMIT
+        while True:
+            commands = await outbox_service.claim_pending_commands(device_imei, limit)
+            if not commands:
+                await outbox_service.reconcile_pending_count(device_imei)
+                return
+            message = {"commands": [{"action": command.action, **command.to_device_message()} for command in commands]}
+            if not await self.publish_message(f"devices/{device_imei}/action/batch", message, buffer=False):
+                logger.warning("Failed to deliver queued commands, keeping them", extra={"imei": device_imei, "count": len(commands)})
+                await outbox_service.release_commands(commands)
+                return
+            metrics.DEVICE_OUTBOX_COMMANDS.labels("delivered").inc(len(commands))
+            logger.info("Delivered queued commands", extra={"imei": device_imei, "count": len(commands)})
+            await outbox_service.remove_delivered_commands(device_imei, commands)
+            if len(commands) < limit:
+                return
+
+    async def drain(self):
+        """等待所有正在执行的事件处理任务完成"""
+        while self._handler_tasks:
+            await asyncio.gather(*list(self._handler_tasks), return_exceptions=True)
 
     async def disconnect(self):
-        """断开连接"""
-        if self._main_task and not self._main_task.done():
-            self._main_task.cancel()
-        if self.client and self.client.is_connected():
-            print("==> [MQTT] Disconnecting client...")
-            await self.client.disconnect()
-            print("==> [MQTT] Client disconnected.")
+        """停止重连并断开连接 (退出 async with 时发送 DISCONNECT)"""
+        for task in (self._supervisor_task, self._dead_letter_task):
+            if task and not task.done():
+                task.cancel()
+        if self._supervisor_task:
+            await asyncio.gather(self._supervisor_task, return_exceptions=True)
+        self._supervisor_task = None
+        self.state = "stopped"
+        metrics.MQTT_CONNECTED.set(0)
+        self._rpc.cancel_all("MQTT client stopped")
+        if self._outbox:
+            logger.warning("Discarding %d buffered MQTT messages on shutdown", len(self._outbox))
+        if self.journal:
+            self.journal.stop()
+        logger.info("MQTT client disconnected")
 
 
 # --- 单例实例 ---
@@ -0,0 +1,116 @@
+# app/mqtt/payload_codec.py
+# MQTT payload 编解码：JSON (默认) 与 MessagePack (蜂窝网络下的紧凑二进制格式)
+#
+# 格式协商方式：设备在主题末尾追加 "/msgpack" 后缀即表示payload为MessagePack，
+# 例如 devices/{imei}/status/msgpack、devices/{imei}/event/sos_alert/msgpack。
+# 后端记住每台设备最近一次使用的格式，下发给该设备的指令也使用相同格式 (主题同样追加后缀)。
+#
+# MessagePack payload 可以是与JSON相同的 map，也可以是按 POSITIONAL_SCHEMAS 约定字段顺序的数组
+# (省去字段名，心跳包可再缩小一半以上)。解码后统一还原为与JSON路径完全相同的字典，
+# 交给同一套处理函数和 DeviceStatusUpdate / DeviceLocation 模型校验。
+import uuid
+from datetime import date, datetime, time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core import json_codec
+
+try:
+    import msgpack
+except ImportError: # msgpack 是可选依赖，未安装时只支持JSON
+    msgpack = None
+
+FORMAT_JSON = "json"
+FORMAT_MSGPACK = "msgpack"
+MSGPACK_TOPIC_SUFFIX = "msgpack"
+
+# DeviceLocation 的数组形式: [latitude, longitude, address, timestamp]，尾部可省略
+LOCATION_FIELDS: Tuple[str, ...] = ("latitude", "longitude", "address", "timestamp")
+
+# 各事件类型的数组形式字段顺序 (与 DeviceStatusUpdate 等模型字段一一对应)，尾部可省略
+POSITIONAL_SCHEMAS: Dict[str, Tuple[str, ...]] = {
+    "status": ("isOnline", "battery", "signal", "firmwareVersion", "lastLocation"),
+    "sos_alert": ("location", "requestId"),
+    "request_bill_help": ("requestId",),
+    "request_time": ("requestId",),
+}
+
+# 值为位置数组的字段
+_LOCATION_KEYS = ("lastLocation", "location")
+
+class PayloadDecodeError(ValueError):
+    """payload 无法按声明的格式解码"""
+
+
+def split_topic_format(parts: List[str]) -> Tuple[List[str], str]:
+    """去掉主题末尾的格式后缀，返回 (去掉后缀的主题分段, 格式)"""
+    if len(parts) > 3 and parts[-1] == MSGPACK_TOPIC_SUFFIX:
+        return parts[:-1], FORMAT_MSGPACK
+    return parts, FORMAT_JSON
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def _expand_location(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return dict(zip(LOCATION_FIELDS, value))
+    return value
+
+def _expand_positional(event_type: str, data: Any) -> Any:
+    """数组形式 -> 字段名字典；map 形式原样返回 (仅展开其中的位置数组)"""
+    if isinstance(data, (list, tuple)):
+        schema = POSITIONAL_SCHEMAS.get(event_type)
+        if schema is None:
+            raise PayloadDecodeError(f"No positional schema for event type '{event_type}'")
+        if len(data) > len(schema):
+            raise PayloadDecodeError(f"Too many fields for '{event_type}': {len(data)} > {len(schema)}")
+        # None 表示该字段未上报，与JSON中缺省该键的语义一致 (exclude_unset)
+        data = {key: value for key, value in zip(schema, data) if value is not None}
+    if isinstance(data, dict):
+        for key in _LOCATION_KEYS:
+            if key in data:
+                data[key] = _expand_location(data[key])
+    return data
+
+
+def decode(payload: Any, fmt: str, event_type: str) -> Any:
+    """按格式解码payload，返回与JSON路径等价的Python对象"""
+    if fmt == FORMAT_MSGPACK:
+        if msgpack is None:
+            raise PayloadDecodeError("msgpack is not installed")
+        try:
+            # timestamp=3: MessagePack Timestamp 扩展类型直接解码为带时区的 datetime
+            data = msgpack.unpackb(payload, raw=False, timestamp=3, strict_map_key=True)
+        except (ValueError, TypeError) as e: # ExtraData/FormatError/StackError 都是 ValueError 的子类
+            raise PayloadDecodeError(str(e)) from e
+        return _expand_positional(event_type, data)
+    try:
+        return json_codec.loads(payload)
+    except json_codec.JSONDecodeError as e:
+        raise PayloadDecodeError(str(e)) from e
+
+
+def _msgpack_default(obj: Any) -> Any:
+    # 与 json_codec.dumps 的输出语义保持一致：datetime/UUID 转为字符串，其余类型抛 TypeError
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Type is not MessagePack serializable: {type(obj).__name__}")
+
+def encode(payload: Any, fmt: str) -> bytes:
+    if fmt == FORMAT_MSGPACK and msgpack is not None:
+        return msgpack.packb(payload, use_bin_type=True, default=_msgpack_default)
+    return json_codec.dumps(payload)
+
+
+def encode_topic(topic: str, fmt: str) -> str:
+    if fmt == FORMAT_MSGPACK and msgpack is not None:
+        return f"{topic}/{MSGPACK_TOPIC_SUFFIX}"
+    return topic
+
+def device_imei_from_topic(topic: str) -> Optional[str]:
+    parts = topic.split("/", 2)
+    if len(parts) == 3 and parts[0] == "devices":
+        return parts[1]
+    return None
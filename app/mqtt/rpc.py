@@ -0,0 +1,71 @@
+# app/mqtt/rpc.py
+# 服务端 -> 设备的请求/响应 (RPC)
+#
+#   请求: devices/{imei}/action/{action}     payload 中带 requestId (关联ID)
+#   响应: devices/{imei}/response/{action}   payload 中原样带回 requestId，可选 error 字段表示设备执行失败
+#
+# 进行中的请求保存在 requestId -> Future 的表中，收到响应时按 requestId 完成对应的 Future；
+# 每个请求只占一个 Future 和一个字典项，单进程可同时挂起数千个请求。
+# 超时、客户端停止或设备返回 error 时调用方收到对应异常。超时后才到达的响应直接丢弃。
+import asyncio
+import logging
+import uuid
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceRpcError(Exception):
+    """设备返回了 error，或请求在完成前被取消"""
+
+
+class DeviceRpcTimeout(DeviceRpcError):
+    """在超时时间内未收到设备响应"""
+
+
+class RpcTable:
+    def __init__(self):
+        # requestId -> (设备IMEI, Future)；校验IMEI，防止设备应答不属于自己的请求
+        self._pending: Dict[str, Tuple[str, asyncio.Future]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def register(self, device_imei: str) -> Tuple[str, asyncio.Future]:
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = (device_imei, future)
+        return request_id, future
+
+    def discard(self, request_id: str) -> None:
+        self._pending.pop(request_id, None)
+
+    def resolve(self, device_imei: str, payload: Any) -> bool:
+        """用设备响应完成对应的请求；没有匹配的进行中请求时返回 False"""
+        request_id = payload.get("requestId") if isinstance(payload, dict) else None
+        entry = self._pending.get(str(request_id)) if request_id is not None else None
+        if entry is None or entry[0] != device_imei:
+            return False
+        del self._pending[str(request_id)]
+        future = entry[1]
+        if not future.done():
+            error = payload.get("error")
+            if error:
+                future.set_exception(DeviceRpcError(str(error)))
+            else:
+                future.set_result(payload)
+        return True
+
+    def cancel_all(self, reason: str) -> None:
+        for _, future in self._pending.values():
+            if not future.done():
+                future.set_exception(DeviceRpcError(reason))
+        self._pending.clear()
+
+    async def wait(self, request_id: str, future: asyncio.Future, timeout: float) -> Dict[str, Any]:
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise DeviceRpcTimeout(f"No response within {timeout:.1f}s") from None
+        finally:
+            self.discard(request_id)
@@ -0,0 +1,130 @@
+# app/routers/admin_router.py
+# 运维管理接口，统一要求 X-Admin-Token (见 app/dependencies.require_admin)
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
+
+from app.dependencies import require_admin
+from app.db import query_profiler
+from app.db.mongodb_utils import get_database
+from app.models.common_models import PyObjectId
+from app.models.dead_letter_models import DeadLetterPublic
+from app.mqtt.broadcast import broadcasts
+from app.mqtt.mqtt_client import mqtt_client
+from app.services import dead_letter_service, device_service
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+# --- MongoDB 查询形态分析 ---
+class QueryProfilerConfig(BaseModel):
+    enabled: Optional[bool] = None
+    slowMs: Optional[float] = Field(None, ge=0)
+    reset: bool = False
+    # 同时设置 MongoDB 服务端 profiling level (0 关闭，1 记录慢于 slowMs 的操作，2 全部记录)
+    serverProfileLevel: Optional[int] = Field(None, ge=0, le=2)
+
+@router.get("/query-profile", summary="导出查询形态统计")
+async def get_query_profile(
+    server: bool = Query(False, description="合并服务端 system.profile 中的 docsExamined/keysExamined")
+):
+    return await query_profiler.dump(get_database() if server else None, include_server=server)
+
+@router.put("/query-profile", summary="开关/清空查询形态统计")
+async def configure_query_profile(config: QueryProfilerConfig):
+    profiler = query_profiler.query_profiler
+    profiler.configure(enabled=config.enabled, slow_ms=config.slowMs, reset=config.reset)
+    if config.serverProfileLevel is not None:
+        await get_database().command("profile", config.serverProfileLevel, slowms=int(profiler.slow_ms))
+    return {"enabled": profiler.enabled, "slowMs": profiler.slow_ms}
+
+# --- MQTT 事件死信 ---
+DEAD_LETTER_STATUS_PATTERN = "^(pending|retrying|resolved|exhausted)$"
+
+@router.get("/dead-letters", response_model=List[DeadLetterPublic], summary="查看处理失败的MQTT事件")
+async def list_dead_letters(
+    status_filter: Optional[str] = Query(None, alias="status", pattern=DEAD_LETTER_STATUS_PATTERN),
+    event_type: Optional[str] = Query(None, alias="eventType"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+):
+    return await dead_letter_service.get_dead_letters(status_filter, event_type, skip, limit)
+
+@router.get("/dead-letters/{dead_letter_id}", response_model=DeadLetterPublic, summary="查看单条死信")
+async def read_dead_letter(dead_letter_id: PyObjectId = Path(...)):
+    dead_letter = await dead_letter_service.get_dead_letter_by_id(dead_letter_id)
+    if not dead_letter:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dead letter not found.")
+    return dead_letter
+
+@router.post("/dead-letters/{dead_letter_id}/retry", summary="立即重试单条死信")
+async def retry_dead_letter(dead_letter_id: PyObjectId = Path(...)):
+    if not await dead_letter_service.requeue_dead_letters(dead_letter_id=dead_letter_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dead letter not found or already resolved.")
+    return {"requeued": 1}
+
+@router.post("/dead-letters/retry", summary="批量重新排队死信 (默认重试已放弃的)")
+async def retry_dead_letters(
+    status_filter: str = Query("exhausted", alias="status", pattern="^(pending|exhausted)$"),
+    event_type: Optional[str] = Query(None, alias="eventType"),
+):
+    return {"requeued": await dead_letter_service.requeue_dead_letters(status=status_filter, event_type=event_type)}
+
+# --- 批量下发 ---
+class DeviceSelector(BaseModel):
+    # 各条件之间为 AND；全部为空时必须显式指定 allDevices
+    userId: Optional[PyObjectId] = None
+    firmwareVersion: Optional[str] = None
+    isOnline: Optional[bool] = None
+    imeis: Optional[List[str]] = Field(None, max_length=100000)
+    allDevices: bool = False
+
+    def to_query(self) -> Dict[str, Any]:
+        query: Dict[str, Any] = {}
+        if self.userId:
+            query["userId"] = str(self.userId)
+        if self.firmwareVersion is not None:
+            query["firmwareVersion"] = self.firmwareVersion
+        if self.isOnline is not None:
+            query["isOnline"] = self.isOnline
+        if self.imeis is not None:
+            query["deviceId"] = {"$in": self.imeis}
+        return query
+
+class BroadcastRequest(BaseModel):
+    selector: DeviceSelector
+    action: str = Field(..., pattern=r"^[a-z][a-z0-9_]{0,31}$")
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    maxInFlight: int = Field(500, ge=1, le=10000, description="同时等待 PUBACK 的消息数上限")
+    ratePerSecond: float = Field(0, ge=0, description="每秒发布上限，0 表示不限速")
+
+@router.post("/broadcasts", status_code=status.HTTP_202_ACCEPTED, summary="向匹配的设备批量下发指令")
+async def create_broadcast(request_body: BroadcastRequest):
+    query = request_body.selector.to_query()
+    if not query and not request_body.selector.allDevices:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty selector; set allDevices to target every device.")
+    job = mqtt_client.start_broadcast(
+        device_service.iter_device_imeis(query),
+        request_body.action,
+        request_body.payload,
+        selector=request_body.selector.model_dump(exclude_none=True, mode="json"),
+        max_in_flight=request_body.maxInFlight,
+        rate=request_body.ratePerSecond,
+    )
+    return job.to_dict()
+
+@router.get("/broadcasts", summary="当前进程中的批量下发任务")
+async def list_broadcasts():
+    return [job.to_dict() for job in broadcasts.list()]
+
+@router.get("/broadcasts/{broadcast_id}", summary="批量下发进度")
+async def read_broadcast(broadcast_id: str = Path(...)):
+    job = broadcasts.get(broadcast_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Broadcast not found in this process.")
+    return job.to_dict()
+
+@router.delete("/broadcasts/{broadcast_id}", summary="取消批量下发")
+async def cancel_broadcast(broadcast_id: str = Path(...)):
+    if not broadcasts.cancel(broadcast_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Broadcast not found or already finished.")
+    return {"cancelled": True}
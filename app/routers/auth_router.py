@@ -1,5 +1,6 @@
 # app/routers/auth_router.py
 
+import logging
 from fastapi import APIRouter, HTTPException, status, Depends, Body
 from datetime import timedelta
 from pydantic import BaseModel
@@ -14,6 +15,7 @@ from app.dependencies import get_current_active_user, get_current_user_payload
 from app.db.mongodb_utils import get_user_collection # 导入用于直接查询验证
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # --- Pydantic Models for this router ---
 
@@ -42,8 +44,8 @@ async def login_via_wechat(login_data: WxLoginRequest):
     2. 根据 `openid` 在数据库中查找用户，如果不存在则创建。
     3. 生成 `access_token` 和 `refresh_token` 返回给小程序。
     """
-    print("\n--- [AUTH] Received POST /login/wx request ---")
-    print(f"[AUTH] Request body (login_data): {login_data.model_dump_json()}")
+    # 不记录请求体：其中的 code 可直接换取用户会话
+    logger.debug("Received POST /login/wx request")
 
     if not login_data.code:
         raise HTTPException(
@@ -51,12 +53,11 @@ async def login_via_wechat(login_data: WxLoginRequest):
             detail="Authorization code (code) is required."
         )
 
-    print("[AUTH] Calling WeChat code2Session API...")
+    logger.debug("Calling WeChat code2Session API...")
     wx_session_data = await third_party_services.wx_code_to_session(login_data.code)
     
     if not wx_session_data or "openid" not in wx_session_data:
-        print("!!! [AUTH] WeChat code2Session FAILED or returned no openid.")
-        print(f"[AUTH] WeChat API response: {wx_session_data}")
+        logger.warning("WeChat code2Session failed or returned no openid", extra={"wx_response": wx_session_data})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Failed to authenticate with WeChat. Invalid code or WeChat API error."
@@ -64,14 +65,13 @@ async def login_via_wechat(login_data: WxLoginRequest):
     
     openid = wx_session_data["openid"]
     unionid = wx_session_data.get("unionid")
-    print(f"[AUTH] WeChat code2Session SUCCESS. OpenID: {openid}, UnionID: {unionid}")
+    logger.debug("WeChat code2Session succeeded", extra={"openid": openid, "unionid": unionid})
 
-    print(f"[AUTH] Checking for existing user with openid: {openid}")
     user = await user_service.get_user_by_openid(openid)
-    print(f"[AUTH] User found in DB: {'Yes' if user else 'No'}")
+    logger.debug("Existing user lookup by openid", extra={"found": user is not None})
 
     if not user:
-        print("[AUTH] User not found, attempting to create new user...")
+        logger.debug("User not found, attempting to create new user...")
         user_create_data = UserCreate(
             wxOpenid=openid,
             wxUnionid=unionid,
@@ -81,24 +81,23 @@ async def login_via_wechat(login_data: WxLoginRequest):
         try:
             user = await user_service.create_user(user_create_data)
             if user:
-                 print(f"[AUTH] New user created successfully. User DB ID: {user.id}")
+                 logger.info("New user created", extra={"user_id": user.id})
             else: # create_user 在用户已存在时可能返回None或已存在的用户，需要根据实现调整
-                 print("!!! [AUTH] user_service.create_user returned None, possibly due to race condition or logic error.")
+                 logger.warning("user_service.create_user returned None, possibly due to race condition or logic error.")
                  # 重新查询一次以应对并发创建的情况
                  user = await user_service.get_user_by_openid(openid)
                  if not user:
                      raise Exception("Failed to retrieve user even after creation attempt.")
 
         except Exception as e:
-            print(f"!!! [AUTH] Error during user creation: {e}")
+            logger.exception("Error during user creation: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to create user: {e}"
             )
     else:
-        print(f"[AUTH] User found. User DB ID: {user.id}. Proceeding to generate tokens.")
+        logger.debug("User found, proceeding to generate tokens", extra={"user_id": user.id})
         if login_data.nickName or login_data.avatarUrl:
-            print("[AUTH] Updating user info for existing user...")
             updated_user = await user_service.update_user_info(
                 user_id=user.id,
                 nick_name=login_data.nickName,
@@ -106,34 +105,30 @@ async def login_via_wechat(login_data: WxLoginRequest):
             )
             if updated_user:
                 user = updated_user
-                print("[AUTH] User info updated.")
+                logger.debug("User info updated", extra={"user_id": user.id})
 
     if not user:
         raise HTTPException(status_code=500, detail="User object is unexpectedly None before generating tokens.")
 
 
     # --- [DB VERIFICATION STEP] ---
-    print("\n--- [DB VERIFICATION STEP] ---")
-    print(f"Verifying user with ID: {user.id} in the database...")
-    user_collection = get_user_collection()
-    verify_doc = await user_collection.find_one({"_id": str(user.id)})
-    if verify_doc:
-        print("SUCCESS: Found the user document in the database immediately after operation.")
-        print(f"DB Document: {verify_doc}")
-    else:
-        print("!!! CRITICAL FAILURE: Could NOT find the user document in the database right after it was supposedly created/found.")
-    print("--- [END DB VERIFICATION STEP] ---\n")
+    # 仅在DEBUG日志开启时执行，生产环境不为每次登录多一次查询；不输出文档内容 (含openid)
+    if logger.isEnabledFor(logging.DEBUG):
+        user_collection = get_user_collection()
+        verify_doc = await user_collection.find_one({"_id": str(user.id)}, {"_id": 1})
+        if verify_doc:
+            logger.debug("DB verification: user document found right after create/lookup", extra={"user_id": user.id})
+        else:
+            logger.error("DB verification: user document NOT found right after it was supposedly created/found", extra={"user_id": user.id})
     # --- END [DB VERIFICATION STEP] ---
 
 
-    print(f"[AUTH] Generating tokens for user ID: {user.id}")
     access_token = security.create_access_token(subject=user.id)
     refresh_token = security.create_refresh_token(subject=user.id)
-    print("[AUTH] Tokens generated.")
     
     user_public_info = UserPublic.model_validate(user)
 
-    print("[AUTH] Sending TokenResponse back to client.")
+    logger.info("User logged in via WeChat", extra={"user_id": user.id})
     return TokenResponse(
         access_token=access_token,
         refresh_token=refresh_token,
@@ -1,28 +1,54 @@
 # app/routers/device_router.py (完整修正版)
 
-from fastapi import APIRouter, Depends, HTTPException, status, Path, Body
-from typing import List, Optional
-from pydantic import BaseModel # 确保导入BaseModel
+import logging
+from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Path, Body, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, FrozenSet, List, Literal, Optional
+from pydantic import BaseModel, Field # 确保导入BaseModel
 
-from app.dependencies import get_current_active_user
+from app.core.json_codec import FastJSONResponse
+from app.dependencies import get_current_active_user, sparse_fields
 from app.models.user_models import UserInDB
 from app.models.device_models import (
-    DevicePublic, DeviceUpdate
+    DevicePublic, DeviceUpdate, DeviceSnapshot
 )
 from app.models.contact_models import (
-    ContactPublic, ContactCreate, ContactUpdate
+    ContactBase, ContactPublic, ContactCreate, ContactUpdate, ContactInDB
 )
 from app.models.reminder_models import (
-    ReminderPublic, ReminderCreate, ReminderUpdate
+    ReminderBase, ReminderPublic, ReminderCreate, ReminderUpdate
 )
 from app.models.entertainment_models import (
     EntertainmentItemPublic, EntertainmentItemCreate
 )
-from app.models.common_models import PyObjectId
+from app.models.common_models import BulkItemResult, PyObjectId, sparse_list_adapter
 
-from app.services import device_service, contact_service, reminder_service, entertainment_service
+from app.services import (
+    device_service, contact_service, reminder_service, entertainment_service, tts_service, config_sync_service,
+    device_snapshot_service, export_service
+)
+from app.mqtt.mqtt_client import mqtt_client
+from app.mqtt.rpc import DeviceRpcError, DeviceRpcTimeout
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+async def _queue_device_sync(device_db_id: PyObjectId, user_id: PyObjectId, contacts: Optional[List[ContactInDB]] = None,
+                             all_contacts: bool = False):
+    """
+    通讯录/提醒/娱乐内容变更后通知设备同步 (响应返回后执行)：只下发新的配置版本号，
+    设备据此请求增量 (见 config_sync_service)；设备离线时进入离线队列，多次修改只保留一条。
+    联系人变更先等待称呼语音合成，设备同步时即可拿到 nameAudioUrl。
+    """
+    try:
+        device = await device_service.get_device_by_id_and_user(device_id=device_db_id, user_id=user_id)
+        if device:
+            if contacts or all_contacts:
+                await contact_service.wait_for_name_audio(device, None if all_contacts else contacts)
+            await mqtt_client.send_command(device, "config_changed", {"version": device.configVersion}, collapse_key="config_changed")
+    except Exception as e:
+        logger.error("Failed to queue config_changed command: %s", e, extra={"device_id": str(device_db_id)})
 
 # --- 设备管理 ---
 class BindDeviceRequest(BaseModel):
@@ -42,10 +68,57 @@ async def bind_new_device(
     return created_device
 
 @router.get("/", response_model=List[DevicePublic], summary="获取当前用户绑定的所有设备列表")
-async def read_user_devices(current_user: UserInDB = Depends(get_current_active_user)):
+async def read_user_devices(
+    fields: Optional[FrozenSet[str]] = Depends(sparse_fields(DevicePublic)),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    if fields:
+        # 稀疏字段集：只从数据库读取所需字段，响应中也只包含这些字段
+        devices = await device_service.get_device_fields_by_user_id(current_user.id, fields)
+        return FastJSONResponse(sparse_list_adapter(DevicePublic, fields).dump_python(devices, mode="json", by_alias=True))
     devices = await device_service.get_devices_by_user_id(user_id=current_user.id)
     return devices
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    return any(tag.strip() in (etag, "*", f"W/{etag}") for tag in if_none_match.split(","))
+
+@router.get("/{device_db_id}/sos-alerts/export", summary="流式导出设备的全部 SOS 记录 (NDJSON/CSV)")
+async def export_device_sos_alerts(
+    device_db_id: PyObjectId = Path(..., description="设备ID"),
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="导出格式"),
+    gzip: bool = Query(False, description="是否 gzip 压缩 (下载 .gz 文件)"),
+    since: Optional[datetime] = Query(None, description="起始时间 (含)"),
+    until: Optional[datetime] = Query(None, description="截止时间 (不含)"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    if not await contact_service.check_device_ownership(device_db_id, current_user.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found.")
+    cursor = export_service.find_sos_alerts(device_db_id, since, until)
+    media_type, headers = export_service.export_headers("sos_alerts", format, gzip)
+    return StreamingResponse(export_service.stream_export(cursor, "sos_alerts", format, gzip), media_type=media_type, headers=headers)
+
+@router.get("/{device_db_id}/snapshot", response_model=DeviceSnapshot, summary="设备页聚合数据 (支持 If-None-Match)")
+async def read_device_snapshot(
+    response: Response,
+    device_db_id: PyObjectId = Path(..., description="设备的数据库ID"),
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """设备信息、通讯录、提醒、娱乐内容一次返回；ETag 未变时返回 304，不读取子集合"""
+    headers = {"Cache-Control": "private, no-cache"}
+    if if_none_match:
+        etag = await device_snapshot_service.get_device_etag(device_db_id, current_user.id)
+        if etag is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found.")
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={**headers, "ETag": etag})
+    result = await device_snapshot_service.get_device_snapshot(device_db_id, current_user.id)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found.")
+    etag, snapshot = result
+    response.headers.update({**headers, "ETag": etag})
+    return snapshot
+
 @router.get("/{device_db_id}", response_model=DevicePublic, summary="获取特定设备详情")
 async def read_device_detail(
     device_db_id: PyObjectId = Path(..., description="设备的数据库ID (非IMEI)"),
@@ -56,6 +129,28 @@ async def read_device_detail(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found or not owned by user.")
     return device
 
+class DeviceCommandRequest(BaseModel):
+    action: str = Field(..., pattern=r"^[a-z][a-z0-9_]{0,31}$", description="指令名，如 ring、locate")
+    params: Dict[str, Any] = Field(default_factory=dict)
+    timeout: float = Field(10, gt=0, le=30, description="等待设备确认的秒数")
+
+@router.post("/{device_db_id}/commands", summary="向设备发送指令并等待设备确认")
+async def send_device_command(
+    request_body: DeviceCommandRequest,
+    device_db_id: PyObjectId = Path(..., description="设备的数据库ID (非IMEI)"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    device = await device_service.get_device_by_id_and_user(device_id=device_db_id, user_id=current_user.id)
+    if not device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found or not owned by user.")
+    try:
+        response = await mqtt_client.call_device(device.deviceId, request_body.action, request_body.params, request_body.timeout)
+    except DeviceRpcTimeout:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Device did not respond in time.")
+    except DeviceRpcError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Device command failed: {e}")
+    return {"requestId": response.get("requestId"), "response": response}
+
 class UpdateNameRequest(BaseModel):
     new_name: str
 
@@ -84,6 +179,33 @@ async def unbind_user_device(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found or unbind failed.")
     return None
 
+class UpdateDialectRequest(BaseModel):
+    dialect: str
+
+@router.put("/{device_db_id}/dialect", response_model=DevicePublic, summary="设置老人使用的方言")
+async def update_device_dialect(
+    background_tasks: BackgroundTasks,
+    device_db_id: PyObjectId = Path(..., description="设备的数据库ID"),
+    request_body: UpdateDialectRequest = Body(...),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    if request_body.dialect not in tts_service.DIALECT_VOICES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported dialect, expected one of {sorted(tts_service.DIALECT_VOICES)}",
+        )
+    updated_device = await device_service.update_device_info(
+        device_id=device_db_id,
+        user_id=current_user.id,
+        device_update_data=DeviceUpdate(dialect=request_body.dialect)
+    )
+    if not updated_device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found or update failed.")
+    # 发音人变了，联系人称呼语音需要重新合成，设备下次同步时全量下发
+    updated_device.configVersion = await config_sync_service.record_config_reset(device_db_id)
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id, all_contacts=True)
+    return updated_device
+
 # --- 话费管理 ---
 @router.get("/{device_db_id}/billing", response_model=DevicePublic, summary="获取设备话费管理相关信息")
 async def get_device_billing_info(
@@ -121,6 +243,7 @@ async def update_auto_bill_request_setting(
 # --- 通讯录管理 (嵌套在设备下) ---
 @router.post("/{device_db_id}/contacts", response_model=ContactPublic, status_code=status.HTTP_201_CREATED, summary="为设备添加联系人")
 async def create_device_contact(
+    background_tasks: BackgroundTasks,
     device_db_id: PyObjectId = Path(..., description="设备ID"),
     contact_in: ContactCreate = Body(...),
     current_user: UserInDB = Depends(get_current_active_user)
@@ -131,6 +254,7 @@ async def create_device_contact(
     )
     if not created_contact:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to create contact.")
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id, [created_contact])
     return created_contact
 
 @router.get("/{device_db_id}/contacts", response_model=List[ContactPublic], summary="获取设备通讯录")
@@ -155,6 +279,7 @@ async def read_device_contact_detail(
 
 @router.put("/{device_db_id}/contacts/{contact_id}", response_model=ContactPublic, summary="更新联系人信息")
 async def update_device_contact(
+    background_tasks: BackgroundTasks,
     device_db_id: PyObjectId = Path(..., description="设备ID"),
     contact_id: PyObjectId = Path(..., description="联系人ID"),
     contact_update_data: ContactUpdate = Body(...),
@@ -165,11 +290,13 @@ async def update_device_contact(
     )
     if not updated_contact_db:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found or update failed.")
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id, [updated_contact_db])
     return await contact_service.get_contact_detail_for_device(device_db_id, contact_id, current_user.id)
 
 
 @router.delete("/{device_db_id}/contacts/{contact_id}", status_code=status.HTTP_204_NO_CONTENT, summary="删除联系人")
 async def delete_device_contact(
+    background_tasks: BackgroundTasks,
     device_db_id: PyObjectId = Path(..., description="设备ID"),
     contact_id: PyObjectId = Path(..., description="联系人ID"),
     current_user: UserInDB = Depends(get_current_active_user)
@@ -182,11 +309,48 @@ async def delete_device_contact(
     # success = await contact_service.delete_contact_for_device(...)
     # if not success: ...
     # 为了简化，假设service层会处理好，如果没找到或失败，router层不用再判断
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id)
     return None
 
+# 批量接口单次请求中每类操作的上限
+BULK_MAX_ITEMS = 500
+
+class ContactBulkCreateItem(ContactBase):
+    isSosIntent: bool = False
+
+class ContactBulkUpdateItem(ContactUpdate):
+    id: PyObjectId
+
+class ContactBulkRequest(BaseModel):
+    create: List[ContactBulkCreateItem] = Field(default_factory=list, max_length=BULK_MAX_ITEMS)
+    update: List[ContactBulkUpdateItem] = Field(default_factory=list, max_length=BULK_MAX_ITEMS)
+    delete: List[PyObjectId] = Field(default_factory=list, max_length=BULK_MAX_ITEMS)
+
+@router.post("/{device_db_id}/contacts/bulk", response_model=List[BulkItemResult], summary="批量新增/修改/删除联系人")
+async def bulk_write_device_contacts(
+    background_tasks: BackgroundTasks,
+    device_db_id: PyObjectId = Path(..., description="设备ID"),
+    bulk_in: ContactBulkRequest = Body(...),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """一次请求导入整个通讯录：单次 bulk_write 写入，逐条返回结果 (单条失败不影响其他条目)，SOS 号码最后统一联动一次"""
+    outcome = await contact_service.bulk_write_contacts(
+        device_db_id=device_db_id,
+        user_id=current_user.id,
+        creates=[ContactCreate(**item.model_dump(), deviceId=device_db_id) for item in bulk_in.create],
+        updates=[(item.id, ContactUpdate(**item.model_dump(exclude={"id"}, exclude_unset=True))) for item in bulk_in.update],
+        deletes=bulk_in.delete,
+    )
+    if outcome is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found.")
+    results, written_contacts = outcome
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id, written_contacts)
+    return results
+
 # --- 日程提醒管理 (嵌套在设备下) ---
 @router.post("/{device_db_id}/reminders", response_model=ReminderPublic, status_code=status.HTTP_201_CREATED, summary="为设备添加提醒")
 async def create_device_reminder(
+    background_tasks: BackgroundTasks,
     device_db_id: PyObjectId = Path(..., description="设备ID"),
     reminder_in: ReminderCreate = Body(...),
     current_user: UserInDB = Depends(get_current_active_user)
@@ -197,6 +361,7 @@ async def create_device_reminder(
     )
     if not created_reminder:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to create reminder.")
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id)
     return await reminder_service.get_reminder_detail_for_device(device_db_id, created_reminder.id, current_user.id)
 
 @router.get("/{device_db_id}/reminders", response_model=List[ReminderPublic], summary="获取设备提醒列表")
@@ -221,6 +386,7 @@ async def read_device_reminder_detail(
 
 @router.put("/{device_db_id}/reminders/{reminder_id}", response_model=ReminderPublic, summary="更新提醒信息")
 async def update_device_reminder(
+    background_tasks: BackgroundTasks,
     device_db_id: PyObjectId = Path(..., description="设备ID"),
     reminder_id: PyObjectId = Path(..., description="提醒ID"),
     reminder_update_data: ReminderUpdate = Body(...),
@@ -231,10 +397,12 @@ async def update_device_reminder(
     )
     if not updated_reminder_db:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reminder not found or update failed.")
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id)
     return await reminder_service.get_reminder_detail_for_device(device_db_id, reminder_id, current_user.id)
 
 @router.delete("/{device_db_id}/reminders/{reminder_id}", status_code=status.HTTP_204_NO_CONTENT, summary="删除提醒")
 async def delete_device_reminder(
+    background_tasks: BackgroundTasks,
     device_db_id: PyObjectId = Path(..., description="设备ID"),
     reminder_id: PyObjectId = Path(..., description="提醒ID"),
     current_user: UserInDB = Depends(get_current_active_user)
@@ -244,11 +412,40 @@ async def delete_device_reminder(
     )
     if not success:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reminder not found or delete failed.")
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id)
     return None
 
+class ReminderBulkUpdateItem(ReminderUpdate):
+    id: PyObjectId
+
+class ReminderBulkRequest(BaseModel):
+    create: List[ReminderBase] = Field(default_factory=list, max_length=BULK_MAX_ITEMS)
+    update: List[ReminderBulkUpdateItem] = Field(default_factory=list, max_length=BULK_MAX_ITEMS)
+    delete: List[PyObjectId] = Field(default_factory=list, max_length=BULK_MAX_ITEMS)
+
+@router.post("/{device_db_id}/reminders/bulk", response_model=List[BulkItemResult], summary="批量新增/修改/删除提醒")
+async def bulk_write_device_reminders(
+    background_tasks: BackgroundTasks,
+    device_db_id: PyObjectId = Path(..., description="设备ID"),
+    bulk_in: ReminderBulkRequest = Body(...),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    results = await reminder_service.bulk_write_reminders(
+        device_db_id=device_db_id,
+        user_id=current_user.id,
+        creates=[ReminderCreate(**item.model_dump(), deviceId=device_db_id) for item in bulk_in.create],
+        updates=[(item.id, ReminderUpdate(**item.model_dump(exclude={"id"}, exclude_unset=True))) for item in bulk_in.update],
+        deletes=bulk_in.delete,
+    )
+    if results is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found.")
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id)
+    return results
+
 # --- 娱乐内容管理 (嵌套在设备下) ---
 @router.post("/{device_db_id}/entertainment", response_model=EntertainmentItemPublic, status_code=status.HTTP_201_CREATED, summary="为设备添加娱乐内容")
 async def create_device_entertainment_item(
+    background_tasks: BackgroundTasks,
     device_db_id: PyObjectId = Path(..., description="设备ID"),
     item_in: EntertainmentItemCreate = Body(...),
     current_user: UserInDB = Depends(get_current_active_user)
@@ -259,6 +456,7 @@ async def create_device_entertainment_item(
     )
     if not created_item:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to create entertainment item.")
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id)
     return created_item
 
 @router.get("/{device_db_id}/entertainment", response_model=List[EntertainmentItemPublic], summary="获取设备娱乐播放列表")
@@ -270,6 +468,7 @@ async def read_device_entertainment_items(
 
 @router.delete("/{device_db_id}/entertainment/{item_id}", status_code=status.HTTP_204_NO_CONTENT, summary="删除娱乐内容项")
 async def delete_device_entertainment_item(
+    background_tasks: BackgroundTasks,
     device_db_id: PyObjectId = Path(..., description="设备ID"),
     item_id: PyObjectId = Path(..., description="娱乐项ID"),
     current_user: UserInDB = Depends(get_current_active_user)
@@ -279,6 +478,7 @@ async def delete_device_entertainment_item(
     )
     if not success:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Entertainment item not found or delete failed.")
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id)
     return None
     
 class ReminderStateUpdate(BaseModel):
@@ -286,6 +486,7 @@ class ReminderStateUpdate(BaseModel):
 
 @router.put("/{device_db_id}/reminders/{reminder_id}/state", response_model=ReminderPublic, summary="更新提醒的启用/禁用状态")
 async def update_device_reminder_state(
+    background_tasks: BackgroundTasks,
     device_db_id: PyObjectId = Path(..., description="设备ID"),
     reminder_id: PyObjectId = Path(..., description="提醒ID"),
     state_update: ReminderStateUpdate = Body(...),
@@ -304,4 +505,5 @@ async def update_device_reminder_state(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reminder not found or update failed.")
     
     # 返回完整的、包含repeatText的公开模型
+    background_tasks.add_task(_queue_device_sync, device_db_id, current_user.id)
     return await reminder_service.get_reminder_detail_for_device(device_db_id, reminder_id, current_user.id)
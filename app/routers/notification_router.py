@@ -1,11 +1,15 @@
 # app/routers/notification_router.py
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status, Path, Query
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from typing import FrozenSet, List, Literal, Optional
 
-from app.dependencies import get_current_active_user, get_current_user_id
+from app.core.json_codec import FastJSONResponse
+from app.dependencies import get_current_active_user, get_current_user_id, sparse_fields
+from app.models.common_models import sparse_list_adapter
 from app.models.user_models import UserInDB # 虽然没直接用，但依赖中可能需要
 from app.models.notification_models import NotificationPublic, PyObjectId
-from app.services import notification_service
+from app.services import contact_service, export_service, notification_service
 
 router = APIRouter()
 
@@ -13,13 +17,32 @@ router = APIRouter()
 async def read_user_notifications(
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(20, ge=1, le=100, description="每页返回的记录数"),
+    fields: Optional[FrozenSet[str]] = Depends(sparse_fields(NotificationPublic)),
     current_user_id: PyObjectId = Depends(get_current_user_id)
 ):
+    if fields:
+        notifications = await notification_service.get_notification_fields_for_user(current_user_id, fields, skip, limit)
+        return FastJSONResponse(sparse_list_adapter(NotificationPublic, fields).dump_python(notifications, mode="json", by_alias=True))
     notifications = await notification_service.get_notifications_for_user(
         user_id=current_user_id, skip=skip, limit=limit
     )
     return notifications
 
+@router.get("/export", summary="流式导出当前用户的全部通知 (NDJSON/CSV)")
+async def export_user_notifications(
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="导出格式"),
+    gzip: bool = Query(False, description="是否 gzip 压缩 (下载 .gz 文件)"),
+    device_id: Optional[PyObjectId] = Query(None, alias="deviceId", description="只导出该设备的通知"),
+    since: Optional[datetime] = Query(None, description="起始时间 (含)"),
+    until: Optional[datetime] = Query(None, description="截止时间 (不含)"),
+    current_user_id: PyObjectId = Depends(get_current_user_id)
+):
+    if device_id and not await contact_service.check_device_ownership(device_id, current_user_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found.")
+    cursor = export_service.find_notifications(current_user_id, device_id, since, until)
+    media_type, headers = export_service.export_headers("notifications", format, gzip)
+    return StreamingResponse(export_service.stream_export(cursor, "notifications", format, gzip), media_type=media_type, headers=headers)
+
 @router.get("/{notification_id}", response_model=NotificationPublic, summary="获取单条通知详情")
 async def read_single_notification(
     notification_id: PyObjectId = Path(..., description="通知的数据库ID"),
@@ -0,0 +1,25 @@
+# app/routers/tts_router.py
+# 合成语音下载 (设备播放 play_audio 指令中的 url)。
+# 文件名是内容的 sha256，内容不变，可被设备/CDN 永久缓存；FileResponse 支持 Range 断点续传。
+# 不需要登录：设备不持有用户令牌，文件名不可猜测且内容只是播报文本。
+import re
+
+from fastapi import APIRouter, HTTPException, Path, status
+from fastapi.responses import FileResponse
+
+from app.services.tts_service import AUDIO_MEDIA_TYPES, tts_cache
+
+router = APIRouter()
+
+FILENAME_PATTERN = r"^[0-9a-f]{64}\.(mp3|wav)$"
+_FILENAME_RE = re.compile(FILENAME_PATTERN)
+
+@router.get("/{filename}", summary="下载合成语音", response_class=FileResponse)
+async def get_tts_audio(filename: str = Path(..., pattern=FILENAME_PATTERN, description="音频文件名")):
+    if not _FILENAME_RE.match(filename) or not tts_cache.is_cached(filename):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Audio not found")
+    return FileResponse(
+        tts_cache.path_for(filename),
+        media_type=AUDIO_MEDIA_TYPES[filename.rsplit(".", 1)[1]],
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
@@ -0,0 +1,158 @@
+# app/services/config_sync_service.py
+# 设备配置 (通讯录/提醒/娱乐内容) 的版本化增量同步
+#
+#   - devices.configVersion 单调递增，每次增删改 $inc 1 得到该次变更的版本号
+#   - 每次变更写一条 device_config_changes 记录 {deviceId, version, entity, entityId, op, data}
+#     op: upsert (data 为设备端需要的字段) / delete / reset (如切换方言，需要全量重发)
+#   - 手表带上已同步的版本请求 (MQTT request_config_sync)，服务端只返回之后的变更；
+#     同一条目的多次变更只保留最后一次。以下情况返回全量快照：
+#       手表版本为0或高于服务端 (新设备/恢复出厂)、变更记录已过期 (TTL) 或中间缺号、
+#       变更条数超过 CONFIG_SYNC_MAX_CHANGES、期间有 reset
+#   - 两次变更的记录写入可能乱序 (先分到版本号的后写入)，增量只返回到第一个缺号之前，
+#     缺的部分手表下次同步时补上，不会漏掉
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from pymongo import ReturnDocument
+
+from app.core import metrics
+from app.core.config import settings
+from app.db.mongodb_utils import (
+    get_config_change_collection, get_contact_collection, get_device_collection,
+    get_entertainment_item_collection, get_reminder_collection,
+)
+from app.db.query_profiler import profiled
+from app.models.common_models import PyObjectId
+from app.models.device_models import DeviceInDB
+from app.services import tts_service
+
+logger = logging.getLogger(__name__)
+
+# 条目类型 -> 下发给设备的字段
+ENTITY_FIELDS = {
+    "contact": ("name", "phone", "dialectName"),
+    "reminder": ("content", "time", "repeat", "enabled"),
+    "entertainment": ("name", "url", "type"),
+}
+_COLLECTIONS = {
+    "contact": get_contact_collection,
+    "reminder": get_reminder_collection,
+    "entertainment": get_entertainment_item_collection,
+}
+
+
+def to_device_item(entity: str, item: Any) -> Dict[str, Any]:
+    """模型或数据库文档 -> 设备端条目 (只保留设备需要的字段)"""
+    doc = item if isinstance(item, dict) else item.model_dump(by_alias=True)
+    data = {field: doc.get(field) for field in ENTITY_FIELDS[entity]}
+    data["id"] = str(doc["_id"])
+    return jsonable_encoder(data)
+
+
+# (条目类型, 条目ID, op, upsert 后的条目)
+ConfigChange = Tuple[str, PyObjectId, str, Any]
+
+async def record_config_change(device_db_id: PyObjectId, entity: str, entity_id: PyObjectId,
+                               op: str, item: Any = None) -> int:
+    """记录一次变更并返回新的配置版本；item 为 upsert 后的条目 (模型或文档)"""
+    return await record_config_changes(device_db_id, [(entity, entity_id, op, item)])
+
+@profiled
+async def record_config_changes(device_db_id: PyObjectId, changes: Sequence[ConfigChange]) -> int:
+    """一次记录多条变更 (批量接口)：版本号一次 $inc 分配，变更记录一次 insert_many。返回新的配置版本"""
+    if not changes:
+        return 0
+    device = await get_device_collection().find_one_and_update(
+        {"_id": str(device_db_id)},
+        {"$inc": {"configVersion": len(changes)}},
+        projection={"configVersion": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if device is None:
+        return 0
+    version = device["configVersion"]
+    first_version = version - len(changes) + 1
+    now = datetime.utcnow()
+    await get_config_change_collection().insert_many([
+        {
+            "_id": f"{device_db_id}:{first_version + offset}",
+            "deviceId": str(device_db_id),
+            "version": first_version + offset,
+            "entity": entity,
+            "entityId": str(entity_id),
+            "op": op,
+            "data": to_device_item(entity, item) if op == "upsert" else None,
+            "createdAt": now,
+        }
+        for offset, (entity, entity_id, op, item) in enumerate(changes)
+    ], ordered=False)
+    return version
+
+async def record_config_reset(device_db_id: PyObjectId) -> int:
+    """标记此前的配置需要全量重发 (如切换方言后所有称呼语音都变了)"""
+    return await record_config_change(device_db_id, "device", device_db_id, "reset")
+
+
+def _device_data(entity: str, data: Optional[Dict[str, Any]], device: DeviceInDB) -> Optional[Dict[str, Any]]:
+    """联系人条目在下发时补上称呼语音URL (已缓存时)；变更记录中不保存，设备方言变化后仍然正确"""
+    if entity == "contact" and data:
+        text = tts_service.contact_name_text(data["name"], data.get("dialectName"))
+        data = {**data, "nameAudioUrl": tts_service.tts_cache.cached_url(text, tts_service.voice_for_dialect(device.dialect))}
+    return data
+
+def _to_device_change(change: Dict[str, Any], device: DeviceInDB) -> Dict[str, Any]:
+    if change["op"] == "delete":
+        return {"entity": change["entity"], "op": "delete", "id": change["entityId"]}
+    return {"entity": change["entity"], "op": change["op"], "data": _device_data(change["entity"], change["data"], device)}
+
+@profiled
+async def build_config_snapshot(device: DeviceInDB) -> Dict[str, Any]:
+    # 先取版本再读条目：读取期间发生的变更会在下次增量中重复下发，upsert/delete 幂等，不影响结果
+    doc = await get_device_collection().find_one({"_id": str(device.id)}, projection={"configVersion": 1})
+    version = (doc or {}).get("configVersion", 0)
+    items: Dict[str, List[Dict[str, Any]]] = {}
+    for entity, get_collection in _COLLECTIONS.items():
+        fields = {field: 1 for field in ENTITY_FIELDS[entity]}
+        docs = await get_collection().find({"deviceId": str(device.id)}, projection=fields).to_list(length=None)
+        items[entity] = [_device_data(entity, to_device_item(entity, doc), device) for doc in docs]
+    return {"version": version, "full": True, **items}
+
+@profiled
+async def get_config_delta(device: DeviceInDB, since_version: int) -> Dict[str, Any]:
+    """手表已同步到 since_version，返回之后的增量，或全量快照 (见模块说明)"""
+    current = device.configVersion
+    if since_version == current:
+        metrics.CONFIG_SYNC_RESPONSES.labels("current").inc()
+        return {"version": current, "full": False, "changes": []}
+    if since_version <= 0 or since_version > current:
+        metrics.CONFIG_SYNC_RESPONSES.labels("snapshot").inc()
+        return await build_config_snapshot(device)
+
+    limit = settings.CONFIG_SYNC_MAX_CHANGES
+    cursor = get_config_change_collection().find(
+        {"deviceId": str(device.id), "version": {"$gt": since_version}}
+    ).sort("version", 1).limit(limit + 1)
+    changes = await cursor.to_list(length=limit + 1)
+    if (not changes or changes[0]["version"] != since_version + 1 or len(changes) > limit
+            or any(change["op"] == "reset" for change in changes)):
+        metrics.CONFIG_SYNC_RESPONSES.labels("snapshot").inc()
+        return await build_config_snapshot(device)
+
+    # 只返回连续的部分；同一条目只保留最后一次变更 (按最后一次出现的顺序)
+    latest: Dict[Any, Dict[str, Any]] = {}
+    version = since_version
+    for change in changes:
+        if change["version"] != version + 1:
+            break
+        version = change["version"]
+        key = (change["entity"], change["entityId"])
+        latest.pop(key, None)
+        latest[key] = change
+    metrics.CONFIG_SYNC_RESPONSES.labels("delta").inc()
+    return {
+        "version": version,
+        "full": False,
+        "changes": [_to_device_change(change, device) for change in latest.values()],
+    }
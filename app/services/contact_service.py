@@ -1,23 +1,79 @@
 # app/services/contact_service.py
 
-from typing import List, Optional
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
 from datetime import datetime, timezone
 from fastapi.encoders import jsonable_encoder
+from pymongo import DeleteOne, InsertOne, UpdateOne
 
+from app.db.bulk_utils import bulk_write_unordered, reject_bulk_target
 from app.db.mongodb_utils import get_contact_collection, get_device_collection
-from app.models.common_models import PyObjectId
-from app.models.contact_models import ContactCreate, ContactInDB, ContactUpdate, ContactPublic
+from app.db.query_profiler import profiled
+from app.models.common_models import BulkItemResult, PyObjectId
+from app.models.contact_models import ContactCreate, ContactInDB, ContactUpdate, ContactPublic, CONTACT_IN_DB_LIST_ADAPTER
+from app.core.config import settings
 from app.models.device_models import DeviceInDB, DeviceUpdate # <--【修正】导入 DeviceUpdate
 from app.services import device_service # 导入device_service
+from app.services import config_sync_service, tts_service
+from app.services.config_sync_service import ConfigChange
 
+logger = logging.getLogger(__name__)
+
+# 称呼语音合成完成后补记配置变更的任务 (保留引用，避免被垃圾回收)
+_audio_ready_tasks: Set[asyncio.Task] = set()
+
+@profiled
 async def check_device_ownership(device_db_id: PyObjectId, user_id: PyObjectId) -> bool:
     """辅助函数：检查设备是否属于当前用户"""
     device_collection = get_device_collection()
     device = await device_collection.find_one({"_id": str(device_db_id), "userId": str(user_id)})
     return device is not None
 
+@profiled
+async def _get_owned_device_dialect(device_db_id: PyObjectId, user_id: PyObjectId) -> Optional[str]:
+    """同 check_device_ownership，顺带取出设备方言；设备不属于该用户时返回 None"""
+    device = await get_device_collection().find_one(
+        {"_id": str(device_db_id), "userId": str(user_id)}, projection={"dialect": 1}
+    )
+    return (device.get("dialect") or "mandarin") if device else None
+
+def _submit_name_audio(contact: ContactInDB, dialect: Optional[str], record_when_ready: bool = True) -> asyncio.Future:
+    """
+    把联系人称呼语音加入后台合成队列 (不等待)。
+    合成完成时联系人的 nameAudioUrl 从空变为有值，补记一次变更 (配置版本加1)：
+    设备增量同步和快照 ETag 都依赖版本号感知变化
+    """
+    future = tts_service.tts_queue.submit(
+        tts_service.contact_name_text(contact.name, contact.dialectName), tts_service.voice_for_dialect(dialect)
+    )
+    if record_when_ready and not future.done():
+        future.add_done_callback(lambda done: done.result() and _spawn_audio_ready(contact))
+    return future
+
+def _spawn_audio_ready(contact: ContactInDB) -> None:
+    task = asyncio.create_task(_record_name_audio_ready(contact))
+    _audio_ready_tasks.add(task)
+    task.add_done_callback(_audio_ready_tasks.discard)
+
+async def _record_name_audio_ready(contact: ContactInDB) -> None:
+    try:
+        # 重新读取：合成期间联系人可能又被修改或删除
+        contact_doc = await get_contact_collection().find_one({"_id": str(contact.id)})
+        if contact_doc:
+            await config_sync_service.record_config_change(contact.deviceId, "contact", contact.id, "upsert", contact_doc)
+    except Exception as e:
+        logger.warning("Failed to record name audio change: %s", e, extra={"contact_id": str(contact.id)})
+
+def _cached_name_audio_url(contact: ContactInDB, dialect: Optional[str]) -> Optional[str]:
+    return tts_service.tts_cache.cached_url(
+        tts_service.contact_name_text(contact.name, contact.dialectName), tts_service.voice_for_dialect(dialect)
+    )
+
+@profiled
 async def create_contact_for_device(device_db_id: PyObjectId, user_id: PyObjectId, contact_in: ContactCreate) -> Optional[ContactInDB]:
-    if not await check_device_ownership(device_db_id, user_id):
+    dialect = await _get_owned_device_dialect(device_db_id, user_id)
+    if dialect is None:
         return None
 
     contact_collection = get_contact_collection()
@@ -31,36 +87,45 @@ async def create_contact_for_device(device_db_id: PyObjectId, user_id: PyObjectI
     created_doc = await contact_collection.find_one({"_id": result.inserted_id})
     
     if created_doc:
-        created_contact_db = ContactInDB(**created_doc)
+        created_contact_db = ContactInDB.model_validate(created_doc)
+        _submit_name_audio(created_contact_db, dialect)
+        await config_sync_service.record_config_change(device_db_id, "contact", created_contact_db.id, "upsert", created_contact_db)
         if contact_in.isSosIntent and created_contact_db.phone:
             await device_service.update_device_info(
                 device_id=device_db_id,
                 user_id=user_id,
                 device_update_data=DeviceUpdate(sosContactPhone=created_contact_db.phone)
             )
-            print(f"Device {device_db_id} SOS contact phone updated to {created_contact_db.phone} on contact creation.")
+            logger.info("SOS contact phone updated on contact creation", extra={"device_id": str(device_db_id), "contact_id": str(created_contact_db.id)})
         return created_contact_db
     return None
 
+@profiled
 async def get_contacts_for_device(device_db_id: PyObjectId, user_id: PyObjectId) -> List[ContactPublic]:
     if not await check_device_ownership(device_db_id, user_id):
         return []
 
     contact_collection = get_contact_collection()
     device = await device_service.get_device_by_id_and_user(device_id=device_db_id, user_id=user_id)
-    sos_phone = device.sosContactPhone if device else None
 
     contacts_cursor = contact_collection.find({"deviceId": str(device_db_id)})
-    public_contacts = []
-    async for doc in contacts_cursor:
-        contact_db = ContactInDB(**doc)
-        is_sos = (sos_phone == contact_db.phone) if sos_phone else False
-        
-        contact_public_data = contact_db.model_dump()
-        contact_public_data["isSosForDisplay"] = is_sos
-        public_contacts.append(ContactPublic(**contact_public_data))
-    return public_contacts
+    contacts_db = CONTACT_IN_DB_LIST_ADAPTER.validate_python(await contacts_cursor.to_list(length=None))
+    return to_public_contacts(contacts_db, device)
+
+def to_public_contacts(contacts_db: List[ContactInDB], device: Optional[DeviceInDB]) -> List[ContactPublic]:
+    """填充 isSosForDisplay / nameAudioUrl；ContactInDB 已经过校验，转换为Public模型时走 construct_from 快速路径"""
+    sos_phone = device.sosContactPhone if device else None
+    dialect = device.dialect if device else None
+    return [
+        ContactPublic.construct_from(
+            contact_db,
+            isSosForDisplay=(sos_phone == contact_db.phone) if sos_phone else False,
+            nameAudioUrl=_cached_name_audio_url(contact_db, dialect),
+        )
+        for contact_db in contacts_db
+    ]
 
+@profiled
 async def get_contact_detail_for_device(device_db_id: PyObjectId, contact_id: PyObjectId, user_id: PyObjectId) -> Optional[ContactPublic]:
     if not await check_device_ownership(device_db_id, user_id):
         return None
@@ -68,24 +133,25 @@ async def get_contact_detail_for_device(device_db_id: PyObjectId, contact_id: Py
     contact_collection = get_contact_collection()
     contact_doc = await contact_collection.find_one({"_id": str(contact_id), "deviceId": str(device_db_id)})
     if contact_doc:
-        contact_db = ContactInDB(**contact_doc)
+        contact_db = ContactInDB.model_validate(contact_doc)
         device = await device_service.get_device_by_id_and_user(device_id=device_db_id, user_id=user_id)
         sos_phone = device.sosContactPhone if device else None
         is_sos = (sos_phone == contact_db.phone) if sos_phone else False
+        name_audio_url = _cached_name_audio_url(contact_db, device.dialect if device else None)
         
-        contact_public_data = contact_db.model_dump()
-        contact_public_data["isSosForDisplay"] = is_sos
-        return ContactPublic(**contact_public_data)
+        return ContactPublic.construct_from(contact_db, isSosForDisplay=is_sos, nameAudioUrl=name_audio_url)
     return None
 
 
+@profiled
 async def update_contact_for_device(
     device_db_id: PyObjectId, 
     contact_id: PyObjectId, 
     user_id: PyObjectId, 
     contact_update_data: ContactUpdate
 ) -> Optional[ContactInDB]:
-    if not await check_device_ownership(device_db_id, user_id):
+    dialect = await _get_owned_device_dialect(device_db_id, user_id)
+    if dialect is None:
         return None
 
     contact_collection = get_contact_collection()
@@ -96,7 +162,7 @@ async def update_contact_for_device(
     original_contact_doc = await contact_collection.find_one({"_id": str(contact_id), "deviceId": str(device_db_id)})
     if not original_contact_doc:
         return None
-    original_contact = ContactInDB(**original_contact_doc)
+    original_contact = ContactInDB.model_validate(original_contact_doc)
 
     if update_doc:
         update_doc["updatedAt"] = datetime.now(timezone.utc)
@@ -123,9 +189,17 @@ async def update_contact_for_device(
             )
 
     updated_contact_doc = await contact_collection.find_one({"_id": str(contact_id), "deviceId": str(device_db_id)})
-    return ContactInDB(**updated_contact_doc) if updated_contact_doc else None
+    if not updated_contact_doc:
+        return None
+    updated_contact = ContactInDB.model_validate(updated_contact_doc)
+    if "name" in update_doc or "dialectName" in update_doc:
+        _submit_name_audio(updated_contact, dialect)
+    if update_doc:
+        await config_sync_service.record_config_change(device_db_id, "contact", contact_id, "upsert", updated_contact)
+    return updated_contact
 
 
+@profiled
 async def delete_contact_for_device(device_db_id: PyObjectId, contact_id: PyObjectId, user_id: PyObjectId) -> bool:
     if not await check_device_ownership(device_db_id, user_id):
         return False
@@ -138,8 +212,131 @@ async def delete_contact_for_device(device_db_id: PyObjectId, contact_id: PyObje
                 user_id=user_id,
                 device_update_data=DeviceUpdate(sosContactPhone=None)
             )
-            print(f"Device {device_db_id} SOS contact phone cleared as contact {contact_id} was deleted.")
+            logger.info("SOS contact phone cleared as contact was deleted", extra={"device_id": str(device_db_id), "contact_id": str(contact_id)})
 
     contact_collection = get_contact_collection()
     result = await contact_collection.delete_one({"_id": str(contact_id), "deviceId": str(device_db_id)})
-    return result.deleted_count == 1
+    if result.deleted_count != 1:
+        return False
+    await config_sync_service.record_config_change(device_db_id, "contact", contact_id, "delete")
+    return True
+
+@profiled
+async def wait_for_name_audio(device: DeviceInDB, contacts: Optional[List[ContactInDB]] = None,
+                              wait_seconds: Optional[float] = None) -> None:
+    """
+    确保联系人称呼语音已合成 (未合成的加入后台队列)，最多等待 wait_seconds，
+    之后再通知设备同步，下发的条目即可带上 nameAudioUrl。contacts 为空时处理设备的全部联系人 (如切换方言后)。
+    """
+    # 指定的联系人在创建/修改时已登记过合成完成后的变更记录，这里只等待
+    record_when_ready = contacts is None
+    if contacts is None:
+        contacts_cursor = get_contact_collection().find({"deviceId": str(device.id)})
+        contacts = CONTACT_IN_DB_LIST_ADAPTER.validate_python(await contacts_cursor.to_list(length=None))
+    futures = (_submit_name_audio(contact, device.dialect, record_when_ready) for contact in contacts)
+    pending = [future for future in futures if not future.done()]
+    if pending:
+        timeout = settings.TTS_CONTACT_AUDIO_WAIT_SECONDS if wait_seconds is None else wait_seconds
+        await asyncio.wait(pending, timeout=timeout)
+
+@profiled
+async def bulk_write_contacts(
+    device_db_id: PyObjectId,
+    user_id: PyObjectId,
+    creates: List[ContactCreate],
+    updates: List[Tuple[PyObjectId, ContactUpdate]],
+    deletes: List[PyObjectId],
+) -> Optional[Tuple[List[BulkItemResult], List[ContactInDB]]]:
+    """
+    批量新增/修改/删除联系人 (如导入通讯录)：归属校验一次，修改/删除前一次 $in 读取原文档，
+    一次 unordered bulk_write 写入，配置变更一次记录，SOS 号码联动在最后统一处理一次。
+    返回 (每个条目的结果, 需要合成称呼语音的联系人)；设备不属于该用户时返回 None
+    """
+    device_doc = await get_device_collection().find_one(
+        {"_id": str(device_db_id), "userId": str(user_id)}, projection={"dialect": 1, "sosContactPhone": 1}
+    )
+    if not device_doc:
+        return None
+    dialect = device_doc.get("dialect") or "mandarin"
+    contact_collection = get_contact_collection()
+
+    existing: Dict[str, Dict[str, Any]] = {}
+    target_ids = [str(contact_id) for contact_id, _ in updates] + [str(contact_id) for contact_id in deletes]
+    if target_ids:
+        cursor = contact_collection.find({"_id": {"$in": target_ids}, "deviceId": str(device_db_id)})
+        existing = {doc["_id"]: doc for doc in await cursor.to_list(length=None)}
+
+    # (结果, 写操作, 写入成功后的配置变更, 写入后的联系人)
+    planned: List[Tuple[BulkItemResult, Any, ConfigChange, Optional[ContactInDB]]] = []
+    results: List[BulkItemResult] = []
+    seen_ids: Set[str] = set()
+    now = datetime.now(timezone.utc)
+
+    for index, contact_in in enumerate(creates):
+        contact_db = ContactInDB(**contact_in.model_dump(exclude={"isSosIntent", "deviceId"}), deviceId=device_db_id)
+        result = BulkItemResult(op="create", index=index, id=contact_db.id, status="created")
+        planned.append((result, InsertOne(jsonable_encoder(contact_db)), ("contact", contact_db.id, "upsert", contact_db), contact_db))
+
+    for index, (contact_id, contact_update) in enumerate(updates):
+        original = existing.get(str(contact_id))
+        rejected = reject_bulk_target("update", index, contact_id, original, seen_ids)
+        if rejected:
+            results.append(rejected)
+            continue
+        fields = contact_update.model_dump(exclude_unset=True, exclude={"isSosIntent"})
+        update_doc = jsonable_encoder({k: v for k, v in fields.items() if v is not None})
+        update_doc["updatedAt"] = now
+        updated = ContactInDB.model_validate({**original, **update_doc})
+        result = BulkItemResult(op="update", index=index, id=contact_id, status="updated")
+        request = UpdateOne({"_id": str(contact_id), "deviceId": str(device_db_id)}, {"$set": update_doc})
+        planned.append((result, request, ("contact", contact_id, "upsert", updated), updated))
+
+    for index, contact_id in enumerate(deletes):
+        original = existing.get(str(contact_id))
+        rejected = reject_bulk_target("delete", index, contact_id, original, seen_ids)
+        if rejected:
+            results.append(rejected)
+            continue
+        result = BulkItemResult(op="delete", index=index, id=contact_id, status="deleted")
+        planned.append((result, DeleteOne({"_id": str(contact_id), "deviceId": str(device_db_id)}), ("contact", contact_id, "delete", None), None))
+
+    errors = await bulk_write_unordered(contact_collection, [request for _, request, _, _ in planned])
+    changes: List[ConfigChange] = []
+    written: List[ContactInDB] = []
+    for position, (result, _, change, contact) in enumerate(planned):
+        if position in errors:
+            result.status, result.error = "error", errors[position]
+        else:
+            changes.append(change)
+            if contact is not None:
+                written.append(contact)
+        results.append(result)
+    await config_sync_service.record_config_changes(device_db_id, changes)
+
+    # SOS 联动：按 新增 -> 修改 -> 删除 的顺序推导最终的 SOS 号码，只写一次
+    succeeded = {(result.op, result.index) for result in results if result.status in ("created", "updated", "deleted")}
+    sos_phone = current_sos_phone = device_doc.get("sosContactPhone")
+    for index, contact_in in enumerate(creates):
+        if ("create", index) in succeeded and contact_in.isSosIntent and contact_in.phone:
+            sos_phone = contact_in.phone
+    for index, (contact_id, contact_update) in enumerate(updates):
+        if ("update", index) not in succeeded:
+            continue
+        original_phone = existing[str(contact_id)].get("phone")
+        if contact_update.isSosIntent is True:
+            sos_phone = contact_update.phone or original_phone
+        elif contact_update.isSosIntent is False and sos_phone == original_phone:
+            sos_phone = None
+    for index, contact_id in enumerate(deletes):
+        if ("delete", index) in succeeded and sos_phone == existing[str(contact_id)].get("phone"):
+            sos_phone = None
+    if sos_phone != current_sos_phone:
+        await get_device_collection().update_one(
+            {"_id": str(device_db_id)}, {"$set": {"sosContactPhone": sos_phone, "updatedAt": now}}
+        )
+        logger.info("SOS contact phone updated by bulk contact write", extra={"device_id": str(device_db_id)})
+
+    for contact in written:
+        _submit_name_audio(contact, dialect)
+    results.sort(key=lambda result: (("create", "update", "delete").index(result.op), result.index))
+    return results, written
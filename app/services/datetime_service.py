@@ -0,0 +1,39 @@
+# app/services/datetime_service.py
+# 报时等场景使用的时间文本 (设备所在地统一按北京时间)
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# 中国不实行夏令时，固定 UTC+8，避免依赖系统 tzdata
+BEIJING_TZ = timezone(timedelta(hours=8), name="Asia/Shanghai")
+
+_WEEKDAYS = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
+
+def _period_of_day(hour: int) -> str:
+    if hour < 6:
+        return "凌晨"
+    if hour < 12:
+        return "上午"
+    if hour < 13:
+        return "中午"
+    if hour < 18:
+        return "下午"
+    return "晚上"
+
+def _clock_text(hour: int, minute: int) -> str:
+    minute_text = "整" if minute == 0 else f"{minute}分"
+    return f"{_period_of_day(hour)}{hour % 12 or 12}点{minute_text}"
+
+def get_formatted_time_string(now: Optional[datetime] = None) -> str:
+    """例如: 现在是北京时间5月1日星期三，上午8点30分"""
+    now = (now or datetime.now(timezone.utc)).astimezone(BEIJING_TZ)
+    return f"现在是北京时间{now.month}月{now.day}日{_WEEKDAYS[now.weekday()]}，{_clock_text(now.hour, now.minute)}"
+
+def minute_of_day_announcement(minute_of_day: int) -> str:
+    """一天中第 minute_of_day 分钟的语音报时文本，例如: 现在是北京时间上午8点30分"""
+    hour, minute = divmod(minute_of_day, 60)
+    return f"现在是北京时间{_clock_text(hour, minute)}"
+
+def get_time_announcement(now: Optional[datetime] = None) -> str:
+    """语音报时文本只包含时刻，一天只有1440种，可预先合成并缓存 (见 tts_service)"""
+    now = (now or datetime.now(timezone.utc)).astimezone(BEIJING_TZ)
+    return minute_of_day_announcement(now.hour * 60 + now.minute)
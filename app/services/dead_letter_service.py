@@ -0,0 +1,132 @@
+# app/services/dead_letter_service.py
+# MQTT 事件死信：处理函数抛出异常的事件连同错误信息写入 mqtt_dead_letters 集合，
+# 由 AsyncMQTTClient 的后台任务按指数退避分批重试 (见 mqtt_client._dead_letter_worker)。
+#
+# 状态流转: pending -> retrying -> resolved
+#                          \-> pending (下次重试) / exhausted (达到 DEAD_LETTER_MAX_ATTEMPTS)
+# 校验类错误 (ValueError/TypeError/KeyError，含 pydantic ValidationError) 重试也不会成功，直接记为 exhausted，只供排查。
+# 领取记录使用 find_one_and_update 原子地改为 retrying，多个 worker 不会重复处理；
+# 处于 retrying 超过 RETRY_LEASE 的记录 (worker 中途退出) 会被重新领取。
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from app.core.config import settings
+from app.db.mongodb_utils import get_dead_letter_collection
+from app.db.query_profiler import profiled
+from app.models.common_models import PyObjectId
+from app.models.dead_letter_models import DeadLetterInDB, DEAD_LETTER_IN_DB_LIST_ADAPTER
+
+logger = logging.getLogger(__name__)
+
+RETRY_LEASE = timedelta(minutes=5)
+NON_RETRYABLE_ERRORS = (ValueError, TypeError, KeyError)
+
+def is_retryable(exc: BaseException) -> bool:
+    return not isinstance(exc, NON_RETRYABLE_ERRORS)
+
+def backoff_delay(attempts: int) -> float:
+    """第 attempts 次重试失败后的等待秒数：指数增长，封顶 DEAD_LETTER_MAX_DELAY_SECONDS，±20% 抖动避免同时重试"""
+    delay = min(settings.DEAD_LETTER_BASE_DELAY_SECONDS * 2 ** attempts, settings.DEAD_LETTER_MAX_DELAY_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+def build_dead_letter(event_type: str, device_imei: str, payload: Any, exc: BaseException) -> DeadLetterInDB:
+    retryable = is_retryable(exc)
+    return DeadLetterInDB(
+        eventType=event_type,
+        deviceImei=device_imei,
+        payload=payload,
+        errorType=type(exc).__name__,
+        error=str(exc)[:2000],
+        status="pending" if retryable else "exhausted",
+        nextAttemptAt=datetime.utcnow() + timedelta(seconds=backoff_delay(0)) if retryable else None,
+    )
+
+@profiled
+async def save_dead_letter(dead_letter: DeadLetterInDB) -> DeadLetterInDB:
+    # 保留 datetime 类型 (不走 jsonable_encoder)，nextAttemptAt 需要按时间比较
+    await get_dead_letter_collection().insert_one(dead_letter.model_dump(by_alias=True))
+    return dead_letter
+
+@profiled
+async def claim_due_dead_letters(limit: int) -> List[DeadLetterInDB]:
+    """领取最多 limit 条到期的死信 (原子地标记为 retrying 并增加 attempts)"""
+    collection = get_dead_letter_collection()
+    now = datetime.utcnow()
+    claimed: List[DeadLetterInDB] = []
+    for _ in range(limit):
+        doc = await collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "nextAttemptAt": {"$lte": now}},
+                {"status": "retrying", "lastAttemptAt": {"$lte": now - RETRY_LEASE}},
+            ]},
+            {"$set": {"status": "retrying", "lastAttemptAt": now, "updatedAt": now}, "$inc": {"attempts": 1}},
+            sort=[("nextAttemptAt", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            break
+        claimed.append(DeadLetterInDB.model_validate(doc))
+    return claimed
+
+@profiled
+async def mark_dead_letter_resolved(dead_letter_id: PyObjectId) -> None:
+    now = datetime.utcnow()
+    await get_dead_letter_collection().update_one(
+        {"_id": str(dead_letter_id)},
+        {"$set": {"status": "resolved", "resolvedAt": now, "nextAttemptAt": None, "updatedAt": now}},
+    )
+
+@profiled
+async def mark_dead_letter_failed(dead_letter: DeadLetterInDB, exc: BaseException) -> str:
+    """重试失败：安排下一次重试，或在达到上限/不可重试时标记为 exhausted。返回新状态"""
+    now = datetime.utcnow()
+    exhausted = not is_retryable(exc) or dead_letter.attempts >= settings.DEAD_LETTER_MAX_ATTEMPTS
+    update = {
+        "status": "exhausted" if exhausted else "pending",
+        "errorType": type(exc).__name__,
+        "error": str(exc)[:2000],
+        "nextAttemptAt": None if exhausted else now + timedelta(seconds=backoff_delay(dead_letter.attempts)),
+        "updatedAt": now,
+    }
+    await get_dead_letter_collection().update_one({"_id": str(dead_letter.id)}, {"$set": update})
+    return update["status"]
+
+@profiled
+async def get_dead_letters(status: Optional[str] = None, event_type: Optional[str] = None,
+                           skip: int = 0, limit: int = 50) -> List[DeadLetterInDB]:
+    query: Dict[str, Any] = {}
+    if status:
+        query["status"] = status
+    if event_type:
+        query["eventType"] = event_type
+    cursor = get_dead_letter_collection().find(query).sort("createdAt", -1).skip(skip).limit(limit)
+    return DEAD_LETTER_IN_DB_LIST_ADAPTER.validate_python(await cursor.to_list(length=limit))
+
+@profiled
+async def get_dead_letter_by_id(dead_letter_id: PyObjectId) -> Optional[DeadLetterInDB]:
+    doc = await get_dead_letter_collection().find_one({"_id": str(dead_letter_id)})
+    return DeadLetterInDB.model_validate(doc) if doc else None
+
+@profiled
+async def requeue_dead_letters(dead_letter_id: Optional[PyObjectId] = None, status: Optional[str] = "exhausted",
+                               event_type: Optional[str] = None) -> int:
+    """
+    重新排队，后台任务会在下一轮立即重试 (attempts 清零)。
+    指定 dead_letter_id 时只处理该条 (resolved 以外的任何状态)；否则按 status/event_type 批量处理。
+    """
+    query: Dict[str, Any] = {}
+    if dead_letter_id:
+        query = {"_id": str(dead_letter_id), "status": {"$ne": "resolved"}}
+    else:
+        query["status"] = status or {"$ne": "resolved"}
+        if event_type:
+            query["eventType"] = event_type
+    now = datetime.utcnow()
+    result = await get_dead_letter_collection().update_many(
+        query, {"$set": {"status": "pending", "attempts": 0, "nextAttemptAt": now, "updatedAt": now}}
+    )
+    return result.modified_count
@@ -1,18 +1,21 @@
 # app/services/device_service.py
-from typing import List, Optional
+import logging
+from typing import Any, AsyncIterator, Dict, FrozenSet, List, Optional
 from datetime import datetime, timezone
 from fastapi.encoders import jsonable_encoder
 
-from app.db.mongodb_utils import (
-    get_device_collection,
-    get_contact_collection,
-    get_reminder_collection,
-    get_entertainment_item_collection
+from app.db.mongodb_utils import get_device_collection
+from app.db.query_profiler import profiled
+from app.models.common_models import PyObjectId, sparse_list_adapter
+from app.models.device_models import (
+    DeviceCreate, DeviceInDB, DevicePublic, DeviceUpdate, DeviceStatusUpdate, DEVICE_IN_DB_LIST_ADAPTER
 )
-from app.models.common_models import PyObjectId
-from app.models.device_models import DeviceCreate, DeviceInDB, DeviceUpdate, DeviceStatusUpdate
 from app.models.user_models import UserInDB
+from app.services import device_unbind_service
 
+logger = logging.getLogger(__name__)
+
+@profiled
 async def create_device_for_user(user_id: PyObjectId, device_imei: str, initial_name: Optional[str] = None) -> Optional[DeviceInDB]:
     device_collection = get_device_collection()
     existing_device_by_imei = await device_collection.find_one({"deviceId": device_imei})
@@ -20,7 +23,7 @@ async def create_device_for_user(user_id: PyObjectId, device_imei: str, initial_
         # 如果设备已存在，检查是否属于当前用户
         if str(existing_device_by_imei.get("userId")) == str(user_id):
              # 已被当前用户绑定，直接返回该设备信息
-             return DeviceInDB(**existing_device_by_imei)
+             return DeviceInDB.model_validate(existing_device_by_imei)
         else:
             # 已被其他用户绑定
             return None
@@ -38,28 +41,43 @@ async def create_device_for_user(user_id: PyObjectId, device_imei: str, initial_
     
     created_doc = await device_collection.find_one({"_id": result.inserted_id})
     if created_doc:
-        return DeviceInDB(**created_doc)
+        return DeviceInDB.model_validate(created_doc)
     return None
 
+@profiled
 async def get_devices_by_user_id(user_id: PyObjectId) -> List[DeviceInDB]:
     device_collection = get_device_collection()
     devices_cursor = device_collection.find({"userId": str(user_id)})
-    return [DeviceInDB(**doc) async for doc in devices_cursor]
-
+    # 整批交给缓存的 TypeAdapter 校验，避免逐条构造模型的Python层开销
+    return DEVICE_IN_DB_LIST_ADAPTER.validate_python(await devices_cursor.to_list(length=None))
+
+@profiled
+async def get_device_fields_by_user_id(user_id: PyObjectId, fields: FrozenSet[str]) -> List[Any]:
+    """同 get_devices_by_user_id，但只读取并返回 fields 中的字段 (DevicePublic 的稀疏字段集)"""
+    projection = {"_id": 1, **{field: 1 for field in fields if field != "id"}}
+    devices_cursor = get_device_collection().find({"userId": str(user_id)}, projection=projection)
+    docs = await devices_cursor.to_list(length=None)
+    for doc in docs:
+        doc["id"] = doc.pop("_id")
+    return sparse_list_adapter(DevicePublic, fields).validate_python(docs)
+
+@profiled
 async def get_device_by_id_and_user(device_id: PyObjectId, user_id: PyObjectId) -> Optional[DeviceInDB]:
     device_collection = get_device_collection()
     device_doc = await device_collection.find_one({"_id": str(device_id), "userId": str(user_id)})
     if device_doc:
-        return DeviceInDB(**device_doc)
+        return DeviceInDB.model_validate(device_doc)
     return None
 
+@profiled
 async def get_device_by_imei(device_imei: str) -> Optional[DeviceInDB]:
     device_collection = get_device_collection()
     device_doc = await device_collection.find_one({"deviceId": device_imei})
     if device_doc:
-        return DeviceInDB(**device_doc)
+        return DeviceInDB.model_validate(device_doc)
     return None
 
+@profiled
 async def update_device_info(device_id: PyObjectId, user_id: PyObjectId, device_update_data: DeviceUpdate) -> Optional[DeviceInDB]:
     device_collection = get_device_collection()
     
@@ -79,6 +97,7 @@ async def update_device_info(device_id: PyObjectId, user_id: PyObjectId, device_
         return await get_device_by_id_and_user(device_id, user_id)
     return None
 
+@profiled
 async def update_device_status_by_imei(device_imei: str, status_update: DeviceStatusUpdate) -> Optional[DeviceInDB]:
     device_collection = get_device_collection()
     device = await get_device_by_imei(device_imei)
@@ -106,22 +125,23 @@ async def update_device_status_by_imei(device_imei: str, status_update: DeviceSt
     if result.matched_count >= 1:
         updated_device_doc = await device_collection.find_one({"deviceId": device_imei})
         if updated_device_doc:
-            return DeviceInDB(**updated_device_doc)
+            return DeviceInDB.model_validate(updated_device_doc)
     return device
 
+@profiled
 async def delete_device_for_user(device_id: PyObjectId, user_id: PyObjectId) -> bool:
-    device_collection = get_device_collection()
-    device = await get_device_by_id_and_user(device_id, user_id)
-    if not device:
+    """解绑：设备立即标记为已删除并释放 IMEI，关联数据在后台分批删除 (见 device_unbind_service)"""
+    tombstone = await device_unbind_service.tombstone_device(device_id, user_id)
+    if tombstone is None:
         return False
-
-    delete_result = await device_collection.delete_one({"_id": str(device_id), "userId": str(user_id)})
-    if delete_result.deleted_count == 1:
-        print(f"Device {device_id} deleted. Cleaning up associated data...")
-        # 清理关联数据
-        await get_contact_collection().delete_many({"deviceId": str(device_id)})
-        await get_reminder_collection().delete_many({"deviceId": str(device_id)})
-        await get_entertainment_item_collection().delete_many({"deviceId": str(device_id)})
-        # 可以添加其他关联数据的清理，如通知、SOS记录等
-        return True
-    return False
+    device_unbind_service.schedule_cascade(tombstone)
+    return True
+
+async def iter_device_imeis(query: Dict[str, Any], batch_size: int = 1000) -> AsyncIterator[str]:
+    """按查询条件流式返回设备IMEI (只投影 deviceId，用于批量下发，不把全部设备载入内存)"""
+    # 排除解绑后等待级联删除的墓碑
+    cursor = get_device_collection().find({**query, "deletedAt": None}, {"deviceId": 1, "_id": 0}).batch_size(batch_size)
+    async for device_doc in cursor:
+        device_imei = device_doc.get("deviceId")
+        if device_imei:
+            yield device_imei
@@ -0,0 +1,56 @@
+# app/services/device_snapshot_service.py
+# 设备页聚合快照：设备信息 + 通讯录 + 提醒 + 娱乐内容，一次请求返回
+#
+# ETag 由设备文档上的计数/时间戳得出，不读取子集合：
+#   configVersion   通讯录/提醒/娱乐内容每次变更加1 (含称呼语音合成完成，见 contact_service)
+#   updatedAt       设备信息修改、状态上报 (在线/电量/位置) 时更新
+#   pendingCommands 离线指令数
+# 客户端带 If-None-Match 重新验证时只需一次带投影的 find_one (同时完成归属校验)。
+import asyncio
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+
+from app.db.mongodb_utils import get_contact_collection, get_device_collection, get_entertainment_item_collection, get_reminder_collection
+from app.db.query_profiler import profiled
+from app.models.common_models import PyObjectId
+from app.models.contact_models import CONTACT_IN_DB_LIST_ADAPTER
+from app.models.device_models import DeviceInDB, DevicePublic, DeviceSnapshot
+from app.models.entertainment_models import EntertainmentItemPublic, ENTERTAINMENT_ITEM_IN_DB_LIST_ADAPTER
+from app.models.reminder_models import REMINDER_IN_DB_LIST_ADAPTER
+from app.services import contact_service, reminder_service
+
+ETAG_FIELDS = ("configVersion", "updatedAt", "pendingCommands")
+
+
+def compute_etag(device_doc: Dict[str, Any]) -> str:
+    raw = "|".join(str(device_doc.get(field)) for field in ("_id",) + ETAG_FIELDS)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+@profiled
+async def get_device_etag(device_id: PyObjectId, user_id: PyObjectId) -> Optional[str]:
+    """设备不存在或不属于该用户时返回 None"""
+    device_doc = await get_device_collection().find_one(
+        {"_id": str(device_id), "userId": str(user_id)}, projection={field: 1 for field in ETAG_FIELDS}
+    )
+    return compute_etag(device_doc) if device_doc else None
+
+@profiled
+async def get_device_snapshot(device_id: PyObjectId, user_id: PyObjectId) -> Optional[Tuple[str, DeviceSnapshot]]:
+    device_doc = await get_device_collection().find_one({"_id": str(device_id), "userId": str(user_id)})
+    if not device_doc:
+        return None
+    device = DeviceInDB.model_validate(device_doc)
+    # ETag 取自读取子集合之前的设备文档：期间发生的变更只会让客户端下次多拿一次完整数据，不会缓存旧数据
+    query = {"deviceId": str(device_id)}
+    contact_docs, reminder_docs, item_docs = await asyncio.gather(
+        get_contact_collection().find(query).to_list(length=None),
+        get_reminder_collection().find(query).to_list(length=None),
+        get_entertainment_item_collection().find(query).to_list(length=None),
+    )
+    snapshot = DeviceSnapshot.model_construct(
+        device=DevicePublic.construct_from(device),
+        contacts=contact_service.to_public_contacts(CONTACT_IN_DB_LIST_ADAPTER.validate_python(contact_docs), device),
+        reminders=[reminder_service.to_public_reminder(reminder) for reminder in REMINDER_IN_DB_LIST_ADAPTER.validate_python(reminder_docs)],
+        entertainment=[EntertainmentItemPublic.construct_from(item) for item in ENTERTAINMENT_ITEM_IN_DB_LIST_ADAPTER.validate_python(item_docs)],
+    )
+    return compute_etag(device_doc), snapshot
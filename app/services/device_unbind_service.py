@@ -0,0 +1,163 @@
+# app/services/device_unbind_service.py
+# 设备解绑：HTTP 请求内只把设备文档改为墓碑 (tombstone)，关联数据由后台任务分批级联删除
+#
+#   1. tombstone_device: 读出 IMEI 后用一次 find_one_and_update (以 IMEI 未变为条件) 原子地完成
+#        - 设置 deletedAt，去掉 userId (所有按用户的查询立即看不到该设备)
+#        - deviceId 改为 "deleted:<_id>"，原 IMEI 移到 unboundImei，IMEI 立即可以被重新绑定 (deviceId 唯一索引)
+#        - 设置 cascadeLeaseUntil，当前进程立即开始级联删除
+#   2. run_cascade: 按 CASCADE_STEPS 依次删除关联集合，每批最多 DEVICE_CASCADE_BATCH_SIZE 条
+#      (先按索引取 _id 再 delete_many $in)，批间暂停 DEVICE_CASCADE_BATCH_PAUSE_SECONDS，
+#      避免一次性删除大量历史数据造成数据库负载尖峰。全部删完后删除墓碑本身。
+#   3. 可恢复：删除是幂等的，进程在中途退出时墓碑仍在，租约 (cascadeLeaseUntil) 过期后
+#      由任意 worker 的 sweep_loop 重新领取并从头继续 (已删的部分不会再有数据)。
+#      执行期间定期续约，同一墓碑同时只有一个 worker 在处理。
+#   离线指令 (device_outbox) 按 IMEI 存储，IMEI 可能已被重新绑定，只删除解绑之前写入的指令。
+#   mqtt_processed_events 按 IMEI 存储且有 TTL，不做处理。
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from pymongo import ReturnDocument
+
+from app.core import metrics
+from app.core.config import settings
+from app.db.mongodb_utils import (
+    get_config_change_collection, get_contact_collection, get_device_collection, get_entertainment_item_collection,
+    get_notification_collection, get_outbox_collection, get_reminder_collection, get_sos_alert_collection,
+)
+from app.db.query_profiler import profiled
+from app.models.common_models import PyObjectId
+
+logger = logging.getLogger(__name__)
+
+CASCADE_LEASE = timedelta(minutes=5)
+
+# (集合名, 集合获取函数, 墓碑 -> 该集合中属于这台设备的文档的查询条件)
+CASCADE_STEPS: Tuple[Tuple[str, Callable, Callable[[Dict[str, Any]], Dict[str, Any]]], ...] = (
+    ("contacts", get_contact_collection, lambda tombstone: {"deviceId": tombstone["_id"]}),
+    ("reminders", get_reminder_collection, lambda tombstone: {"deviceId": tombstone["_id"]}),
+    ("entertainment_items", get_entertainment_item_collection, lambda tombstone: {"deviceId": tombstone["_id"]}),
+    ("notifications", get_notification_collection, lambda tombstone: {"deviceId": tombstone["_id"]}),
+    ("sos_alerts", get_sos_alert_collection, lambda tombstone: {"deviceId": tombstone["_id"]}),
+    ("device_config_changes", get_config_change_collection, lambda tombstone: {"deviceId": tombstone["_id"]}),
+    ("device_outbox", get_outbox_collection,
+     lambda tombstone: {"deviceImei": tombstone.get("unboundImei"), "updatedAt": {"$lte": tombstone["deletedAt"]}}),
+)
+
+# 当前进程中正在执行的级联任务 (持有引用，避免任务被回收)
+_running: Set[asyncio.Task] = set()
+
+
+@profiled
+async def tombstone_device(device_id: PyObjectId, user_id: PyObjectId) -> Optional[Dict[str, Any]]:
+    """把设备标记为已解绑并释放 IMEI；设备不存在或不属于该用户时返回 None"""
+    device_collection = get_device_collection()
+    current = await device_collection.find_one({"_id": str(device_id), "userId": str(user_id)}, projection={"deviceId": 1})
+    if current is None:
+        return None
+    now = datetime.utcnow()
+    device_doc = await device_collection.find_one_and_update(
+        {"_id": str(device_id), "userId": str(user_id), "deviceId": current["deviceId"]},
+        {
+            "$set": {
+                "unboundImei": current["deviceId"],
+                "unboundUserId": str(user_id),
+                "deviceId": f"deleted:{device_id}",
+                "deletedAt": now,
+                "cascadeLeaseUntil": now + CASCADE_LEASE,
+            },
+            "$unset": {"userId": ""},
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+    if device_doc is None: # 并发解绑
+        return None
+    logger.info("Device unbound, cascade scheduled", extra={"device_id": str(device_id), "imei": device_doc.get("unboundImei")})
+    return device_doc
+
+def schedule_cascade(tombstone: Dict[str, Any]) -> asyncio.Task:
+    task = asyncio.create_task(run_cascade(tombstone))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return task
+
+@profiled
+async def claim_tombstone() -> Optional[Dict[str, Any]]:
+    """领取一个租约已过期的墓碑 (之前的级联任务所在进程已退出)"""
+    now = datetime.utcnow()
+    return await get_device_collection().find_one_and_update(
+        {"cascadeLeaseUntil": {"$lt": now}},
+        {"$set": {"cascadeLeaseUntil": now + CASCADE_LEASE}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def _renew_lease(device_id: str) -> None:
+    await get_device_collection().update_one(
+        {"_id": device_id, "deletedAt": {"$ne": None}},
+        {"$set": {"cascadeLeaseUntil": datetime.utcnow() + CASCADE_LEASE}},
+    )
+
+async def _delete_in_batches(name: str, collection, query: Dict[str, Any], on_batch: Callable) -> int:
+    batch_size = settings.DEVICE_CASCADE_BATCH_SIZE
+    deleted = 0
+    while True:
+        docs = await collection.find(query, {"_id": 1}).limit(batch_size).to_list(length=batch_size)
+        if not docs:
+            return deleted
+        result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        deleted += result.deleted_count
+        metrics.DEVICE_CASCADE_DELETED.labels(name).inc(result.deleted_count)
+        if len(docs) < batch_size:
+            return deleted
+        await on_batch()
+
+async def run_cascade(tombstone: Dict[str, Any]) -> bool:
+    """删除墓碑的全部关联数据，最后删除墓碑本身。失败时保留墓碑，租约过期后重试"""
+    device_id = tombstone["_id"]
+    started = time.perf_counter()
+    renewed = time.monotonic()
+
+    async def on_batch():
+        nonlocal renewed
+        if time.monotonic() - renewed > CASCADE_LEASE.total_seconds() / 2:
+            await _renew_lease(device_id)
+            renewed = time.monotonic()
+        await asyncio.sleep(settings.DEVICE_CASCADE_BATCH_PAUSE_SECONDS)
+
+    counts: Dict[str, int] = {}
+    try:
+        for name, get_collection, build_query in CASCADE_STEPS:
+            counts[name] = await _delete_in_batches(name, get_collection(), build_query(tombstone), on_batch)
+        await get_device_collection().delete_one({"_id": device_id, "deletedAt": {"$ne": None}})
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        metrics.DEVICE_CASCADES.labels("failed").inc()
+        logger.error("Device cascade failed, will be retried after lease expiry: %s", e, extra={"device_id": device_id})
+        return False
+    metrics.DEVICE_CASCADES.labels("completed").inc()
+    logger.info("Device cascade completed in %.1fs", time.perf_counter() - started,
+                extra={"device_id": device_id, "deleted": counts})
+    return True
+
+async def sweep_loop() -> None:
+    """后台常驻：定期领取租约过期的墓碑 (进程崩溃或重启前未完成的级联) 并执行"""
+    while True:
+        try:
+            while (tombstone := await claim_tombstone()) is not None:
+                logger.info("Resuming device cascade", extra={"device_id": tombstone["_id"]})
+                await run_cascade(tombstone)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Device cascade sweep failed: %s", e)
+        await asyncio.sleep(settings.DEVICE_CASCADE_SWEEP_INTERVAL_SECONDS)
+
+async def stop() -> None:
+    """停止当前进程中的级联任务；未完成的墓碑由租约过期后的 sweep 继续"""
+    for task in list(_running):
+        task.cancel()
+    if _running:
+        await asyncio.gather(*_running, return_exceptions=True)
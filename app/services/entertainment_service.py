@@ -5,10 +5,13 @@ from datetime import datetime, timezone
 from fastapi.encoders import jsonable_encoder
 
 from app.db.mongodb_utils import get_entertainment_item_collection
+from app.db.query_profiler import profiled
 from app.models.common_models import PyObjectId
-from app.models.entertainment_models import EntertainmentItemCreate, EntertainmentItemInDB, EntertainmentItemUpdate
+from app.models.entertainment_models import EntertainmentItemCreate, EntertainmentItemInDB, EntertainmentItemUpdate, ENTERTAINMENT_ITEM_IN_DB_LIST_ADAPTER
+from app.services import config_sync_service
 from app.services.contact_service import check_device_ownership
 
+@profiled
 async def create_entertainment_item_for_device(
     device_db_id: PyObjectId, user_id: PyObjectId, item_in: EntertainmentItemCreate
 ) -> Optional[EntertainmentItemInDB]:
@@ -25,16 +28,20 @@ async def create_entertainment_item_for_device(
     result = await item_collection.insert_one(item_doc_to_insert)
     created_doc = await item_collection.find_one({"_id": result.inserted_id})
     if created_doc:
-        return EntertainmentItemInDB(**created_doc)
+        created_item = EntertainmentItemInDB.model_validate(created_doc)
+        await config_sync_service.record_config_change(device_db_id, "entertainment", created_item.id, "upsert", created_item)
+        return created_item
     return None
 
+@profiled
 async def get_entertainment_items_for_device(device_db_id: PyObjectId, user_id: PyObjectId) -> List[EntertainmentItemInDB]:
     if not await check_device_ownership(device_db_id, user_id):
         return []
     item_collection = get_entertainment_item_collection()
     items_cursor = item_collection.find({"deviceId": str(device_db_id)})
-    return [EntertainmentItemInDB(**doc) async for doc in items_cursor]
+    return ENTERTAINMENT_ITEM_IN_DB_LIST_ADAPTER.validate_python(await items_cursor.to_list(length=None))
 
+@profiled
 async def update_entertainment_item_for_device(
     device_db_id: PyObjectId,
     item_id: PyObjectId,
@@ -50,7 +57,7 @@ async def update_entertainment_item_for_device(
 
     if not update_doc:
         item_doc = await item_collection.find_one({"_id": str(item_id), "deviceId": str(device_db_id)})
-        return EntertainmentItemInDB(**item_doc) if item_doc else None
+        return EntertainmentItemInDB.model_validate(item_doc) if item_doc else None
 
     update_doc["updatedAt"] = datetime.now(timezone.utc)
     result = await item_collection.update_one(
@@ -59,12 +66,20 @@ async def update_entertainment_item_for_device(
     )
     if result.modified_count == 1 or result.matched_count == 1:
         updated_doc = await item_collection.find_one({"_id": str(item_id)})
-        return EntertainmentItemInDB(**updated_doc) if updated_doc else None
+        if not updated_doc:
+            return None
+        updated_item = EntertainmentItemInDB.model_validate(updated_doc)
+        await config_sync_service.record_config_change(device_db_id, "entertainment", item_id, "upsert", updated_item)
+        return updated_item
     return None
 
+@profiled
 async def delete_entertainment_item_for_device(device_db_id: PyObjectId, item_id: PyObjectId, user_id: PyObjectId) -> bool:
     if not await check_device_ownership(device_db_id, user_id):
         return False
     item_collection = get_entertainment_item_collection()
     result = await item_collection.delete_one({"_id": str(item_id), "deviceId": str(device_db_id)})
-    return result.deleted_count == 1
+    if result.deleted_count != 1:
+        return False
+    await config_sync_service.record_config_change(device_db_id, "entertainment", item_id, "delete")
+    return True
@@ -0,0 +1,127 @@
+# app/services/export_service.py
+# 通知 / SOS 记录的流式导出 (NDJSON 或 CSV，可选 gzip)
+#
+# 逐批读取 Mongo 游标 (EXPORT_BATCH_SIZE 条一批)，逐行编码后攒到约 EXPORT_CHUNK_BYTES 字节输出一块，
+# 由 StreamingResponse 发送；客户端读得慢时发送会等待，游标也随之暂停，内存占用与导出总量无关。
+# 客户端断开时生成器被关闭，游标随之关闭。
+import csv
+import io
+import zlib
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+
+from app.core import json_codec, metrics
+from app.core.config import settings
+from app.db.mongodb_utils import get_notification_collection, get_sos_alert_collection
+from app.models.common_models import PyObjectId
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# 导出类型 -> 导出的字段 (CSV 中嵌套字段用点号展开，对象/数组写为 JSON 字符串)
+EXPORT_FIELDS: Dict[str, Sequence[str]] = {
+    "notifications": ("time", "type", "deviceId", "deviceName", "title", "content", "isRead", "payload"),
+    "sos_alerts": (
+        "timestamp", "deviceId", "status", "location.latitude", "location.longitude", "location.address",
+        "acknowledgedBy", "acknowledgedAt",
+    ),
+}
+
+
+def _time_range(time_field: str, since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+    # 时间字段按 jsonable_encoder 的格式 (不带时区的UTC ISO字符串) 存储，按同样格式比较
+    bounds = {}
+    for operator, value in (("$gte", since), ("$lt", until)):
+        if value is not None:
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            bounds[operator] = value.isoformat()
+    return {time_field: bounds} if bounds else {}
+
+def _projection(kind: str) -> Dict[str, int]:
+    return {field.split(".")[0]: 1 for field in EXPORT_FIELDS[kind]}
+
+def find_notifications(user_id: PyObjectId, device_id: Optional[PyObjectId] = None,
+                       since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """当前用户的通知，按时间升序 (走 userId+time 索引)"""
+    query: Dict[str, Any] = {"userId": str(user_id), **_time_range("time", since, until)}
+    if device_id:
+        query["deviceId"] = str(device_id)
+    return get_notification_collection().find(query, projection=_projection("notifications")).sort("time", 1)
+
+def find_sos_alerts(device_id: PyObjectId, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """设备的 SOS 记录，按时间升序"""
+    query = {"deviceId": str(device_id), **_time_range("timestamp", since, until)}
+    return get_sos_alert_collection().find(query, projection=_projection("sos_alerts")).sort("timestamp", 1)
+
+
+def _get_path(doc: Dict[str, Any], path: str) -> Any:
+    value: Any = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json_codec.dumps_document(value).decode("utf-8")
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+async def _encode_rows(cursor, kind: str, export_format: str) -> AsyncIterator[bytes]:
+    fields = EXPORT_FIELDS[kind]
+    chunk_size = settings.EXPORT_CHUNK_BYTES
+    rows = 0
+    text = io.StringIO()
+    writer = csv.writer(text)
+    buffer = bytearray()
+    if export_format == "csv":
+        writer.writerow(("id", *fields))
+        buffer += b"\xef\xbb\xbf" + text.getvalue().encode("utf-8") # 带 BOM，Excel 直接打开中文不乱码
+    try:
+        async for doc in cursor:
+            if export_format == "csv":
+                text.seek(0)
+                text.truncate()
+                writer.writerow((str(doc["_id"]), *(_csv_value(_get_path(doc, field)) for field in fields)))
+                buffer += text.getvalue().encode("utf-8")
+            else:
+                doc["id"] = str(doc.pop("_id"))
+                buffer += json_codec.dumps_document(doc) + b"\n"
+            rows += 1
+            if len(buffer) >= chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        metrics.EXPORT_ROWS.labels(kind, export_format).inc(rows)
+        await cursor.close()
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits=31: gzip 格式
+    try:
+        async for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+    finally:
+        await chunks.aclose()
+
+def stream_export(cursor, kind: str, export_format: str, compress: bool = False) -> AsyncIterator[bytes]:
+    """cursor 来自 find_notifications / find_sos_alerts；返回供 StreamingResponse 使用的字节块生成器"""
+    chunks = _encode_rows(cursor.batch_size(settings.EXPORT_BATCH_SIZE), kind, export_format)
+    return _gzip(chunks) if compress else chunks
+
+def export_headers(kind: str, export_format: str, compress: bool) -> Tuple[str, Dict[str, str]]:
+    """返回 (media_type, headers)；gzip 导出为 .gz 附件，而不是 Content-Encoding，下载后保持压缩"""
+    filename = f"{kind}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.{export_format}"
+    media_type = EXPORT_MEDIA_TYPES[export_format]
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return media_type, {"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
@@ -1,13 +1,47 @@
 # app/services/notification_service.py
-from typing import List, Optional, Dict, Any
+import logging
+from typing import FrozenSet, List, Optional, Dict, Any
 from datetime import datetime, timezone
 from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError
 
 from app.db.mongodb_utils import get_notification_collection, get_device_collection
-from app.models.common_models import PyObjectId
-from app.models.notification_models import NotificationCreate, NotificationInDB, NotificationPublic, DeviceLocation
+from app.db.query_profiler import profiled
+from app.services import retention_service
+from app.models.common_models import PyObjectId, sparse_list_adapter
+from app.models.notification_models import (
+    NotificationCreate, NotificationInDB, NotificationPublic, DeviceLocation, NOTIFICATION_IN_DB_LIST_ADAPTER
+)
 
-async def create_notification(notification_in: NotificationCreate) -> Optional[NotificationInDB]:
+logger = logging.getLogger(__name__)
+
+def _location_from_payload(notification_type: Optional[str], payload: Optional[Dict[str, Any]],
+                           notification_id: Any) -> Optional[DeviceLocation]:
+    """SOS 通知的 payload 中带有位置时解析为 DeviceLocation"""
+    if notification_type == "SOS" and payload and \
+       "latitude" in payload and "longitude" in payload:
+        try:
+            return DeviceLocation.model_validate({
+                "latitude": float(payload["latitude"]),
+                "longitude": float(payload["longitude"]),
+                "address": payload.get("address"),
+                "timestamp": payload.get("timestamp")
+            })
+        except (ValueError, TypeError) as e: # pydantic的ValidationError是ValueError的子类
+            logger.warning("Error parsing location from notification payload: %s", e, extra={"notification_id": notification_id})
+    return None
+
+def to_public_notification(notif_db: NotificationInDB) -> NotificationPublic:
+    """
+    NotificationInDB -> NotificationPublic。
+    notif_db 已经过校验，走 construct_from 快速路径；只有来自设备的位置payload需要重新校验。
+    """
+    location = _location_from_payload(notif_db.type, notif_db.payload, notif_db.id)
+    return NotificationPublic.construct_from(notif_db, location=location)
+
+@profiled
+async def create_notification(notification_in: NotificationCreate, notification_id: Optional[str] = None) -> Optional[NotificationInDB]:
+    """notification_id 由设备事件派生时 (见 idempotency.event_document_id)，同一事件重复调用只创建和推送一次"""
     notification_collection = get_notification_collection()
 
     if notification_in.deviceId and not notification_in.deviceName:
@@ -28,70 +62,62 @@ async def create_notification(notification_in: NotificationCreate) -> Optional[N
 
     new_notification_db_obj = NotificationInDB(**notification_in.model_dump())
     notification_doc_to_insert = jsonable_encoder(new_notification_db_obj)
+    expire_at = retention_service.notification_expire_at(new_notification_db_obj.type, new_notification_db_obj.time)
+    if expire_at:
+        notification_doc_to_insert["expireAt"] = expire_at # 保持 BSON Date 类型，TTL 索引才会生效
 
-    result = await notification_collection.insert_one(notification_doc_to_insert)
+    if notification_id:
+        notification_doc_to_insert["_id"] = notification_id
+    try:
+        result = await notification_collection.insert_one(notification_doc_to_insert)
+    except DuplicateKeyError:
+        # 同一事件之前的处理已经创建 (死信重试)，不再推送
+        logger.info("Notification already created for this event, skipping", extra={"notification_id": notification_id})
+        existing_doc = await notification_collection.find_one({"_id": notification_id})
+        return NotificationInDB.model_validate(existing_doc) if existing_doc else None
     created_doc = await notification_collection.find_one({"_id": result.inserted_id})
     if created_doc:
-        print(f"Notification created (ID: {result.inserted_id}). TODO: Trigger push notification.")
-        return NotificationInDB(**created_doc)
+        logger.info("Notification created. TODO: Trigger push notification.", extra={"notification_id": str(result.inserted_id), "type": notification_in.type})
+        return NotificationInDB.model_validate(created_doc)
     return None
 
+@profiled
 async def get_notifications_for_user(user_id: PyObjectId, skip: int = 0, limit: int = 20) -> List[NotificationPublic]:
     notification_collection = get_notification_collection()
     notifications_cursor = notification_collection.find(
         {"userId": str(user_id)}
     ).sort("time", -1).skip(skip).limit(limit)
     
-    results = []
-    async for doc in notifications_cursor:
-        notif_db = NotificationInDB(**doc)
-        notif_public_data = notif_db.model_dump()
-        
-        if notif_db.type == "SOS" and notif_db.payload and \
-           "latitude" in notif_db.payload and "longitude" in notif_db.payload:
-            try:
-                loc_data = {
-                    "latitude": float(notif_db.payload["latitude"]),
-                    "longitude": float(notif_db.payload["longitude"]),
-                    "address": notif_db.payload.get("address"),
-                    "timestamp": notif_db.payload.get("timestamp")
-                }
-                notif_public_data["location"] = DeviceLocation(**loc_data)
-            except (ValueError, TypeError) as e:
-                print(f"Error parsing location from notification payload for {notif_db.id}: {e}")
-                notif_public_data["location"] = None
-        else:
-            notif_public_data["location"] = None
-            
-        results.append(NotificationPublic(**notif_public_data))
-    return results
+    notifications_db = NOTIFICATION_IN_DB_LIST_ADAPTER.validate_python(await notifications_cursor.to_list(length=limit))
+    return [to_public_notification(notif_db) for notif_db in notifications_db]
+
+@profiled
+async def get_notification_fields_for_user(user_id: PyObjectId, fields: FrozenSet[str], skip: int = 0, limit: int = 20) -> List[Any]:
+    """同 get_notifications_for_user，但只读取并返回 fields 中的字段 (NotificationPublic 的稀疏字段集)"""
+    projection = {"_id": 1, **{field: 1 for field in fields if field not in ("id", "location")}}
+    if "location" in fields: # location 由 payload 计算得到
+        projection.update(type=1, payload=1)
+    notifications_cursor = get_notification_collection().find(
+        {"userId": str(user_id)}, projection=projection
+    ).sort("time", -1).skip(skip).limit(limit)
+    docs = await notifications_cursor.to_list(length=limit)
+    for doc in docs:
+        doc["id"] = doc.pop("_id")
+        if "location" in fields:
+            doc["location"] = _location_from_payload(doc.get("type"), doc.get("payload"), doc["id"])
+    return sparse_list_adapter(NotificationPublic, fields).validate_python(docs)
 
+@profiled
 async def get_notification_by_id_for_user(notification_id: PyObjectId, user_id: PyObjectId) -> Optional[NotificationPublic]:
     notification_collection = get_notification_collection()
     notification_doc = await notification_collection.find_one(
         {"_id": str(notification_id), "userId": str(user_id)}
     )
     if notification_doc:
-        notif_db = NotificationInDB(**notification_doc)
-        notif_public_data = notif_db.model_dump()
-        if notif_db.type == "SOS" and notif_db.payload and \
-           "latitude" in notif_db.payload and "longitude" in notif_db.payload:
-            try:
-                loc_data = {
-                    "latitude": float(notif_db.payload["latitude"]),
-                    "longitude": float(notif_db.payload["longitude"]),
-                    "address": notif_db.payload.get("address"),
-                    "timestamp": notif_db.payload.get("timestamp")
-                }
-                notif_public_data["location"] = DeviceLocation(**loc_data)
-            except Exception as e:
-                print(f"Error parsing location from notification payload for {notif_db.id}: {e}")
-                notif_public_data["location"] = None
-        else:
-            notif_public_data["location"] = None
-        return NotificationPublic(**notif_public_data)
+        return to_public_notification(NotificationInDB.model_validate(notification_doc))
     return None
 
+@profiled
 async def mark_notification_read(notification_id: PyObjectId, user_id: PyObjectId) -> Optional[NotificationInDB]:
     notification_collection = get_notification_collection()
     update_data = {
@@ -102,13 +128,14 @@ async def mark_notification_read(notification_id: PyObjectId, user_id: PyObjectI
 
     result = await notification_collection.update_one(
         {"_id": str(notification_id), "userId": str(user_id)},
-        {"$set": update_doc}
+        {"$set": update_doc, **retention_service.read_notification_expire_update(datetime.utcnow())}
     )
     if result.matched_count >= 1:
         updated_doc = await notification_collection.find_one({"_id": str(notification_id)})
-        return NotificationInDB(**updated_doc) if updated_doc else None
+        return NotificationInDB.model_validate(updated_doc) if updated_doc else None
     return None
 
+@profiled
 async def mark_all_notifications_read_for_user(user_id: PyObjectId) -> int:
     notification_collection = get_notification_collection()
     update_data = {
@@ -118,10 +145,11 @@ async def mark_all_notifications_read_for_user(user_id: PyObjectId) -> int:
     update_doc = jsonable_encoder(update_data)
     result = await notification_collection.update_many(
         {"userId": str(user_id), "isRead": False},
-        {"$set": update_doc}
+        {"$set": update_doc, **retention_service.read_notification_expire_update(datetime.utcnow())}
     )
     return result.modified_count
 
+@profiled
 async def delete_notification_for_user(notification_id: PyObjectId, user_id: PyObjectId) -> bool:
     notification_collection = get_notification_collection()
     result = await notification_collection.delete_one(
@@ -129,6 +157,7 @@ async def delete_notification_for_user(notification_id: PyObjectId, user_id: PyO
     )
     return result.deleted_count == 1
 
+@profiled
 async def delete_all_notifications_for_user(user_id: PyObjectId) -> int:
     notification_collection = get_notification_collection()
     result = await notification_collection.delete_many({"userId": str(user_id)})
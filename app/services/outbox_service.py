@@ -0,0 +1,108 @@
+# app/services/outbox_service.py
+# 设备离线指令队列 (store-and-forward)
+#
+# 发给离线设备的指令写入 device_outbox 集合，设备下一次上报 isOnline=true 的 status 时一次性取出，
+# 合并为一条 devices/{imei}/action/batch 消息下发，发送成功后删除。
+#   - 相同 (deviceImei, collapseKey) 的待发指令原地覆盖，只保留最新内容 (如多次修改通讯录只同步一次)
+#   - expiresAt 上的 TTL 索引删除过期指令，取指令时也会过滤掉已过期但尚未被删除的
+#   - 下发前先领取：给指令写上本次下发的 deliveryId 和租约 deliveringUntil，同一条指令同时只会被一个
+#     status 处理领取 (并发的 status 消息不会重复下发)；发送失败时释放，进程中途退出时租约过期后可被重新领取。
+#     领取后被覆盖 (合并入队) 的指令会清除领取标记，删除时以 deliveryId 为条件，新内容不会被误删，下一条 status 时下发
+#   - devices.pendingCommands 是待发数量的提示：status 更新本来就会读回设备文档，
+#     为0时不查询 device_outbox，心跳不增加数据库往返。下发后按实际删除条数递减且不低于0；
+#     该值可能因 TTL 删除而偏大，领取不到指令时按实际剩余条数校正
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.db.mongodb_utils import get_device_collection, get_outbox_collection
+from app.db.query_profiler import profiled
+from app.models.outbox_models import OutboxCommandInDB, OUTBOX_COMMAND_IN_DB_LIST_ADAPTER
+
+logger = logging.getLogger(__name__)
+
+# 领取后在租约期内没有删除或释放 (进程退出) 的指令可被重新领取
+DELIVERY_LEASE = timedelta(seconds=60)
+
+@profiled
+async def enqueue_command(device_imei: str, action: str, payload: Optional[Dict[str, Any]] = None,
+                          collapse_key: Optional[str] = None, ttl_seconds: Optional[float] = None) -> bool:
+    """加入待发队列；collapse_key 相同的已有待发指令被新内容覆盖。返回是否新增了一条 (False 表示合并)"""
+    now = datetime.utcnow()
+    ttl = ttl_seconds if ttl_seconds is not None else settings.DEVICE_OUTBOX_TTL_SECONDS
+    result = await get_outbox_collection().update_one(
+        # 不合并的指令使用唯一的 collapseKey
+        {"deviceImei": device_imei, "collapseKey": collapse_key or f"{action}:{uuid.uuid4().hex}"},
+        {
+            "$set": {"action": action, "payload": payload or {}, "expiresAt": now + timedelta(seconds=ttl), "updatedAt": now},
+            "$setOnInsert": {"_id": str(uuid.uuid4()), "createdAt": now},
+            "$unset": {"deliveryId": "", "deliveringUntil": ""}, # 正在下发的旧内容作废，新内容重新排队
+        },
+        upsert=True,
+    )
+    if result.upserted_id is None:
+        logger.debug("Collapsed outbox command", extra={"imei": device_imei, "action": action, "collapse_key": collapse_key})
+        return False
+    await get_device_collection().update_one({"deviceId": device_imei}, {"$inc": {"pendingCommands": 1}})
+    return True
+
+def _claimable(now: datetime) -> Dict[str, Any]:
+    # 未过期，且没有被领取或领取的租约已过期
+    return {"expiresAt": {"$gt": now}, "$or": [{"deliveringUntil": None}, {"deliveringUntil": {"$lte": now}}]}
+
+@profiled
+async def claim_pending_commands(device_imei: str, limit: Optional[int] = None) -> List[OutboxCommandInDB]:
+    """按入队顺序领取最多 limit 条待发指令；返回的指令带本次领取的 deliveryId"""
+    limit = limit or settings.DEVICE_OUTBOX_BATCH_LIMIT
+    now = datetime.utcnow()
+    collection = get_outbox_collection()
+    candidates = await collection.find(
+        {"deviceImei": device_imei, **_claimable(now)}, projection={"_id": 1}
+    ).sort("createdAt", 1).limit(limit).to_list(length=limit)
+    if not candidates:
+        return []
+    # 条件更新是逐文档原子的：并发领取时每条指令只会写上其中一个 deliveryId
+    delivery_id = uuid.uuid4().hex
+    candidate_ids = [doc["_id"] for doc in candidates]
+    await collection.update_many(
+        {"_id": {"$in": candidate_ids}, **_claimable(now)},
+        {"$set": {"deliveryId": delivery_id, "deliveringUntil": now + DELIVERY_LEASE}},
+    )
+    cursor = collection.find({"_id": {"$in": candidate_ids}, "deliveryId": delivery_id}).sort("createdAt", 1)
+    return OUTBOX_COMMAND_IN_DB_LIST_ADAPTER.validate_python(await cursor.to_list(length=limit))
+
+@profiled
+async def release_commands(commands: List[OutboxCommandInDB]) -> None:
+    """发送失败：释放领取，设备下次上线时重新下发"""
+    if not commands:
+        return
+    await get_outbox_collection().update_many(
+        {"_id": {"$in": [command.id for command in commands]}, "deliveryId": commands[0].deliveryId},
+        {"$unset": {"deliveryId": "", "deliveringUntil": ""}},
+    )
+
+@profiled
+async def remove_delivered_commands(device_imei: str, commands: List[OutboxCommandInDB]) -> int:
+    """删除已下发且领取后未被覆盖的指令，按实际删除条数递减设备上的待发计数 (不低于0)"""
+    if not commands:
+        return 0
+    result = await get_outbox_collection().delete_many(
+        {"_id": {"$in": [command.id for command in commands]}, "deliveryId": commands[0].deliveryId}
+    )
+    if result.deleted_count:
+        await get_device_collection().update_one(
+            {"deviceId": device_imei},
+            [{"$set": {"pendingCommands": {"$max": [0, {"$subtract": ["$pendingCommands", result.deleted_count]}]}}}],
+        )
+    return result.deleted_count
+
+@profiled
+async def reconcile_pending_count(device_imei: str) -> int:
+    """领取不到指令时按实际剩余条数校正待发计数 (TTL 删除、其他进程正在下发等造成的偏差)"""
+    remaining = await get_outbox_collection().count_documents(
+        {"deviceImei": device_imei, "expiresAt": {"$gt": datetime.utcnow()}}
+    )
+    await get_device_collection().update_one({"deviceId": device_imei}, {"$set": {"pendingCommands": remaining}})
+    return remaining
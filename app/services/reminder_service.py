@@ -1,12 +1,17 @@
 # app/services/reminder_service.py
 
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 from datetime import datetime, timezone, time
 from fastapi.encoders import jsonable_encoder
+from pymongo import DeleteOne, InsertOne, UpdateOne
 
+from app.db.bulk_utils import bulk_write_unordered, reject_bulk_target
 from app.db.mongodb_utils import get_reminder_collection
-from app.models.common_models import PyObjectId
-from app.models.reminder_models import ReminderCreate, ReminderInDB, ReminderUpdate, ReminderPublic
+from app.db.query_profiler import profiled
+from app.models.common_models import BulkItemResult, PyObjectId
+from app.models.reminder_models import ReminderCreate, ReminderInDB, ReminderUpdate, ReminderPublic, REMINDER_IN_DB_LIST_ADAPTER
+from app.services import config_sync_service
+from app.services.config_sync_service import ConfigChange
 from app.services.contact_service import check_device_ownership
 
 def calculate_repeat_text_from_data(repeat_days_str: List[str]) -> str:
@@ -32,6 +37,14 @@ def calculate_repeat_text_from_data(repeat_days_str: List[str]) -> str:
     except IndexError:
         return "重复规则错误"
 
+def to_public_reminder(reminder_db: ReminderInDB) -> ReminderPublic:
+    """ReminderInDB 已经过校验，直接 construct_from 生成Public模型并填充repeatText"""
+    return ReminderPublic.construct_from(
+        reminder_db,
+        repeatText=calculate_repeat_text_from_data(reminder_db.repeat)
+    )
+
+@profiled
 async def create_reminder_for_device(device_db_id: PyObjectId, user_id: PyObjectId, reminder_in: ReminderCreate) -> Optional[ReminderInDB]:
     if not await check_device_ownership(device_db_id, user_id):
         return None
@@ -46,35 +59,31 @@ async def create_reminder_for_device(device_db_id: PyObjectId, user_id: PyObject
     result = await reminder_collection.insert_one(reminder_doc_to_insert)
     created_doc = await reminder_collection.find_one({"_id": result.inserted_id})
     if created_doc:
-        return ReminderInDB(**created_doc)
+        created_reminder = ReminderInDB.model_validate(created_doc)
+        await config_sync_service.record_config_change(device_db_id, "reminder", created_reminder.id, "upsert", created_reminder)
+        return created_reminder
     return None
 
+@profiled
 async def get_reminders_for_device(device_db_id: PyObjectId, user_id: PyObjectId) -> List[ReminderPublic]:
     if not await check_device_ownership(device_db_id, user_id):
         return []
     reminder_collection = get_reminder_collection()
     reminders_cursor = reminder_collection.find({"deviceId": str(device_db_id)})
-    
-    results = []
-    async for doc in reminders_cursor:
-        reminder_db = ReminderInDB(**doc)
-        public_reminder = ReminderPublic.model_validate(reminder_db)
-        public_reminder.repeatText = calculate_repeat_text_from_data(reminder_db.repeat)
-        results.append(public_reminder)
-    return results
+    reminders_db = REMINDER_IN_DB_LIST_ADAPTER.validate_python(await reminders_cursor.to_list(length=None))
+    return [to_public_reminder(reminder_db) for reminder_db in reminders_db]
 
+@profiled
 async def get_reminder_detail_for_device(device_db_id: PyObjectId, reminder_id: PyObjectId, user_id: PyObjectId) -> Optional[ReminderPublic]:
     if not await check_device_ownership(device_db_id, user_id):
         return None
     reminder_collection = get_reminder_collection()
     reminder_doc = await reminder_collection.find_one({"_id": str(reminder_id), "deviceId": str(device_db_id)})
     if reminder_doc:
-        reminder_db = ReminderInDB(**reminder_doc)
-        public_reminder = ReminderPublic.model_validate(reminder_db)
-        public_reminder.repeatText = calculate_repeat_text_from_data(reminder_db.repeat)
-        return public_reminder
+        return to_public_reminder(ReminderInDB.model_validate(reminder_doc))
     return None
 
+@profiled
 async def update_reminder_for_device(
     device_db_id: PyObjectId,
     reminder_id: PyObjectId,
@@ -90,7 +99,7 @@ async def update_reminder_for_device(
 
     if not update_doc:
         updated_doc = await reminder_collection.find_one({"_id": str(reminder_id)})
-        return ReminderInDB(**updated_doc) if updated_doc else None
+        return ReminderInDB.model_validate(updated_doc) if updated_doc else None
 
     update_doc["updatedAt"] = datetime.now(timezone.utc)
 
@@ -100,12 +109,83 @@ async def update_reminder_for_device(
     )
     if result.modified_count == 1 or result.matched_count == 1:
         updated_doc = await reminder_collection.find_one({"_id": str(reminder_id)})
-        return ReminderInDB(**updated_doc) if updated_doc else None
+        if not updated_doc:
+            return None
+        updated_reminder = ReminderInDB.model_validate(updated_doc)
+        await config_sync_service.record_config_change(device_db_id, "reminder", reminder_id, "upsert", updated_reminder)
+        return updated_reminder
     return None
 
+@profiled
 async def delete_reminder_for_device(device_db_id: PyObjectId, reminder_id: PyObjectId, user_id: PyObjectId) -> bool:
     if not await check_device_ownership(device_db_id, user_id):
         return False
     reminder_collection = get_reminder_collection()
     result = await reminder_collection.delete_one({"_id": str(reminder_id), "deviceId": str(device_db_id)})
-    return result.deleted_count == 1
+    if result.deleted_count != 1:
+        return False
+    await config_sync_service.record_config_change(device_db_id, "reminder", reminder_id, "delete")
+    return True
+
+@profiled
+async def bulk_write_reminders(
+    device_db_id: PyObjectId,
+    user_id: PyObjectId,
+    creates: List[ReminderCreate],
+    updates: List[Tuple[PyObjectId, ReminderUpdate]],
+    deletes: List[PyObjectId],
+) -> Optional[List[BulkItemResult]]:
+    """批量新增/修改/删除提醒 (如导入用药计划)，做法同 contact_service.bulk_write_contacts；设备不属于该用户时返回 None"""
+    if not await check_device_ownership(device_db_id, user_id):
+        return None
+    reminder_collection = get_reminder_collection()
+
+    existing: Dict[str, Dict[str, Any]] = {}
+    target_ids = [str(reminder_id) for reminder_id, _ in updates] + [str(reminder_id) for reminder_id in deletes]
+    if target_ids:
+        cursor = reminder_collection.find({"_id": {"$in": target_ids}, "deviceId": str(device_db_id)})
+        existing = {doc["_id"]: doc for doc in await cursor.to_list(length=None)}
+
+    planned: List[Tuple[BulkItemResult, Any, ConfigChange]] = []
+    results: List[BulkItemResult] = []
+    seen_ids: Set[str] = set()
+    now = datetime.now(timezone.utc)
+
+    for index, reminder_in in enumerate(creates):
+        reminder_db = ReminderInDB(**reminder_in.model_dump(exclude={"deviceId"}), deviceId=device_db_id, nextTriggerAt=None)
+        result = BulkItemResult(op="create", index=index, id=reminder_db.id, status="created")
+        planned.append((result, InsertOne(jsonable_encoder(reminder_db)), ("reminder", reminder_db.id, "upsert", reminder_db)))
+
+    for index, (reminder_id, reminder_update) in enumerate(updates):
+        original = existing.get(str(reminder_id))
+        rejected = reject_bulk_target("update", index, reminder_id, original, seen_ids)
+        if rejected:
+            results.append(rejected)
+            continue
+        fields = reminder_update.model_dump(exclude_unset=True)
+        update_doc = jsonable_encoder({k: v for k, v in fields.items() if v is not None})
+        update_doc["updatedAt"] = now
+        updated = ReminderInDB.model_validate({**original, **update_doc})
+        result = BulkItemResult(op="update", index=index, id=reminder_id, status="updated")
+        request = UpdateOne({"_id": str(reminder_id), "deviceId": str(device_db_id)}, {"$set": update_doc})
+        planned.append((result, request, ("reminder", reminder_id, "upsert", updated)))
+
+    for index, reminder_id in enumerate(deletes):
+        rejected = reject_bulk_target("delete", index, reminder_id, existing.get(str(reminder_id)), seen_ids)
+        if rejected:
+            results.append(rejected)
+            continue
+        result = BulkItemResult(op="delete", index=index, id=reminder_id, status="deleted")
+        planned.append((result, DeleteOne({"_id": str(reminder_id), "deviceId": str(device_db_id)}), ("reminder", reminder_id, "delete", None)))
+
+    errors = await bulk_write_unordered(reminder_collection, [request for _, request, _ in planned])
+    changes: List[ConfigChange] = []
+    for position, (result, _, change) in enumerate(planned):
+        if position in errors:
+            result.status, result.error = "error", errors[position]
+        else:
+            changes.append(change)
+        results.append(result)
+    await config_sync_service.record_config_changes(device_db_id, changes)
+    results.sort(key=lambda result: (("create", "update", "delete").index(result.op), result.index))
+    return results
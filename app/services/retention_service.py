@@ -0,0 +1,221 @@
+# app/services/retention_service.py
+# 数据保留：notifications / sos_alerts 按类型和状态设置过期时间，过期后归档并删除
+#
+#   - 每条文档的过期时间写在 expireAt (BSON Date) 上，一个 expireAt TTL 索引覆盖所有类型/状态的规则：
+#       通知     创建时 expireAt = time + 保留天数 (NOTIFICATION_RETENTION_DAYS，可按 type 覆盖)，
+#                标记已读时 $min 为 已读时间 + NOTIFICATION_READ_RETENTION_DAYS
+#       SOS记录  处理完成 (status=resolved) 后 expireAt = 当前时间 + SOS_RESOLVED_RETENTION_DAYS
+#                (由 mark_resolved_sos_alerts 定期补上，不依赖具体的处理入口)
+#     天数 <= 0 表示不过期 (不设置 expireAt)
+#   - 到期文档由保留任务分批删除：配置了 RETENTION_ARCHIVE_DIR 时由 archive_expired 先写入 gzip 压缩的
+#     NDJSON 分段文件，落盘 (fsync) 后再删除；未配置时由 purge_expired 直接删除。
+#     TTL 索引只作为保留任务长时间未运行时的兜底 (到期后再过固定的 RETENTION_TTL_GRACE_SECONDS 删除)，
+#     不随执行索引迁移的环境是否配置了归档目录而变
+#   - 归档是至少一次：写完分段后、删除前进程退出，下次运行会把同一批文档再归档一次 (_id 相同，可去重)；
+#     分段写到一半退出时留下的 .tmp 文件同样包含已删除的文档 (每批写完都会 flush，可正常解压到最后一批)
+#   - 一批文档先全部编码再写入，编码失败时这批不会写进分段也不会被删除；
+#     出错时只发布已有文档落盘的分段，空分段的 .tmp 直接删除
+#   - 同一时间只应有一个进程运行归档 (scripts/run_retention.py 定时任务，或开启 RETENTION_JOB_ENABLED 的单个实例)
+import asyncio
+import gzip
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core import json_codec, metrics
+from app.core.config import settings
+from app.db.mongodb_utils import get_notification_collection, get_sos_alert_collection
+from app.db.query_profiler import profiled
+
+logger = logging.getLogger(__name__)
+
+RETENTION_COLLECTIONS: Dict[str, Callable] = {
+    "notifications": get_notification_collection,
+    "sos_alerts": get_sos_alert_collection,
+}
+
+
+def _parse_type_days(raw: str) -> Dict[str, int]:
+    """解析 "LowBattery=30,DeviceOffline=30" 形式的配置"""
+    days: Dict[str, int] = {}
+    for item in raw.split(","):
+        if "=" in item:
+            notification_type, value = item.split("=", 1)
+            days[notification_type.strip()] = int(value)
+    return days
+
+NOTIFICATION_TYPE_RETENTION_DAYS = _parse_type_days(settings.NOTIFICATION_RETENTION_DAYS_BY_TYPE)
+
+def _after(start: datetime, days: int) -> Optional[datetime]:
+    return start + timedelta(days=days) if days > 0 else None
+
+def notification_expire_at(notification_type: str, created_at: datetime) -> Optional[datetime]:
+    """新通知的过期时间 (未读也会过期)"""
+    return _after(created_at, NOTIFICATION_TYPE_RETENTION_DAYS.get(notification_type, settings.NOTIFICATION_RETENTION_DAYS))
+
+def read_notification_expire_update(now: datetime) -> Dict[str, Any]:
+    """标记已读时合并进 update 的操作：过期时间提前到 已读时间 + 已读保留天数 (不会推迟更早的过期时间)"""
+    expire_at = _after(now, settings.NOTIFICATION_READ_RETENTION_DAYS)
+    return {"$min": {"expireAt": expire_at}} if expire_at else {}
+
+@profiled
+async def mark_resolved_sos_alerts(now: Optional[datetime] = None) -> int:
+    """给已处理完成、还没有过期时间的 SOS 记录设置过期时间"""
+    expire_at = _after(now or datetime.utcnow(), settings.SOS_RESOLVED_RETENTION_DAYS)
+    if expire_at is None:
+        return 0
+    result = await get_sos_alert_collection().update_many(
+        {"status": "resolved", "expireAt": None}, {"$set": {"expireAt": expire_at}}
+    )
+    return result.modified_count
+
+@profiled
+async def backfill_notification_expiry(now: Optional[datetime] = None) -> int:
+    """
+    给上线前的存量通知补上 expireAt (一次性，见 scripts/run_retention.py --backfill)。
+    存量通知的 time 可能是字符串，无法按创建时间计算，统一从现在起算。
+    """
+    now = now or datetime.utcnow()
+    modified = 0
+    for is_read, days in ((True, settings.NOTIFICATION_READ_RETENTION_DAYS), (False, settings.NOTIFICATION_RETENTION_DAYS)):
+        expire_at = _after(now, days)
+        if expire_at is None:
+            continue
+        result = await get_notification_collection().update_many(
+            {"isRead": is_read, "expireAt": None}, {"$set": {"expireAt": expire_at}}
+        )
+        modified += result.modified_count
+    return modified
+
+
+class ArchiveSegmentWriter:
+    """
+    写 gzip NDJSON 分段: <dir>/<集合>/<YYYYMMDD>/<集合>-<时间戳>-<序号>.ndjson.gz，
+    每段最多 RETENTION_ARCHIVE_SEGMENT_DOCS 条。先写 .tmp，fsync 后改名，目录中只会出现完整的分段。
+    """
+
+    def __init__(self, directory: Path, collection_name: str, max_docs: int):
+        self.directory = directory
+        self.collection_name = collection_name
+        self.max_docs = max_docs
+        self.segments: List[Path] = []
+        self._file = None
+        self._gzip = None
+        self._path: Optional[Path] = None
+        self._count = 0
+
+    def _open(self) -> None:
+        now = datetime.utcnow()
+        folder = self.directory / self.collection_name / now.strftime("%Y%m%d")
+        folder.mkdir(parents=True, exist_ok=True)
+        self._path = folder / f"{self.collection_name}-{now.strftime('%Y%m%dT%H%M%S')}-{len(self.segments):04d}-{os.getpid()}.ndjson.gz"
+        self._file = open(self._path.with_suffix(".tmp"), "wb")
+        self._gzip = gzip.GzipFile(fileobj=self._file, mode="wb", compresslevel=6)
+        self._count = 0
+
+    def write(self, docs: List[Dict[str, Any]]) -> None:
+        """写入一批文档并落盘；返回后这批文档即可从数据库删除"""
+        lines = [json_codec.dumps_document(doc) + b"\n" for doc in docs]
+        for line in lines:
+            if self._gzip is None:
+                self._open()
+            self._gzip.write(line)
+            self._count += 1
+            if self._count >= self.max_docs:
+                self.close()
+        if self._gzip is not None:
+            self._gzip.flush()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """完成当前分段；分段中还没有文档时删除 .tmp，不发布空分段"""
+        if self._gzip is None:
+            return
+        tmp_path = self._path.with_suffix(".tmp")
+        try:
+            self._gzip.close()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+            self._gzip = self._file = None
+        if self._count == 0:
+            tmp_path.unlink(missing_ok=True)
+            return
+        os.replace(tmp_path, self._path)
+        self.segments.append(self._path)
+
+
+@profiled
+async def archive_expired(collection_name: str, now: Optional[datetime] = None) -> int:
+    """把到期文档分批写入归档分段后删除，返回归档条数"""
+    now = now or datetime.utcnow()
+    collection = RETENTION_COLLECTIONS[collection_name]()
+    batch_size = settings.RETENTION_BATCH_SIZE
+    writer = ArchiveSegmentWriter(Path(settings.RETENTION_ARCHIVE_DIR), collection_name, settings.RETENTION_ARCHIVE_SEGMENT_DOCS)
+    archived = 0
+    try:
+        while True:
+            cursor = collection.find({"expireAt": {"$lte": now}}).sort("expireAt", 1).limit(batch_size)
+            docs = await cursor.to_list(length=batch_size)
+            if not docs:
+                break
+            await asyncio.to_thread(writer.write, docs)
+            result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+            archived += len(docs)
+            metrics.RETENTION_DOCUMENTS.labels(collection_name, "archived").inc(result.deleted_count)
+            if len(docs) < batch_size:
+                break
+            await asyncio.sleep(settings.RETENTION_BATCH_PAUSE_SECONDS)
+    finally:
+        await asyncio.to_thread(writer.close)
+    if archived:
+        logger.info("Archived %d expired %s into %d segment(s)", archived, collection_name, len(writer.segments))
+    return archived
+
+@profiled
+async def purge_expired(collection_name: str, now: Optional[datetime] = None) -> int:
+    """不归档时分批删除到期文档，返回删除条数"""
+    now = now or datetime.utcnow()
+    collection = RETENTION_COLLECTIONS[collection_name]()
+    batch_size = settings.RETENTION_BATCH_SIZE
+    deleted = 0
+    while True:
+        cursor = collection.find({"expireAt": {"$lte": now}}, {"_id": 1}).sort("expireAt", 1).limit(batch_size)
+        docs = await cursor.to_list(length=batch_size)
+        if not docs:
+            break
+        result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        deleted += result.deleted_count
+        metrics.RETENTION_DOCUMENTS.labels(collection_name, "deleted").inc(result.deleted_count)
+        if len(docs) < batch_size:
+            break
+        await asyncio.sleep(settings.RETENTION_BATCH_PAUSE_SECONDS)
+    return deleted
+
+async def run_retention() -> Dict[str, int]:
+    """执行一轮：补齐 SOS 记录的过期时间，归档 (配置了归档目录时) 并删除到期文档"""
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    stats = {"sos_alerts_marked": await mark_resolved_sos_alerts(now)}
+    for collection_name in RETENTION_COLLECTIONS:
+        if settings.RETENTION_ARCHIVE_DIR:
+            stats[f"{collection_name}_archived"] = await archive_expired(collection_name, now)
+        else:
+            stats[f"{collection_name}_deleted"] = await purge_expired(collection_name, now)
+    logger.info("Retention run finished in %.1fs", time.perf_counter() - started, extra={"stats": stats})
+    return stats
+
+async def retention_loop() -> None:
+    while True:
+        try:
+            await run_retention()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Retention run failed: %s", e)
+        await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
@@ -1,9 +1,16 @@
 # app/services/third_party_services.py
+import asyncio
+import json
+import logging
+import time
 import httpx # 推荐使用 httpx 进行异步HTTP请求
 from typing import Optional, Dict, Any
 from app.core.config import settings
+from app.core.metrics import track_wechat_call
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 WECHAT_CODE2SESSION_URL = "https://api.weixin.qq.com/sns/jscode2session"
 WECHAT_GET_ACCESS_TOKEN_URL = "https://api.weixin.qq.com/cgi-bin/token"
 WECHAT_SEND_SUBSCRIBE_MESSAGE_URL = "https://api.weixin.qq.com/cgi-bin/message/subscribe/send"
@@ -15,7 +22,7 @@ async def wx_code_to_session(code: str) -> Optional[Dict[str, Any]]:
     用code换取微信用户的openid和session_key
     """
     if not settings.WX_APPID or not settings.WX_SECRET:
-        print("Error: WX_APPID or WX_SECRET not configured.")
+        logger.error("WX_APPID or WX_SECRET not configured.")
         return None
 
     params = {
@@ -26,21 +33,22 @@ async def wx_code_to_session(code: str) -> Optional[Dict[str, Any]]:
     }
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.get(WECHAT_CODE2SESSION_URL, params=params)
+            with track_wechat_call("code2session"):
+                response = await client.get(WECHAT_CODE2SESSION_URL, params=params)
             response.raise_for_status() # 如果HTTP状态码是4xx或5xx，则抛出异常
             data = response.json()
             if data.get("errcode") and data.get("errcode") != 0:
-                print(f"WeChat API Error (code2Session): {data.get('errmsg')}, Code: {data.get('errcode')}")
+                logger.warning("WeChat API Error (code2Session): %s, Code: %s", data.get('errmsg'), data.get('errcode'))
                 return None
             return data # 应该包含 openid, session_key, unionid (如果绑定了开放平台)
     except httpx.HTTPStatusError as e:
-        print(f"HTTP error occurred while calling WeChat code2Session: {e.response.status_code} - {e.response.text}")
+        logger.error("HTTP error occurred while calling WeChat code2Session: %s - %s", e.response.status_code, e.response.text)
         return None
     except httpx.RequestError as e:
-        print(f"Request error occurred while calling WeChat code2Session: {e}")
+        logger.error("Request error occurred while calling WeChat code2Session: %s", e)
         return None
     except Exception as e:
-        print(f"An unexpected error occurred in wx_code_to_session: {e}")
+        logger.exception("An unexpected error occurred in wx_code_to_session: %s", e)
         return None
 
 
@@ -62,7 +70,7 @@ async def get_wechat_access_token() -> Optional[str]:
         return _wechat_access_token
 
     if not settings.WX_APPID or not settings.WX_SECRET:
-        print("Error: WX_APPID or WX_SECRET not configured for getting access_token.")
+        logger.error("WX_APPID or WX_SECRET not configured for getting access_token.")
         return None
 
     params = {
@@ -72,23 +80,24 @@ async def get_wechat_access_token() -> Optional[str]:
     }
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.get(WECHAT_GET_ACCESS_TOKEN_URL, params=params)
+            with track_wechat_call("get_access_token"):
+                response = await client.get(WECHAT_GET_ACCESS_TOKEN_URL, params=params)
             response.raise_for_status()
             data = response.json()
             if data.get("access_token") and data.get("expires_in"):
                 _wechat_access_token = data["access_token"]
                 # 提前一点点过期，避免临界问题
                 _wechat_access_token_expires_at = datetime.now(timezone.utc) + timedelta(seconds=data["expires_in"] - 300)
-                print(f"Successfully fetched new WeChat access_token, expires at {_wechat_access_token_expires_at}")
+                logger.info("Fetched new WeChat access_token, expires at %s", _wechat_access_token_expires_at)
                 # 在生产环境中，应该将token和过期时间存入Redis等缓存
                 return _wechat_access_token
             else:
-                print(f"WeChat API Error (get_access_token): {data.get('errmsg')}, Code: {data.get('errcode')}")
+                logger.error("WeChat API Error (get_access_token): %s, Code: %s", data.get('errmsg'), data.get('errcode'))
                 _wechat_access_token = None
                 _wechat_access_token_expires_at = None
                 return None
     except Exception as e:
-        print(f"Error fetching WeChat access_token: {e}")
+        logger.error("Error fetching WeChat access_token: %s", e)
         _wechat_access_token = None
         _wechat_access_token_expires_at = None
         return None
@@ -105,7 +114,7 @@ async def send_wechat_subscribe_message(
     """
     access_token = await get_wechat_access_token()
     if not access_token:
-        print("Failed to send subscribe message: could not get access_token.")
+        logger.error("Failed to send subscribe message: could not get access_token.")
         return False
 
     payload = {
@@ -121,23 +130,88 @@ async def send_wechat_subscribe_message(
 
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{WECHAT_SEND_SUBSCRIBE_MESSAGE_URL}?access_token={access_token}",
-                json=payload
-            )
+            with track_wechat_call("send_subscribe_message"):
+                response = await client.post(
+                    f"{WECHAT_SEND_SUBSCRIBE_MESSAGE_URL}?access_token={access_token}",
+                    json=payload
+                )
             response.raise_for_status()
             result_data = response.json()
             if result_data.get("errcode") == 0:
-                print(f"Successfully sent subscribe message to {touser_openid} with template {template_id}")
+                logger.info("Sent subscribe message", extra={"touser": touser_openid, "template_id": template_id})
                 return True
             else:
-                print(f"WeChat API Error (send_subscribe_message): {result_data.get('errmsg')}, Code: {result_data.get('errcode')}")
+                logger.warning("WeChat API Error (send_subscribe_message): %s, Code: %s", result_data.get('errmsg'), result_data.get('errcode'))
                 # 特殊错误码处理，例如 43101: user refuse to accept the msg
                 if result_data.get("errcode") == 43101:
-                    print(f"User {touser_openid} refused to accept message for template {template_id}")
+                    logger.info("User refused to accept subscribe message", extra={"touser": touser_openid, "template_id": template_id})
                 return False
     except Exception as e:
-        print(f"Error sending WeChat subscribe message: {e}")
+        logger.error("Error sending WeChat subscribe message: %s", e)
         return False
 
+# --- 阿里云智能语音交互 (NLS) 语音合成 ---
+# 由 app/services/tts_service.py 调用 (负责缓存与并发合并)，这里只做一次原始的合成请求
+ALIYUN_NLS_TTS_URL = "https://nls-gateway-{region}.aliyuncs.com/stream/v1/tts"
+
+_aliyun_nls_token: Optional[str] = None
+_aliyun_nls_token_expires_at: float = 0.0
+
+def _create_aliyun_nls_token() -> Dict[str, Any]:
+    """同步调用 CreateToken (aliyunsdkcore 只有同步接口，由调用方放到线程中执行)"""
+    from aliyunsdkcore.client import AcsClient
+    from aliyunsdkcore.request import CommonRequest
+
+    client = AcsClient(settings.ALIYUN_ACCESS_KEY_ID, settings.ALIYUN_ACCESS_KEY_SECRET, settings.ALIYUN_NLS_REGION)
+    request = CommonRequest()
+    request.set_method("POST")
+    request.set_domain(f"nls-meta.{settings.ALIYUN_NLS_REGION}.aliyuncs.com")
+    request.set_version("2019-02-28")
+    request.set_action_name("CreateToken")
+    return json.loads(client.do_action_with_exception(request))["Token"]
+
+async def get_aliyun_nls_token() -> Optional[str]:
+    """获取并缓存 NLS 访问令牌 (有效期通常为24小时，提前5分钟刷新)"""
+    global _aliyun_nls_token, _aliyun_nls_token_expires_at
+    if _aliyun_nls_token and time.time() < _aliyun_nls_token_expires_at - 300:
+        return _aliyun_nls_token
+    if not settings.ALIYUN_ACCESS_KEY_ID or not settings.ALIYUN_ACCESS_KEY_SECRET:
+        logger.error("ALIYUN_ACCESS_KEY_ID or ALIYUN_ACCESS_KEY_SECRET not configured.")
+        return None
+    try:
+        token = await asyncio.to_thread(_create_aliyun_nls_token)
+    except Exception as e:
+        logger.error("Failed to create Aliyun NLS token: %s", e)
+        return None
+    _aliyun_nls_token, _aliyun_nls_token_expires_at = token["Id"], float(token["ExpireTime"])
+    return _aliyun_nls_token
+
+async def text_to_speech(text: str, voice: str, audio_format: str = "mp3", sample_rate: int = 16000) -> Optional[bytes]:
+    """调用阿里云 NLS 合成语音，成功返回音频字节，失败返回 None"""
+    if not settings.ALIYUN_NLS_APPKEY:
+        logger.error("ALIYUN_NLS_APPKEY not configured.")
+        return None
+    token = await get_aliyun_nls_token()
+    if not token:
+        return None
+    payload = {
+        "appkey": settings.ALIYUN_NLS_APPKEY,
+        "token": token,
+        "text": text,
+        "format": audio_format,
+        "sample_rate": sample_rate,
+        "voice": voice,
+    }
+    try:
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.post(ALIYUN_NLS_TTS_URL.format(region=settings.ALIYUN_NLS_REGION), json=payload)
+        # 成功时返回音频 (Content-Type: audio/*)，失败时返回 JSON 错误信息
+        if response.status_code == 200 and response.headers.get("content-type", "").startswith("audio/"):
+            return response.content
+        logger.warning("Aliyun NLS TTS error: %s %s", response.status_code, response.text[:500])
+        return None
+    except httpx.RequestError as e:
+        logger.error("Request error occurred while calling Aliyun NLS TTS: %s", e)
+        return None
+
 # 其他第三方服务可以类似地添加...
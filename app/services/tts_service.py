@@ -0,0 +1,279 @@
+# app/services/tts_service.py
+# 语音合成 (TTS) 与音频缓存
+#
+#   - 引擎可替换: "aliyun" 调用阿里云 NLS (third_party_services.text_to_speech)；
+#     "local" 在本地生成与文本长度相当的 WAV 提示音，不依赖外部服务，用于开发/测试/压测
+#   - 按内容寻址缓存: sha256(引擎, 音色, 格式, 文本) 作为文件名存放在 TTS_CACHE_DIR，
+#     通过 GET {API_V1_STR}/tts/{文件名} 提供下载 (支持 Range，见 app/routers/tts_router.py)，内容不变可长期缓存
+#   - 相同文本的并发请求只合成一次 (single-flight)
+#   - 报时语音一天只有1440种，启动时在后台预先合成 (pregenerate_time_announcements)
+#   - 联系人称呼语音 (dialectName，按设备方言选择发音人) 经 SynthesisQueue 在后台合成：
+#     相同 (文本, 发音人) 只排队一次 (不同设备的同名联系人共用一个文件)，分批取出、限并发、令牌桶限速，
+#     批量导入通讯录时不会压垮 TTS 后端
+import array
+import asyncio
+import hashlib
+import io
+import logging
+import math
+import os
+import time
+import wave
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core import metrics
+from app.core.config import settings
+from app.mqtt.broadcast import RateLimiter
+from app.services import datetime_service, third_party_services
+
+logger = logging.getLogger(__name__)
+
+AUDIO_MEDIA_TYPES = {"mp3": "audio/mpeg", "wav": "audio/wav"}
+
+
+class LocalToneEngine:
+    """本地替身引擎：每个字 0.12 秒的 400Hz 提示音 (16kHz 单声道 WAV)，内容确定，便于测试"""
+    name = "local"
+    audio_format = "wav"
+    sample_rate = 16000
+    # 400Hz 在 16kHz 下一个周期正好40个采样点，整段音频由同一周期重复拼接
+    _CYCLE = array.array("h", (int(3000 * math.sin(2 * math.pi * i / 40)) for i in range(40))).tobytes()
+
+    async def synthesize(self, text: str, voice: str) -> Optional[bytes]:
+        cycles = int(self.sample_rate * 0.12 * max(1, len(text))) // 40
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(self._CYCLE * cycles)
+        return buffer.getvalue()
+
+
+class AliyunEngine:
+    name = "aliyun"
+    audio_format = "mp3"
+
+    async def synthesize(self, text: str, voice: str) -> Optional[bytes]:
+        return await third_party_services.text_to_speech(text, voice, self.audio_format)
+
+
+ENGINES = {"local": LocalToneEngine, "aliyun": AliyunEngine}
+
+
+class TTSCache:
+    def __init__(self, directory: Path, engine, voice: str):
+        self.directory = directory
+        self.engine = engine
+        self.voice = voice
+        self._known: Set[str] = set() # 已确认存在于磁盘上的文件名，省去重复 stat
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._relative_url_warned = False
+
+    def filename_for(self, text: str, voice: Optional[str] = None) -> str:
+        voice = voice or self.voice
+        digest = hashlib.sha256(f"{self.engine.name}\0{voice}\0{self.engine.audio_format}\0{text}".encode("utf-8")).hexdigest()
+        return f"{digest}.{self.engine.audio_format}"
+
+    def path_for(self, filename: str) -> Path:
+        # 按前两位分目录，避免单目录下文件过多
+        return self.directory / filename[:2] / filename
+
+    def url_for(self, filename: str) -> str:
+        if not settings.PUBLIC_BASE_URL and not self._relative_url_warned:
+            # 手表无法下载相对地址，只有本地调试时可以不设置
+            logger.warning("PUBLIC_BASE_URL is not set: TTS audio URLs sent to devices are relative and cannot be downloaded")
+            self._relative_url_warned = True
+        return f"{settings.PUBLIC_BASE_URL.rstrip('/')}{settings.API_V1_STR}/tts/{filename}"
+
+    def is_cached(self, filename: str) -> bool:
+        if filename in self._known:
+            return True
+        if self.path_for(filename).is_file():
+            self._known.add(filename)
+            return True
+        return False
+
+    def cached_url(self, text: str, voice: Optional[str] = None) -> Optional[str]:
+        """不触发合成：已缓存时返回URL，否则返回 None"""
+        filename = self.filename_for(text, voice)
+        return self.url_for(filename) if self.is_cached(filename) else None
+
+    async def get_url(self, text: str, voice: Optional[str] = None) -> Optional[str]:
+        """返回音频URL，未缓存时合成 (同一文本的并发调用共享一次合成)；合成失败返回 None"""
+        filename = self.filename_for(text, voice)
+        if self.is_cached(filename):
+            metrics.TTS_REQUESTS.labels("hit").inc()
+            return self.url_for(filename)
+        metrics.TTS_REQUESTS.labels("miss").inc()
+        task = self._inflight.get(filename)
+        if task is None:
+            task = asyncio.create_task(self._synthesize(filename, text, voice or self.voice))
+            self._inflight[filename] = task
+            task.add_done_callback(lambda _: self._inflight.pop(filename, None))
+        # shield: 某个等待方被取消不影响其他等待方和缓存写入
+        return self.url_for(filename) if await asyncio.shield(task) else None
+
+    def prefetch(self, text: str, voice: Optional[str] = None) -> None:
+        """后台合成，不等待结果"""
+        task = asyncio.create_task(self.get_url(text, voice))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception()) # 取出异常，避免未处理异常告警
+
+    async def _synthesize(self, filename: str, text: str, voice: str) -> bool:
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            audio = await self.engine.synthesize(text, voice)
+            if not audio:
+                return False
+            await asyncio.to_thread(self._write, filename, audio)
+            self._known.add(filename)
+            outcome = "ok"
+            return True
+        except Exception as e:
+            logger.error("TTS synthesis failed: %s", e, extra={"engine": self.engine.name, "text": text})
+            return False
+        finally:
+            metrics.TTS_SYNTHESIS_LATENCY.labels(self.engine.name, outcome).observe(time.perf_counter() - start)
+
+    def _write(self, filename: str, audio: bytes) -> None:
+        path = self.path_for(filename)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再原子替换，读取方 (包括其他 worker) 不会看到写了一半的文件
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(audio)
+        os.replace(tmp_path, path)
+
+
+def _build_cache() -> TTSCache:
+    engine_name = settings.TTS_ENGINE
+    if engine_name not in ENGINES:
+        raise ValueError(f"Unknown TTS_ENGINE '{engine_name}', expected one of {sorted(ENGINES)}")
+    return TTSCache(Path(settings.TTS_CACHE_DIR), ENGINES[engine_name](), settings.TTS_VOICE)
+
+tts_cache = _build_cache()
+
+
+def _parse_dialect_voices(raw: str) -> Dict[str, str]:
+    """解析 "cantonese=shanshan,sichuan=xiaoyue" 形式的配置"""
+    voices = {"mandarin": settings.TTS_VOICE}
+    for item in raw.split(","):
+        if "=" in item:
+            dialect, voice = item.split("=", 1)
+            voices[dialect.strip()] = voice.strip()
+    return voices
+
+DIALECT_VOICES = _parse_dialect_voices(settings.TTS_DIALECT_VOICES)
+
+def voice_for_dialect(dialect: Optional[str]) -> str:
+    return DIALECT_VOICES.get(dialect or "mandarin", settings.TTS_VOICE)
+
+
+class SynthesisQueue:
+    """
+    后台合成队列。submit 立即返回 Future (结果为音频URL，失败为 None)，不等待合成；
+    已缓存的文本直接返回已完成的 Future，已在队列中的文本返回同一个 Future。
+    """
+
+    def __init__(self, cache: TTSCache, batch_size: int, concurrency: int, rate: float):
+        self.cache = cache
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.rate = rate
+        self._queue: "asyncio.Queue[Tuple[str, str, str]]" = asyncio.Queue()
+        self._pending: Dict[str, asyncio.Future] = {} # 文件名 -> Future
+        self._worker: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, text: str, voice: Optional[str] = None) -> asyncio.Future:
+        voice = voice or self.cache.voice
+        filename = self.cache.filename_for(text, voice)
+        future = self._pending.get(filename)
+        if future is not None:
+            metrics.TTS_QUEUE_ITEMS.labels("coalesced").inc()
+            return future
+        future = asyncio.get_running_loop().create_future()
+        if self.cache.is_cached(filename):
+            future.set_result(self.cache.url_for(filename))
+            return future
+        self._pending[filename] = future
+        self._queue.put_nowait((filename, text, voice))
+        metrics.TTS_QUEUE_ITEMS.labels("queued").inc()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return future
+
+    async def _run(self):
+        limiter = RateLimiter(self.rate, burst=self.batch_size)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def synthesize(filename: str, text: str, voice: str):
+            async with semaphore:
+                await limiter.acquire()
+                try:
+                    url = await self.cache.get_url(text, voice)
+                except Exception as e:
+                    logger.error("Queued TTS synthesis failed: %s", e, extra={"text": text})
+                    url = None
+            metrics.TTS_QUEUE_ITEMS.labels("done" if url else "failed").inc()
+            future = self._pending.pop(filename, None)
+            if future is not None and not future.done():
+                future.set_result(url)
+
+        while True:
+            batch: List[Tuple[str, str, str]] = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            started = time.perf_counter()
+            await asyncio.gather(*(synthesize(*item) for item in batch))
+            logger.debug("TTS queue batch done: %d items in %.2fs, %d pending",
+                         len(batch), time.perf_counter() - started, self._queue.qsize())
+
+    def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_result(None)
+        self._pending.clear()
+        self._queue = asyncio.Queue()
+
+tts_queue = SynthesisQueue(
+    tts_cache,
+    batch_size=settings.TTS_QUEUE_BATCH_SIZE,
+    concurrency=settings.TTS_QUEUE_CONCURRENCY,
+    rate=settings.TTS_QUEUE_RATE_PER_SECOND,
+)
+
+
+def contact_name_text(name: str, dialect_name: Optional[str]) -> str:
+    """联系人称呼语音的文本：优先使用老人习惯的方言称呼 (如 "阿大")"""
+    return (dialect_name or name).strip()
+
+
+async def pregenerate_time_announcements(concurrency: Optional[int] = None) -> int:
+    """合成全部1440条报时语音 (已缓存的跳过)，从当前时刻开始，最先用到的最先就绪。返回新合成的数量"""
+    now = datetime.now(timezone.utc).astimezone(datetime_service.BEIJING_TZ)
+    start_minute = now.hour * 60 + now.minute
+    texts = [datetime_service.minute_of_day_announcement((start_minute + offset) % 1440) for offset in range(1440)]
+    missing = [text for text in texts if not tts_cache.cached_url(text)]
+    if not missing:
+        return 0
+    logger.info("Pre-generating %d time announcements", len(missing), extra={"engine": tts_cache.engine.name})
+    semaphore = asyncio.Semaphore(concurrency or settings.TTS_PREGENERATE_CONCURRENCY)
+
+    async def generate(text: str) -> bool:
+        async with semaphore:
+            return await tts_cache.get_url(text) is not None
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(generate(text) for text in missing))
+    created = sum(results)
+    logger.info("Time announcements ready: %d generated, %d failed in %.1fs",
+                created, len(missing) - created, time.perf_counter() - started)
+    return created
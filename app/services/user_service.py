@@ -4,23 +4,27 @@ from datetime import datetime, timezone
 from fastapi.encoders import jsonable_encoder
 
 from app.db.mongodb_utils import get_user_collection
+from app.db.query_profiler import profiled
 from app.models.user_models import UserCreate, UserInDB, PyObjectId
 from app.core.security import get_password_hash
 
+@profiled
 async def get_user_by_openid(openid: str) -> Optional[UserInDB]:
     user_collection = get_user_collection()
     user_doc = await user_collection.find_one({"wxOpenid": openid})
     if user_doc:
-        return UserInDB(**user_doc)
+        return UserInDB.model_validate(user_doc)
     return None
 
+@profiled
 async def get_user_by_id(user_id: PyObjectId) -> Optional[UserInDB]:
     user_collection = get_user_collection()
     user_doc = await user_collection.find_one({"_id": str(user_id)})
     if user_doc:
-        return UserInDB(**user_doc)
+        return UserInDB.model_validate(user_doc)
     return None
 
+@profiled
 async def create_user(user_in: UserCreate) -> UserInDB:
     user_collection = get_user_collection()
     existing_user = await get_user_by_openid(user_in.wxOpenid)
@@ -33,17 +37,22 @@ async def create_user(user_in: UserCreate) -> UserInDB:
     new_user_db = UserInDB(**user_in.model_dump())
     # 使用jsonable_encoder确保所有字段都能被BSON正确编码
     user_doc_to_insert = jsonable_encoder(new_user_db)
+    # wxUnionid 上是 unique+sparse 索引：sparse 只跳过不存在该字段的文档，显式的 null 仍会参与唯一约束，
+    # 第二个没有 unionid 的用户就会插入失败，所以为空时不写入该字段
+    if user_doc_to_insert.get("wxUnionid") is None:
+        user_doc_to_insert.pop("wxUnionid", None)
 
     result = await user_collection.insert_one(user_doc_to_insert)
     
     created_user_doc = await user_collection.find_one({"_id": result.inserted_id})
     if created_user_doc:
-        return UserInDB(**created_user_doc)
+        return UserInDB.model_validate(created_user_doc)
     
     # 理论上不应该到这里，除非发生非常罕见的并发问题
     raise Exception("Failed to create user or retrieve it after creation.")
 
 
+@profiled
 async def update_user_info(user_id: PyObjectId, nick_name: Optional[str], avatar_url: Optional[str]) -> Optional[UserInDB]:
     user_collection = get_user_collection()
     update_data = {}
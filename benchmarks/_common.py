@@ -0,0 +1,55 @@
+# benchmarks/_common.py
+# 基准测试公共工具：计时与结果输出
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Tuple
+
+def measure(fn: Callable[[], object], min_time: float = 0.5, repeat: int = 3) -> Tuple[float, int]:
+    """
+    自动确定循环次数，使单轮耗时不少于 min_time 秒，取 repeat 轮中最快的一轮。
+    返回 (每秒调用次数, 每轮调用次数)。
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10:
+            break
+        number *= 10
+    number = max(1, int(number * (min_time / max(elapsed, 1e-9))))
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return number / best, number
+
+def print_table(title: str, rows: List[Tuple[str, float]]) -> None:
+    print(f"\n=== {title} ===")
+    width = max(len(name) for name, _ in rows) if rows else 10
+    for name, ops in rows:
+        print(f"  {name:<{width}}  {ops:>14,.0f} ops/s  {1e6 / ops:>10.2f} us/op")
+
+def measure_async(fn: Callable[[], Awaitable[object]], loop: asyncio.AbstractEventLoop,
+                  min_time: float = 0.5, repeat: int = 3) -> Tuple[float, int]:
+    """measure() 的协程版本：fn 返回协程，每轮在同一个事件循环中顺序 await number 次"""
+    async def run_batch(number: int) -> float:
+        start = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        return time.perf_counter() - start
+
+    number = 1
+    while True:
+        elapsed = loop.run_until_complete(run_batch(number))
+        if elapsed >= min_time / 10:
+            break
+        number *= 10
+    number = max(1, int(number * (min_time / max(elapsed, 1e-9))))
+
+    best = min(loop.run_until_complete(run_batch(number)) for _ in range(repeat))
+    return number / best, number
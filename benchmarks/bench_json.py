@@ -0,0 +1,86 @@
+# benchmarks/bench_json.py
+"""
+JSON编解码前后对比：标准库 json vs app.core.json_codec (orjson)。
+
+用法 (在项目根目录下):
+    python -m benchmarks.bench_json
+    python -m benchmarks.bench_json --notifications 100 --min-time 1.0
+
+测量:
+  - MQTT status 心跳: 旧路径 json.loads(payload.decode()) vs json_codec.loads(payload)
+  - MQTT 下行: 旧路径 json.dumps(dict) vs json_codec.dumps(dict)
+  - 通知列表响应渲染: JSONResponse vs FastJSONResponse (内容为 jsonable_encoder 后的 NotificationPublic 列表)
+  - status 心跳的线上字节数与解码+校验吞吐: JSON vs MessagePack(map) vs MessagePack(数组形式)
+"""
+import argparse
+import json
+import uuid
+from typing import List, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmarks._common import measure, print_table
+from benchmarks.bench_models import INBOUND_DOCS, SAMPLE_DOCS
+from app.core import json_codec
+from app.core.json_codec import FastJSONResponse
+from app.models.device_models import DeviceLocation, DeviceStatusUpdate
+from app.models.notification_models import NotificationInDB, NotificationPublic
+from app.mqtt import payload_codec
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="stdlib json 与 json_codec 的编解码对比")
+    parser.add_argument("--notifications", type=int, default=100, help="通知列表的条数 (接口上限为100)")
+    parser.add_argument("--min-time", type=float, default=0.5, help="每项测量的最短运行时间(秒)")
+    args = parser.parse_args()
+
+    print(f"json_codec backend: {json_codec.JSON_BACKEND}")
+
+    # 设备上报的原始payload是标准库 json.dumps 的输出 (ASCII转义)
+    status_payload = json.dumps(INBOUND_DOCS[DeviceStatusUpdate]).encode()
+    play_audio = {"url": "https://cdn.example.com/tts/0830.mp3", "requestId": str(uuid.uuid4())}
+    rows: List[Tuple[str, float]] = [
+        ("status decode: json.loads(payload.decode())", measure(lambda: json.loads(status_payload.decode()), args.min_time)[0]),
+        ("status decode: json_codec.loads(payload)", measure(lambda: json_codec.loads(status_payload), args.min_time)[0]),
+        ("play_audio encode: json.dumps", measure(lambda: json.dumps(play_audio), args.min_time)[0]),
+        ("play_audio encode: json_codec.dumps", measure(lambda: json_codec.dumps(play_audio), args.min_time)[0]),
+    ]
+    print_table("MQTT payloads", rows)
+
+    notifications = []
+    for _ in range(args.notifications):
+        notif_db = NotificationInDB.model_validate(dict(SAMPLE_DOCS[NotificationInDB], _id=str(uuid.uuid4())))
+        notifications.append(NotificationPublic.construct_from(notif_db, location=DeviceLocation.model_validate(notif_db.payload)))
+    content = jsonable_encoder(notifications)
+    rows = [
+        (f"JSONResponse x{args.notifications}", measure(lambda: JSONResponse(content), args.min_time)[0]),
+        (f"FastJSONResponse x{args.notifications}", measure(lambda: FastJSONResponse(content), args.min_time)[0]),
+    ]
+    print_table("Notification list response rendering", rows)
+    print(f"\n  body size: JSONResponse={len(JSONResponse(content).body):,} B, "
+          f"FastJSONResponse={len(FastJSONResponse(content).body):,} B")
+
+    if payload_codec.msgpack_available():
+        bench_status_formats(args.min_time)
+
+def bench_status_formats(min_time: float) -> None:
+    import msgpack
+    status = INBOUND_DOCS[DeviceStatusUpdate]
+    loc = status["lastLocation"]
+    positional = [
+        status["isOnline"], status["battery"], status["signal"], status["firmwareVersion"],
+        [loc["latitude"], loc["longitude"], None, loc["timestamp"]],
+    ]
+    variants = [
+        ("json", payload_codec.FORMAT_JSON, json.dumps(status).encode()),
+        ("msgpack map", payload_codec.FORMAT_MSGPACK, msgpack.packb(status)),
+        ("msgpack positional", payload_codec.FORMAT_MSGPACK, msgpack.packb(positional)),
+    ]
+    rows = []
+    for name, fmt, raw in variants:
+        ops = measure(lambda: DeviceStatusUpdate.model_validate(payload_codec.decode(raw, fmt, "status")), min_time)[0]
+        rows.append((f"{name} ({len(raw)} B) decode+validate", ops))
+    print_table("Status heartbeat wire formats", rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# benchmarks/bench_models.py
+"""
+模型层微基准：测量每个模型的 validate / dump 吞吐量。
+
+用法 (在项目根目录下):
+    python -m benchmarks.bench_models
+    python -m benchmarks.bench_models --filter Device --min-time 1.0
+
+每个模型测量:
+  - validate_python: 从数据库文档(dict)校验构造
+  - validate_json:   从JSON字节串校验构造 (MQTT/HTTP 请求体路径)
+  - construct_from:  InDB -> Public 受信数据的 model_construct 快速路径 (对比 validate(dump))
+  - dump_python / dump_json: 序列化
+列表 TypeAdapter 额外以 100 条文档为一批测量。
+"""
+import argparse
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple, Type
+
+from pydantic import BaseModel, TypeAdapter
+
+from benchmarks._common import measure, print_table
+from app.models.contact_models import ContactCreate, ContactInDB, ContactPublic, CONTACT_IN_DB_LIST_ADAPTER
+from app.models.device_models import (
+    DeviceInDB, DevicePublic, DeviceStatusUpdate, DeviceLocation, DEVICE_IN_DB_LIST_ADAPTER
+)
+from app.models.entertainment_models import EntertainmentItemInDB, ENTERTAINMENT_ITEM_IN_DB_LIST_ADAPTER
+from app.models.notification_models import (
+    NotificationCreate, NotificationInDB, NotificationPublic, SosAlertCreate, NOTIFICATION_IN_DB_LIST_ADAPTER
+)
+from app.models.reminder_models import ReminderInDB, ReminderPublic, REMINDER_IN_DB_LIST_ADAPTER
+from app.models.user_models import UserInDB, UserPublic, TokenPayload
+
+NOW = datetime.now(timezone.utc).isoformat()
+
+def _new_id() -> str:
+    return str(uuid.uuid4())
+
+USER_ID = _new_id()
+DEVICE_ID = _new_id()
+
+# 与 jsonable_encoder 入库后的文档形态一致 (时间为ISO字符串，主键为 _id)
+SAMPLE_DOCS: Dict[Type[BaseModel], Dict[str, Any]] = {
+    UserInDB: {
+        "_id": USER_ID, "wxOpenid": "o6_bmjrPTlm6_2sgVt7hMZOPfL2M", "wxUnionid": None,
+        "nickName": "张三", "avatarUrl": "https://thirdwx.qlogo.cn/mmopen/vi_32/abc/132",
+        "createdAt": NOW, "updatedAt": NOW,
+    },
+    DeviceInDB: {
+        "_id": DEVICE_ID, "deviceId": "861234567890123", "userId": USER_ID, "name": "妈妈的手表",
+        "sim": "13800138000", "isOnline": True, "battery": 76, "signal": 4, "firmwareVersion": "1.2.7",
+        "lastLocation": {"latitude": 30.2741, "longitude": 120.1551, "address": "浙江省杭州市西湖区", "timestamp": NOW},
+        "sosContactPhone": "13900139000",
+        "sosSmsTemplate": "【安心通】设备[{deviceName}]发起了紧急呼叫！位置：{location}",
+        "autoBillRequestEnabled": True, "billReminderContacts": ["13900139000", "13700137000"],
+        "createdAt": NOW, "updatedAt": NOW,
+    },
+    ContactInDB: {
+        "_id": _new_id(), "deviceId": DEVICE_ID, "name": "大儿子", "phone": "13900139000",
+        "dialectName": "阿大", "isSosIntent": False, "createdAt": NOW, "updatedAt": NOW,
+    },
+    ReminderInDB: {
+        "_id": _new_id(), "deviceId": DEVICE_ID, "content": "饭后吃降压药", "time": "08:30:00",
+        "repeat": ["1", "2", "3", "4", "5"], "enabled": True, "nextTriggerAt": None, "lastConfirmedAt": None,
+        "createdAt": NOW, "updatedAt": NOW,
+    },
+    EntertainmentItemInDB: {
+        "_id": _new_id(), "deviceId": DEVICE_ID, "name": "越剧选段", "url": "https://cdn.example.com/audio/yueju.mp3",
+        "type": "audio_url", "createdAt": NOW, "updatedAt": NOW,
+    },
+    NotificationInDB: {
+        "_id": _new_id(), "userId": USER_ID, "deviceId": DEVICE_ID, "deviceName": "妈妈的手表", "type": "SOS",
+        "title": "紧急呼叫: 妈妈的手表", "content": "设备“妈妈的手表”发起了紧急呼叫！", "time": NOW, "isRead": False,
+        "payload": {"latitude": 30.2741, "longitude": 120.1551, "address": "浙江省杭州市西湖区"},
+        "createdAt": NOW, "updatedAt": NOW,
+    },
+}
+
+# 来自设备/小程序的入站数据
+INBOUND_DOCS: Dict[Type[BaseModel], Dict[str, Any]] = {
+    DeviceStatusUpdate: {
+        "isOnline": True, "battery": 75, "signal": 3, "firmwareVersion": "1.2.7",
+        "lastLocation": {"latitude": 30.2741, "longitude": 120.1551, "timestamp": NOW},
+    },
+    DeviceLocation: {"latitude": 30.2741, "longitude": 120.1551, "address": "浙江省杭州市西湖区"},
+    ContactCreate: {"deviceId": DEVICE_ID, "name": "小女儿", "phone": "13700137000", "isSosIntent": True},
+    NotificationCreate: {
+        "userId": USER_ID, "deviceId": DEVICE_ID, "deviceName": "妈妈的手表", "type": "Billing",
+        "content": "设备“妈妈的手表”话费不足，请求充值。",
+    },
+    SosAlertCreate: {"deviceId": DEVICE_ID, "userId": USER_ID, "location": {"latitude": 30.27, "longitude": 120.15}},
+    TokenPayload: {"sub": USER_ID, "type": "access"},
+}
+
+# InDB -> Public 的受信转换
+PUBLIC_OF: Dict[Type[BaseModel], Type[BaseModel]] = {
+    UserInDB: UserPublic,
+    DeviceInDB: DevicePublic,
+    ContactInDB: ContactPublic,
+    ReminderInDB: ReminderPublic,
+    NotificationInDB: NotificationPublic,
+}
+
+LIST_ADAPTERS: List[Tuple[str, TypeAdapter, Type[BaseModel]]] = [
+    ("List[DeviceInDB]", DEVICE_IN_DB_LIST_ADAPTER, DeviceInDB),
+    ("List[ContactInDB]", CONTACT_IN_DB_LIST_ADAPTER, ContactInDB),
+    ("List[ReminderInDB]", REMINDER_IN_DB_LIST_ADAPTER, ReminderInDB),
+    ("List[EntertainmentItemInDB]", ENTERTAINMENT_ITEM_IN_DB_LIST_ADAPTER, EntertainmentItemInDB),
+    ("List[NotificationInDB]", NOTIFICATION_IN_DB_LIST_ADAPTER, NotificationInDB),
+]
+
+def bench_model(model: Type[BaseModel], doc: Dict[str, Any], min_time: float) -> List[Tuple[str, float]]:
+    raw_json = json.dumps(doc, ensure_ascii=False).encode()
+    instance = model.model_validate(doc)
+    rows = [
+        ("validate_python", measure(lambda: model.model_validate(doc), min_time)[0]),
+        ("validate_json", measure(lambda: model.model_validate_json(raw_json), min_time)[0]),
+        ("dump_python", measure(lambda: instance.model_dump(), min_time)[0]),
+        ("dump_python(json)", measure(lambda: instance.model_dump(mode="json"), min_time)[0]),
+        ("dump_json", measure(lambda: instance.model_dump_json(), min_time)[0]),
+    ]
+    public_model = PUBLIC_OF.get(model)
+    if public_model is not None:
+        rows.append((f"-> {public_model.__name__} validate", measure(lambda: public_model.model_validate(instance.model_dump()), min_time)[0]))
+        rows.append((f"-> {public_model.__name__} construct_from", measure(lambda: public_model.construct_from(instance), min_time)[0]))
+    return rows
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pydantic 模型 validate/dump 吞吐量基准")
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的模型")
+    parser.add_argument("--min-time", type=float, default=0.5, help="每项测量的最短运行时间(秒)")
+    parser.add_argument("--batch", type=int, default=100, help="列表 TypeAdapter 的批大小")
+    args = parser.parse_args()
+
+    for model, doc in list(SAMPLE_DOCS.items()) + list(INBOUND_DOCS.items()):
+        if args.filter and args.filter not in model.__name__:
+            continue
+        print_table(model.__name__, bench_model(model, doc, args.min_time))
+
+    rows = []
+    for name, adapter, model in LIST_ADAPTERS:
+        if args.filter and args.filter not in name:
+            continue
+        docs = [dict(SAMPLE_DOCS[model], _id=_new_id()) for _ in range(args.batch)]
+        per_doc_ops = measure(lambda: [model.model_validate(d) for d in docs], args.min_time)[0]
+        adapter_ops = measure(lambda: adapter.validate_python(docs), args.min_time)[0]
+        rows.append((f"{name} x{args.batch} per-doc loop", per_doc_ops))
+        rows.append((f"{name} x{args.batch} TypeAdapter", adapter_ops))
+    if rows:
+        print_table("List validation (per batch)", rows)
+
+if __name__ == "__main__":
+    main()
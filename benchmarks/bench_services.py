@@ -0,0 +1,210 @@
+# benchmarks/bench_services.py
+"""
+服务层基准测试：对 device/contact/reminder/notification 等服务函数测量
+  - calls/s           每秒调用次数
+  - round trips/call  每次调用的数据库往返次数 (确定值，多一次 find_one 就会被发现)
+  - peak KiB/call     单次调用期间 tracemalloc 观测到的内存分配峰值
+并与保存的基线对比。
+
+默认使用内存版 Motor 替身 (benchmarks/fake_motor.py)，无需数据库，测得的是服务层自身的CPU开销
+(模型校验、BSON解码、序列化)；--mongo 改为连接 MONGO_URI 指向的真实 mongod (使用独立的 <MONGO_DB_NAME>_bench 库，结束后删除)。
+
+用法 (在项目根目录下):
+    python -m benchmarks.bench_services                    # 与基线对比
+    python -m benchmarks.bench_services --filter notification
+    python -m benchmarks.bench_services --save-baseline    # 更新基线 (benchmarks/baselines/)
+    python -m benchmarks.bench_services --mongo
+
+往返次数与基线不一致时退出码为1；calls/s 低于基线超过 --tolerance 只做标记，加 --strict 时同样返回1。
+calls/s 的基线与机器相关，换机器后请先在基准提交上 --save-baseline。
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from benchmarks import fake_motor
+from benchmarks._common import measure_async
+from scripts.check_query_plans import seed
+from app.core.config import settings
+from app.db.mongodb_utils import db_manager
+from app.db.indexes import ensure_indexes
+from app.models.contact_models import ContactUpdate
+from app.models.device_models import DeviceLocation, DeviceStatusUpdate, DeviceUpdate
+from app.models.notification_models import NotificationCreate
+from app.models.reminder_models import ReminderUpdate
+from app.services import (
+    contact_service, device_service, entertainment_service, export_service, notification_service, reminder_service, tts_service,
+)
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    """--mongo 模式下统计发往服务器的命令数"""
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name != "endSessions":
+            self.count += 1
+
+    def succeeded(self, event) -> None:
+        pass
+
+    def failed(self, event) -> None:
+        pass
+
+
+def build_benchmarks(ids: Dict[str, Any]) -> List[Tuple[str, Callable[[], Awaitable[Any]]]]:
+    """可重复执行的服务调用 (不删除数据；create_* 放在最后，避免数据增长影响其他项)"""
+    user, device = ids["user"], ids["device"]
+    contact, reminder, item, notification = ids["contact"], ids["reminder"], ids["item"], ids["notification"]
+    location = DeviceLocation(latitude=30.0, longitude=120.0)
+    return [
+        ("device.get_devices_by_user_id", lambda: device_service.get_devices_by_user_id(user.id)),
+        ("device.get_device_by_id_and_user", lambda: device_service.get_device_by_id_and_user(device.id, user.id)),
+        ("device.get_device_by_imei", lambda: device_service.get_device_by_imei(device.deviceId)),
+        ("device.update_device_info", lambda: device_service.update_device_info(device.id, user.id, DeviceUpdate(name="bench"))),
+        ("device.update_device_status_by_imei", lambda: device_service.update_device_status_by_imei(
+            device.deviceId, DeviceStatusUpdate(isOnline=True, battery=80, signal=4, lastLocation=location)
+        )),
+        ("contact.check_device_ownership", lambda: contact_service.check_device_ownership(device.id, user.id)),
+        ("contact.get_contacts_for_device", lambda: contact_service.get_contacts_for_device(device.id, user.id)),
+        ("contact.get_contact_detail_for_device", lambda: contact_service.get_contact_detail_for_device(device.id, contact.id, user.id)),
+        ("contact.update_contact_for_device", lambda: contact_service.update_contact_for_device(
+            device.id, contact.id, user.id, ContactUpdate(name="bench")
+        )),
+        ("reminder.get_reminders_for_device", lambda: reminder_service.get_reminders_for_device(device.id, user.id)),
+        ("reminder.get_reminder_detail_for_device", lambda: reminder_service.get_reminder_detail_for_device(device.id, reminder.id, user.id)),
+        ("reminder.update_reminder_for_device", lambda: reminder_service.update_reminder_for_device(
+            device.id, reminder.id, user.id, ReminderUpdate(content="bench")
+        )),
+        ("entertainment.get_entertainment_items_for_device", lambda: entertainment_service.get_entertainment_items_for_device(device.id, user.id)),
+        ("notification.get_notifications_for_user", lambda: notification_service.get_notifications_for_user(user.id, 0, 20)),
+        ("notification.get_notification_by_id_for_user", lambda: notification_service.get_notification_by_id_for_user(notification.id, user.id)),
+        ("notification.mark_notification_read", lambda: notification_service.mark_notification_read(notification.id, user.id)),
+        ("export.stream_export_sos_alerts_ndjson", lambda: _consume_export(
+            export_service.find_sos_alerts(device.id), "sos_alerts", "ndjson"
+        )),
+        ("notification.create_notification", lambda: notification_service.create_notification(
+            NotificationCreate(userId=user.id, deviceId=device.id, type="LowBattery", content="bench")
+        )),
+    ]
+
+async def _consume_export(cursor, kind: str, export_format: str) -> int:
+    return sum([len(chunk) async for chunk in export_service.stream_export(cursor, kind, export_format)])
+
+
+def peak_kib_per_call(loop: asyncio.AbstractEventLoop, fn: Callable[[], Awaitable[Any]], calls: int = 5) -> float:
+    """单次调用期间的内存分配峰值 (取多次中的最小值，排除偶发的缓存填充)"""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            loop.run_until_complete(fn())
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+    return min(peaks) / 1024
+
+
+def load_baseline(backend: str) -> Optional[Dict[str, Dict[str, float]]]:
+    path = BASELINE_DIR / f"bench_services.{backend}.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))["results"]
+
+def save_baseline(backend: str, results: Dict[str, Dict[str, float]]) -> Path:
+    BASELINE_DIR.mkdir(exist_ok=True)
+    path = BASELINE_DIR / f"bench_services.{backend}.json"
+    path.write_text(json.dumps({"backend": backend, "python": sys.version.split()[0], "results": results},
+                               indent=2, ensure_ascii=False, sort_keys=True) + "\n", encoding="utf-8")
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="服务层基准测试 (内存替身或真实 mongod)")
+    parser.add_argument("--mongo", action="store_true", help="连接 MONGO_URI 指向的真实 mongod")
+    parser.add_argument("--filter", help="只运行名称包含该字符串的基准")
+    parser.add_argument("--min-time", type=float, default=0.3, help="每项测量的最短运行时间(秒)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="calls/s 低于基线的容忍比例")
+    parser.add_argument("--strict", action="store_true", help="calls/s 回退也返回非零退出码")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    args = parser.parse_args()
+
+    backend = "mongo" if args.mongo else "memory"
+    loop = asyncio.new_event_loop()
+    if args.mongo:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        counter = RoundTripCounter()
+        client = AsyncIOMotorClient(str(settings.MONGO_URI), event_listeners=[counter], io_loop=loop)
+        db_name = f"{settings.MONGO_DB_NAME}_bench"
+        db_manager.client, db_manager.db = client, client[db_name]
+        loop.run_until_complete(client.drop_database(db_name))
+        round_trips = lambda: counter.count
+    else:
+        fake_db = fake_motor.install()
+        round_trips = lambda: fake_db.round_trips
+
+    try:
+        loop.run_until_complete(ensure_indexes(db_manager.db))
+        ids = loop.run_until_complete(seed(users=20, devices_per_user=2, items_per_device=5, notifications_per_user=60))
+        baseline = load_baseline(backend)
+        results: Dict[str, Dict[str, float]] = {}
+        regressions: List[str] = []
+
+        print(f"backend: {backend}" + ("" if baseline else "  (no baseline saved yet)"))
+        print(f"\n  {'benchmark':<48} {'calls/s':>10} {'vs base':>8} {'trips':>6} {'peak KiB':>9}")
+        for name, fn in build_benchmarks(ids):
+            if args.filter and args.filter not in name:
+                continue
+            loop.run_until_complete(fn()) # 预热 (TypeAdapter/校验器缓存等)
+            before = round_trips()
+            loop.run_until_complete(fn())
+            trips = round_trips() - before
+            ops = measure_async(fn, loop, args.min_time)[0]
+            peak = peak_kib_per_call(loop, fn)
+            results[name] = {"calls_per_sec": round(ops, 1), "round_trips": trips, "peak_kib": round(peak, 1)}
+
+            delta, flag = "", ""
+            base = (baseline or {}).get(name)
+            if base:
+                change = ops / base["calls_per_sec"] - 1
+                delta = f"{change:+.0%}"
+                if trips != base["round_trips"]:
+                    flag = f"  <- REGRESSION: round trips {base['round_trips']} -> {trips}" if trips > base["round_trips"] else \
+                           f"  <- round trips {base['round_trips']} -> {trips}, update the baseline"
+                    regressions.append(name)
+                elif change < -args.tolerance:
+                    flag = "  <- slower"
+                    if args.strict:
+                        regressions.append(name)
+            print(f"  {name:<48} {ops:>10,.0f} {delta:>8} {trips:>6} {peak:>9.1f}{flag}")
+    finally:
+        # 联系人改名会提交称呼语音合成，停掉后台合成任务并让取消生效，再关闭事件循环
+        tts_service.tts_queue.stop()
+        loop.run_until_complete(asyncio.sleep(0))
+        if args.mongo:
+            loop.run_until_complete(db_manager.client.drop_database(f"{settings.MONGO_DB_NAME}_bench"))
+            db_manager.client.close()
+        loop.close()
+
+    if args.save_baseline:
+        if args.filter and baseline:
+            results = {**baseline, **results}
+        print(f"\nbaseline saved to {save_baseline(backend, results)}")
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,588 @@
+# benchmarks/fake_motor.py
+"""
+内存版 Motor 替身，供服务层基准测试在没有 MongoDB 的环境下运行。
+
+只实现服务层实际用到的 AsyncIOMotorDatabase / AsyncIOMotorCollection / AsyncIOMotorCursor 子集：
+  find / find_one / insert_one / insert_many / update_one / update_many / find_one_and_update /
+  delete_one / delete_many / bulk_write / count_documents / create_index / list_indexes
+过滤条件支持等值、点路径、$in/$nin/$ne/$gt/$gte/$lt/$lte/$exists/$and/$or；
+更新支持 $set/$unset/$inc/$min/$max/$push/$pull/$addToSet/$setOnInsert 与 upsert。
+
+文档以 BSON 字节保存，读取时重新解码，因此返回的类型 (naive datetime、字符串ID等) 和
+每次读取的解码开销都与真实驱动一致。每个命令计为一次数据库往返 (round_trips)，
+游标的 to_list/迭代只在第一次取数时计一次。
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import bson
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+_MISSING = object()
+
+
+# --- 过滤条件 ---
+def _get_path(doc: Any, path: str) -> Any:
+    for part in path.split("."):
+        if isinstance(doc, dict):
+            doc = doc.get(part, _MISSING)
+        elif isinstance(doc, list) and part.isdigit() and int(part) < len(doc):
+            doc = doc[int(part)]
+        else:
+            return _MISSING
+        if doc is _MISSING:
+            return _MISSING
+    return doc
+
+def _compare(value: Any, operand: Any, op: str) -> bool:
+    if value is _MISSING or value is None or operand is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        return value <= operand
+    except TypeError: # MongoDB 只比较同类型的值
+        return False
+
+def _equals(value: Any, expected: Any) -> bool:
+    if value is _MISSING:
+        return expected is None
+    if isinstance(value, list) and not isinstance(expected, list):
+        return expected in value
+    return value == expected
+
+def _match_operators(value: Any, spec: Dict[str, Any]) -> bool:
+    for op, operand in spec.items():
+        if op == "$in":
+            if not any(_equals(value, item) for item in operand):
+                return False
+        elif op == "$nin":
+            if any(_equals(value, item) for item in operand):
+                return False
+        elif op == "$ne":
+            if _equals(value, operand):
+                return False
+        elif op == "$exists":
+            if (value is not _MISSING) != bool(operand):
+                return False
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            if isinstance(value, list):
+                if not any(_compare(item, operand, op) for item in value):
+                    return False
+            elif not _compare(value, operand, op):
+                return False
+        else:
+            raise NotImplementedError(f"fake_motor: unsupported query operator {op}")
+    return True
+
+def matches(doc: Dict[str, Any], query: Optional[Dict[str, Any]]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if not _match_operators(_get_path(doc, key), condition):
+                return False
+        elif not _equals(_get_path(doc, key), condition):
+            return False
+    return True
+
+
+# --- 更新 ---
+def _set_path(doc: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+def _unset_path(doc: Dict[str, Any], path: str) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+def _evaluate(doc: Dict[str, Any], expression: Any) -> Any:
+    # 聚合管道更新中用到的表达式子集: "$字段" 引用、$add/$subtract/$max/$min、字面量
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get_path(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, dict) and len(expression) == 1:
+        op, operands = next(iter(expression.items()))
+        values = [_evaluate(doc, operand) for operand in operands]
+        if op == "$add":
+            return sum(values)
+        if op == "$subtract":
+            return values[0] - values[1]
+        if op in ("$max", "$min"):
+            present = [value for value in values if value is not None]
+            return (max if op == "$max" else min)(present) if present else None
+        raise NotImplementedError(f"fake_motor: unsupported expression operator {op}")
+    return expression
+
+def apply_update(doc: Dict[str, Any], update: Any, inserting: bool = False) -> None:
+    if isinstance(update, list): # 聚合管道形式的更新 (只支持 $set 阶段)
+        for stage in update:
+            for op, fields in stage.items():
+                if op not in ("$set", "$addFields"):
+                    raise NotImplementedError(f"fake_motor: unsupported pipeline stage {op}")
+                for path, expression in fields.items():
+                    _set_path(doc, path, _evaluate(doc, expression))
+        return
+    if not any(key.startswith("$") for key in update):
+        # 替换整个文档 (保留 _id)
+        doc_id = doc.get("_id")
+        doc.clear()
+        doc.update(update)
+        doc["_id"] = doc_id
+        return
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set":
+                _set_path(doc, path, value)
+            elif op == "$setOnInsert":
+                if inserting:
+                    _set_path(doc, path, value)
+            elif op == "$unset":
+                _unset_path(doc, path)
+            elif op == "$inc":
+                current = _get_path(doc, path)
+                _set_path(doc, path, (0 if current is _MISSING else current) + value)
+            elif op in ("$min", "$max"):
+                current = _get_path(doc, path)
+                if current is _MISSING or (value < current if op == "$min" else value > current):
+                    _set_path(doc, path, value)
+            elif op in ("$push", "$addToSet"):
+                current = _get_path(doc, path)
+                items = list(current) if isinstance(current, list) else []
+                values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                for item in values:
+                    if op == "$push" or item not in items:
+                        items.append(item)
+                _set_path(doc, path, items)
+            elif op == "$pull":
+                current = _get_path(doc, path)
+                if isinstance(current, list):
+                    if isinstance(value, dict):
+                        kept = [item for item in current if not (matches(item, value) if isinstance(item, dict) else _match_operators(item, value))]
+                    else:
+                        kept = [item for item in current if item != value]
+                    _set_path(doc, path, kept)
+            else:
+                raise NotImplementedError(f"fake_motor: unsupported update operator {op}")
+
+
+# --- 排序与投影 ---
+# 与 MongoDB 的跨类型比较顺序一致: null < 数字 < 字符串 < 对象 < 数组 < bool < 日期
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (5, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, dict):
+        return (3, str(value))
+    if isinstance(value, list):
+        return (4, str(value))
+    if isinstance(value, datetime):
+        return (6, value)
+    return (7, str(value))
+
+def _normalize_sort(key_or_list: Any, direction: Optional[int] = None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+def _project(doc: Dict[str, Any], projection: Optional[Any]) -> Dict[str, Any]:
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        result = {k: doc[k] for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    return {k: v for k, v in doc.items() if projection.get(k, 1)}
+
+
+class FakeCursor:
+    def __init__(self, collection: "FakeCollection", query: Optional[Dict[str, Any]], projection: Any = None,
+                 sort: Any = None, skip: int = 0, limit: int = 0):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = _normalize_sort(sort) if sort else []
+        self._skip = skip
+        self._limit = limit
+        self._results: Optional[List[Dict[str, Any]]] = None
+
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> "FakeCursor":
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int) -> "FakeCursor":
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> "FakeCursor":
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size: int) -> "FakeCursor":
+        return self
+
+    def _execute(self) -> List[Dict[str, Any]]:
+        if self._results is None:
+            self._collection.database.round_trips += 1
+            entries = self._collection._select(self._query)
+            for field, direction in reversed(self._sort):
+                entries.sort(key=lambda entry: _sort_key(_get_path(entry[0], field)), reverse=direction < 0)
+            entries = entries[self._skip:]
+            if self._limit:
+                entries = entries[:self._limit]
+            self._results = [_project(bson.decode(raw), self._projection) for _, raw in entries]
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        results = self._execute()
+        return results[:length] if length else list(results)
+
+    async def close(self) -> None:
+        pass
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._execute():
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, database: "FakeDatabase", name: str):
+        self.database = database
+        self.name = name
+        # _id -> (解码后的文档, BSON字节)；解码后的文档只用于匹配，返回给调用方的总是重新解码的副本
+        self._docs: Dict[Any, Tuple[Dict[str, Any], bytes]] = {}
+        self._indexes: Dict[str, Dict[str, Any]] = {"_id_": {"v": 2, "key": {"_id": 1}, "name": "_id_"}}
+        # 索引首字段的等值查找表: 字段 -> 值 -> {_id}，使基准测得的是“走索引”的成本而不是全表扫描
+        self._lookup: Dict[str, Dict[Any, set]] = {}
+        # 唯一索引的键值表: 索引名 -> 键 -> _id，唯一约束检查不随集合大小线性增长
+        self._unique_keys: Dict[str, Dict[Any, Any]] = {}
+
+    def _select(self, query: Optional[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], bytes]]:
+        query = query or {}
+        doc_id = query.get("_id", _MISSING)
+        if doc_id is not _MISSING and not isinstance(doc_id, dict):
+            entry = self._docs.get(doc_id)
+            return [entry] if entry is not None and matches(entry[0], query) else []
+        for field, table in self._lookup.items():
+            value = query.get(field, _MISSING)
+            if value is not _MISSING and isinstance(value, (str, int, float, bool)):
+                candidates = (self._docs[doc_id] for doc_id in table.get(value, ()))
+                return [entry for entry in candidates if matches(entry[0], query)]
+        return [entry for entry in self._docs.values() if matches(entry[0], query)]
+
+    def _store(self, doc: Dict[str, Any]) -> None:
+        previous = self._docs.get(doc["_id"])
+        if previous is not None:
+            self._unindex(previous[0])
+        self._docs[doc["_id"]] = (doc, bson.encode(doc))
+        for field, table in self._lookup.items():
+            value = doc.get(field, _MISSING)
+            if isinstance(value, (str, int, float, bool)):
+                table.setdefault(value, set()).add(doc["_id"])
+        for name, table in self._unique_keys.items():
+            key = self._unique_key(doc, self._indexes[name])
+            if key is not None:
+                table[key] = doc["_id"]
+
+    def _remove(self, doc: Dict[str, Any]) -> None:
+        self._unindex(doc)
+        del self._docs[doc["_id"]]
+
+    def _unindex(self, doc: Dict[str, Any]) -> None:
+        for field, table in self._lookup.items():
+            value = doc.get(field, _MISSING)
+            if isinstance(value, (str, int, float, bool)):
+                table.get(value, set()).discard(doc["_id"])
+        for name, table in self._unique_keys.items():
+            key = self._unique_key(doc, self._indexes[name])
+            if key is not None and table.get(key) == doc["_id"]:
+                del table[key]
+
+    @staticmethod
+    def _unique_key(doc: Dict[str, Any], index: Dict[str, Any]) -> Optional[Tuple[Tuple[bool, ...], bytes]]:
+        # 缺失字段与 null 区分开 (与逐条比较字段值的语义一致)；sparse 索引不收录所有字段都缺失的文档
+        values = [_get_path(doc, field) for field in index["key"]]
+        missing = tuple(value is _MISSING for value in values)
+        if index.get("sparse") and all(missing):
+            return None
+        return missing, bson.encode({"v": [None if value is _MISSING else value for value in values]})
+
+    def _check_unique(self, doc: Dict[str, Any], exclude_id: Any = _MISSING) -> None:
+        for name, table in self._unique_keys.items():
+            key = self._unique_key(doc, self._indexes[name])
+            other_id = table.get(key, _MISSING) if key is not None else _MISSING
+            if other_id is not _MISSING and other_id != exclude_id:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}")
+
+    # --- 读 ---
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Any = None, *, sort: Any = None,
+             skip: int = 0, limit: int = 0, **kwargs: Any) -> FakeCursor:
+        return FakeCursor(self, filter, projection, sort, skip, limit)
+
+    async def find_one(self, filter: Optional[Dict[str, Any]] = None, projection: Any = None, *args: Any, **kwargs: Any) -> Optional[Dict[str, Any]]:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        results = await self.find(filter, projection, sort=kwargs.get("sort"), limit=1).to_list(1)
+        return results[0] if results else None
+
+    async def count_documents(self, filter: Dict[str, Any], **kwargs: Any) -> int:
+        self.database.round_trips += 1
+        return len(self._select(filter))
+
+    # --- 写 ---
+    async def insert_one(self, document: Dict[str, Any], **kwargs: Any) -> InsertOneResult:
+        self.database.round_trips += 1
+        document.setdefault("_id", ObjectId()) # 与 pymongo 一样直接给传入的文档补上 _id
+        if document["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+        doc = bson.decode(bson.encode(document))
+        self._check_unique(doc)
+        self._store(doc)
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, **kwargs: Any) -> InsertManyResult:
+        self.database.round_trips += 1
+        inserted_ids = []
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+            doc = bson.decode(bson.encode(document))
+            self._check_unique(doc)
+            self._store(doc)
+            inserted_ids.append(document["_id"])
+        return InsertManyResult(inserted_ids, True)
+
+    def _update(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool, multi: bool) -> UpdateResult:
+        entries = self._select(filter)
+        if not multi:
+            entries = entries[:1]
+        modified = 0
+        for doc, raw in entries:
+            updated = bson.decode(raw)
+            apply_update(updated, update)
+            self._check_unique(updated, exclude_id=doc["_id"])
+            if updated != doc:
+                self._store(updated)
+                modified += 1
+        upserted_id = None
+        if not entries and upsert:
+            doc = {k: v for k, v in filter.items() if not k.startswith("$") and not isinstance(v, dict)}
+            apply_update(doc, update, inserting=True)
+            doc.setdefault("_id", ObjectId())
+            self._check_unique(doc)
+            self._store(bson.decode(bson.encode(doc)))
+            upserted_id = doc["_id"]
+        raw_result = {"n": len(entries) or (1 if upserted_id is not None else 0), "nModified": modified}
+        if upserted_id is not None:
+            raw_result["upserted"] = upserted_id
+        return UpdateResult(raw_result, True)
+
+    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs: Any) -> UpdateResult:
+        self.database.round_trips += 1
+        return self._update(filter, update, upsert, multi=False)
+
+    async def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs: Any) -> UpdateResult:
+        self.database.round_trips += 1
+        return self._update(filter, update, upsert, multi=True)
+
+    async def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False, **kwargs: Any) -> UpdateResult:
+        self.database.round_trips += 1
+        return self._update(filter, replacement, upsert, multi=False)
+
+    async def bulk_write(self, requests: Iterable[Any], ordered: bool = True, **kwargs: Any) -> BulkWriteResult:
+        """支持 InsertOne/UpdateOne/UpdateMany/ReplaceOne/DeleteOne/DeleteMany；重复键错误按真实驱动的方式汇总为 BulkWriteError"""
+        self.database.round_trips += 1
+        result = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "nUpserted": 0, "upserted": [], "writeErrors": []}
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    request._doc.setdefault("_id", ObjectId())
+                    if request._doc["_id"] in self._docs:
+                        raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+                    doc = bson.decode(bson.encode(request._doc))
+                    self._check_unique(doc)
+                    self._store(doc)
+                    result["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    update_result = self._update(request._filter, request._doc, bool(request._upsert), multi=isinstance(request, UpdateMany))
+                    if update_result.upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": update_result.upserted_id})
+                    else:
+                        result["nMatched"] += update_result.matched_count
+                        result["nModified"] += update_result.modified_count
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    entries = self._select(request._filter)
+                    if isinstance(request, DeleteOne):
+                        entries = entries[:1]
+                    for doc, _ in entries:
+                        self._remove(doc)
+                    result["nRemoved"] += len(entries)
+                else:
+                    raise TypeError(f"Unsupported bulk request {request!r}")
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e), "op": request})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def find_one_and_update(self, filter: Dict[str, Any], update: Dict[str, Any], projection: Any = None,
+                                  sort: Any = None, upsert: bool = False, return_document: bool = False, **kwargs: Any) -> Optional[Dict[str, Any]]:
+        # return_document: False=更新前 (ReturnDocument.BEFORE)，True=更新后 (ReturnDocument.AFTER)
+        self.database.round_trips += 1
+        entries = self._select(filter)
+        if sort:
+            for field, direction in reversed(_normalize_sort(sort)):
+                entries.sort(key=lambda entry: _sort_key(_get_path(entry[0], field)), reverse=direction < 0)
+        if not entries:
+            if not upsert:
+                return None
+            self._update(filter, update, upsert=True, multi=False)
+            if not return_document:
+                return None
+            entries = self._select(filter)[:1]
+            return _project(bson.decode(entries[0][1]), projection) if entries else None
+        doc, raw = entries[0]
+        before = bson.decode(raw)
+        updated = bson.decode(raw)
+        apply_update(updated, update)
+        self._store(updated)
+        return _project(bson.decode(bson.encode(updated)) if return_document else before, projection)
+
+    async def delete_one(self, filter: Dict[str, Any], **kwargs: Any) -> DeleteResult:
+        self.database.round_trips += 1
+        entries = self._select(filter)[:1]
+        for doc, _ in entries:
+            self._remove(doc)
+        return DeleteResult({"n": len(entries)}, True)
+
+    async def delete_many(self, filter: Dict[str, Any], **kwargs: Any) -> DeleteResult:
+        self.database.round_trips += 1
+        entries = self._select(filter)
+        for doc, _ in entries:
+            self._remove(doc)
+        return DeleteResult({"n": len(entries)}, True)
+
+    # --- 索引 (记录定义用于唯一约束；索引首字段的等值条件走查找表，其余条件全量扫描) ---
+    async def create_index(self, keys: Any, **kwargs: Any) -> str:
+        self.database.round_trips += 1
+        key = dict(_normalize_sort(keys, 1))
+        name = kwargs.get("name") or "_".join(f"{field}_{direction}" for field, direction in key.items())
+        self._indexes[name] = {"v": 2, "key": key, "name": name, **{k: v for k, v in kwargs.items() if k != "name"}}
+        first_field = next(iter(key))
+        if first_field != "_id" and "." not in first_field and first_field not in self._lookup:
+            table: Dict[Any, set] = {}
+            for doc_id, (doc, _) in self._docs.items():
+                value = doc.get(first_field, _MISSING)
+                if isinstance(value, (str, int, float, bool)):
+                    table.setdefault(value, set()).add(doc_id)
+            self._lookup[first_field] = table
+        if self._indexes[name].get("unique"):
+            unique_keys: Dict[Any, Any] = {}
+            for doc_id, (doc, _) in self._docs.items():
+                key = self._unique_key(doc, self._indexes[name])
+                if key is not None:
+                    unique_keys[key] = doc_id
+            self._unique_keys[name] = unique_keys
+        return name
+
+    async def drop_index(self, name: str, **kwargs: Any) -> None:
+        self.database.round_trips += 1
+        self._indexes.pop(name, None)
+        self._unique_keys.pop(name, None)
+
+    def list_indexes(self) -> FakeCursor:
+        return _StaticCursor(self.database, list(self._indexes.values()))
+
+
+class _StaticCursor(FakeCursor):
+    def __init__(self, database: "FakeDatabase", docs: List[Dict[str, Any]]):
+        self._database = database
+        self._docs = docs
+        self._results = None
+
+    def _execute(self) -> List[Dict[str, Any]]:
+        if self._results is None:
+            self._database.round_trips += 1
+            self._results = [dict(doc) for doc in self._docs]
+        return self._results
+
+
+class FakeDatabase:
+    def __init__(self, name: str = "fake"):
+        self.name = name
+        self.round_trips = 0
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = FakeCollection(self, name)
+        return collection
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        # 与 Motor 一样支持 db.users 形式；下划线开头的属性不当作集合名
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, command: Any, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        self.round_trips += 1
+        return {"ok": 1.0}
+
+
+class FakeClient:
+    """只为满足 db_manager.client 的接口 (close/admin.command)"""
+
+    def __init__(self):
+        self.databases: Dict[str, FakeDatabase] = {}
+        self.admin = FakeDatabase("admin")
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        return self.databases.setdefault(name, FakeDatabase(name))
+
+    async def drop_database(self, name: str) -> None:
+        self.databases.pop(name, None)
+
+    def close(self) -> None:
+        pass
+
+
+def install(db_name: str = "fake") -> FakeDatabase:
+    """让 app.db.mongodb_utils.get_database() 返回内存数据库"""
+    from app.db.mongodb_utils import db_manager
+    client = FakeClient()
+    db_manager.client, db_manager.db = client, client[db_name]
+    return db_manager.db
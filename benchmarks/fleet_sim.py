@@ -0,0 +1,441 @@
+# benchmarks/fleet_sim.py
+"""
+设备集群模拟器 + 端到端压测：评估单个节点能承载多少台手表。
+
+模拟 N 台虚拟手表 (每台一个独立的MQTT连接) 按配置的频率上报：
+  - status 心跳 (--status-interval 秒，带随机抖动)
+  - SOS / 话费求助 / 报时请求 (--sos-rate / --bill-rate / --time-rate，单位: 每台设备每小时次数，泊松到达)
+同时运行 --http-clients 个小程序客户端，循环请求 GET /devices/ 与 GET /notifications/。
+
+端到端延迟:
+  - status:        MQTT publish -> devices 文档写入 (firmwareVersion 携带序号作为标记)
+  - sos_alert:     MQTT publish -> notifications 文档创建 (location.address 携带序号作为标记)
+  - request_bill_help: MQTT publish -> notifications 文档创建 (同一设备按先后顺序匹配)
+  - request_time:  MQTT publish -> 收到 action/play_audio (或 response/error) 下行
+数据库写入通过 change stream 观测 (需要副本集)；不可用时退化为按 --poll-interval 轮询，轮询本身会给数据库增加少量负载。
+
+资源占用: 通过 /proc 采样 --server-pid 指定进程 (gunicorn 可传多个，逗号分隔) 的CPU与RSS，以及模拟器自身的CPU。
+
+前置条件: 后端服务、MQTT broker、MongoDB 均已启动；模拟器与后端使用同一份 .env
+(需要 MONGO_URI 写入种子数据，需要 RSA 私钥为模拟用户签发 access token)。
+
+用法 (在项目根目录下):
+    python -m benchmarks.fleet_sim --devices 200 --duration 60
+    python -m benchmarks.fleet_sim --devices 2000 --status-interval 30 --http-clients 20 \\
+        --base-url http://127.0.0.1:8000 --server-pid $(pgrep -d, -f "uvicorn|gunicorn")
+
+种子用户/设备 (openid 前缀 fleetsim-) 默认在结束时删除，--keep 保留。
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import aiomqtt
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.db.mongodb_utils import db_manager
+from app.models.user_models import UserCreate
+from app.mqtt import payload_codec
+from app.services import device_service, user_service
+
+SIM_OPENID_PREFIX = "fleetsim-"
+SIM_FIRMWARE_PREFIX = "sim-"
+SIM_ADDRESS_PREFIX = "fleetsim-sos-"
+
+
+class LatencyRecorder:
+    """按流程名记录发送数、完成数和延迟样本"""
+
+    def __init__(self):
+        self.sent: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, flow: str, latency: float) -> None:
+        self.samples[flow].append(latency)
+
+    def report(self, elapsed: float) -> List[Tuple[Any, ...]]:
+        rows = []
+        for flow in sorted(set(self.sent) | set(self.samples)):
+            values = sorted(self.samples[flow])
+            done = len(values)
+            rows.append((
+                flow, self.sent[flow], done, self.errors[flow], done / elapsed,
+                _pct(values, 0.50), _pct(values, 0.95), _pct(values, 0.99), values[-1] * 1000 if values else 0.0,
+            ))
+        return rows
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+class VirtualWatch:
+    """一台虚拟手表：独立MQTT连接，按泊松过程发送事件，并接收发给自己的下行指令"""
+
+    def __init__(self, sim: "FleetSimulator", imei: str):
+        self.sim = sim
+        self.imei = imei
+        self.seq = 0
+        self.pending_time_requests: Dict[str, float] = {}
+
+    def _topic(self, suffix: str) -> str:
+        return payload_codec.encode_topic(f"devices/{self.imei}/{suffix}", self.sim.args.format)
+
+    def _encode(self, payload: Any) -> bytes:
+        return payload_codec.encode(payload, self.sim.args.format)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        args = self.sim.args
+        try:
+            async with self.sim.connect_slots:
+                client = aiomqtt.Client(
+                    args.broker_host, args.broker_port, username=settings.MQTT_USERNAME, password=settings.MQTT_PASSWORD,
+                    identifier=f"fleetsim-{self.imei}", keepalive=max(30, int(args.status_interval * 3)),
+                )
+                await client.__aenter__()
+            self.sim.connected += 1
+        except aiomqtt.MqttError as e:
+            self.sim.connect_errors += 1
+            if self.sim.connect_errors <= 3:
+                print(f"  [{self.imei}] connect failed: {e}")
+            return
+        try:
+            await client.subscribe(f"devices/{self.imei}/action/#", qos=1)
+            await client.subscribe(f"devices/{self.imei}/response/#", qos=1)
+            tasks = [
+                asyncio.create_task(self._receive(client)),
+                asyncio.create_task(self._status_loop(client, stop)),
+                asyncio.create_task(self._event_loop(client, stop, "sos_alert", args.sos_rate)),
+                asyncio.create_task(self._event_loop(client, stop, "request_bill_help", args.bill_rate)),
+                asyncio.create_task(self._event_loop(client, stop, "request_time", args.time_rate)),
+            ]
+            await stop.wait()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            try:
+                await client.__aexit__(None, None, None)
+            except aiomqtt.MqttError:
+                pass
+
+    async def _publish(self, client: aiomqtt.Client, flow: str, topic: str, payload: Any) -> bool:
+        try:
+            await client.publish(self._topic(topic), self._encode(payload), qos=1)
+            self.sim.recorder.sent[flow] += 1
+            return True
+        except aiomqtt.MqttError:
+            self.sim.recorder.errors[flow] += 1
+            return False
+
+    async def _status_loop(self, client: aiomqtt.Client, stop: asyncio.Event) -> None:
+        interval = self.sim.args.status_interval
+        # 随机错开首次上报，避免所有设备同时发送
+        await asyncio.sleep(random.uniform(0, interval))
+        while not stop.is_set():
+            self.seq += 1
+            marker = f"{SIM_FIRMWARE_PREFIX}{self.seq}"
+            payload = {
+                "isOnline": True, "battery": random.randint(5, 100), "signal": random.randint(0, 5), "firmwareVersion": marker,
+                "lastLocation": {"latitude": 30 + random.random(), "longitude": 120 + random.random()},
+            }
+            self.sim.expect_db(("status", self.imei, marker))
+            await self._publish(client, "status", "status", payload)
+            await asyncio.sleep(interval * random.uniform(0.9, 1.1))
+
+    async def _event_loop(self, client: aiomqtt.Client, stop: asyncio.Event, event: str, rate_per_hour: float) -> None:
+        if rate_per_hour <= 0:
+            return
+        while not stop.is_set():
+            await asyncio.sleep(random.expovariate(rate_per_hour / 3600))
+            self.seq += 1
+            if event == "sos_alert":
+                address = f"{SIM_ADDRESS_PREFIX}{self.imei}-{self.seq}"
+                self.sim.expect_db(("sos_alert", self.imei, address))
+                payload = {"location": {"latitude": 30.0, "longitude": 120.0, "address": address}}
+            elif event == "request_bill_help":
+                self.sim.expect_db(("request_bill_help", self.imei, None))
+                payload = {"requestId": str(uuid.uuid4())}
+            else:
+                request_id = str(uuid.uuid4())
+                self.pending_time_requests[request_id] = time.perf_counter()
+                payload = {"requestId": request_id}
+            await self._publish(client, event, f"event/{event}", payload)
+
+    async def _receive(self, client: aiomqtt.Client) -> None:
+        async for message in client.messages:
+            parts, fmt = payload_codec.split_topic_format(message.topic.value.split("/"))
+            try:
+                data = payload_codec.decode(message.payload, fmt, parts[-1])
+            except payload_codec.PayloadDecodeError:
+                continue
+            request_id = data.get("requestId") if isinstance(data, dict) else None
+            sent_at = self.pending_time_requests.pop(request_id, None) if request_id else None
+            if sent_at is None:
+                continue
+            if parts[2] == "action":
+                self.sim.recorder.record("request_time", time.perf_counter() - sent_at)
+            else:
+                self.sim.recorder.errors["request_time"] += 1
+
+
+class DbObserver:
+    """观测数据库写入，计算 MQTT publish -> 文档写入 的延迟"""
+
+    def __init__(self, sim: "FleetSimulator"):
+        self.sim = sim
+        self.mode = "changestream"
+
+    async def run(self, stop: asyncio.Event) -> None:
+        try:
+            await asyncio.gather(self._watch_devices(stop), self._watch_notifications(stop))
+        except OperationFailure as e:
+            # 单机 MongoDB 不支持 change stream (错误码40573)
+            if e.code != 40573:
+                raise
+            self.mode = f"poll/{self.sim.args.poll_interval}s"
+            await asyncio.gather(self._poll_devices(stop), self._poll_notifications(stop))
+
+    async def _watch_devices(self, stop: asyncio.Event) -> None:
+        pipeline = [{"$match": {"operationType": "update", "updateDescription.updatedFields.firmwareVersion": {"$regex": f"^{SIM_FIRMWARE_PREFIX}"}}}]
+        async with self.sim.db["devices"].watch(pipeline, full_document="updateLookup") as stream:
+            while not stop.is_set():
+                change = await stream.try_next()
+                if change:
+                    doc = change["fullDocument"] or {}
+                    self.sim.observed(("status", doc.get("deviceId"), change["updateDescription"]["updatedFields"]["firmwareVersion"]))
+
+    async def _watch_notifications(self, stop: asyncio.Event) -> None:
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.userId": {"$in": self.sim.user_ids}}}]
+        async with self.sim.db["notifications"].watch(pipeline) as stream:
+            while not stop.is_set():
+                change = await stream.try_next()
+                if change:
+                    self._notification_seen(change["fullDocument"])
+
+    async def _poll_devices(self, stop: asyncio.Event) -> None:
+        last_seen: Dict[str, str] = {}
+        while not stop.is_set():
+            cursor = self.sim.db["devices"].find({"userId": {"$in": self.sim.user_ids}}, {"deviceId": 1, "firmwareVersion": 1})
+            async for doc in cursor:
+                marker = doc.get("firmwareVersion")
+                if marker and last_seen.get(doc["deviceId"]) != marker:
+                    last_seen[doc["deviceId"]] = marker
+                    self.sim.observed(("status", doc["deviceId"], marker))
+            await asyncio.sleep(self.sim.args.poll_interval)
+
+    async def _poll_notifications(self, stop: asyncio.Event) -> None:
+        collection = self.sim.db["notifications"]
+        while not stop.is_set():
+            docs = await collection.find({"userId": {"$in": self.sim.user_ids}}).to_list(length=None)
+            for doc in docs:
+                self._notification_seen(doc)
+            if docs: # 已观测的通知直接删除，保持每次轮询的结果集很小
+                await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+            await asyncio.sleep(self.sim.args.poll_interval)
+
+    def _notification_seen(self, doc: Dict[str, Any]) -> None:
+        imei = self.sim.imei_by_device_id.get(str(doc.get("deviceId")))
+        if doc.get("type") == "SOS":
+            self.sim.observed(("sos_alert", imei, (doc.get("payload") or {}).get("address")))
+        elif doc.get("type") == "Billing":
+            self.sim.observed(("request_bill_help", imei, None))
+
+
+class ResourceSampler:
+    """每秒采样一次被测进程的CPU占用和RSS (Linux /proc)"""
+
+    def __init__(self, pids: List[int]):
+        self.pids = pids
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.cpu_samples: List[float] = []
+        self.rss_samples: List[int] = []
+
+    def _read(self) -> Tuple[float, int]:
+        cpu_ticks, rss_pages = 0, 0
+        for pid in self.pids:
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            cpu_ticks += int(fields[11]) + int(fields[12]) # utime + stime
+            rss_pages += int(fields[21])
+        return cpu_ticks / self.clock_ticks, rss_pages * self.page_size
+
+    async def run(self, stop: asyncio.Event) -> None:
+        if not self.pids:
+            return
+        last_cpu, _ = self._read()
+        last_time = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(1)
+            cpu, rss = self._read()
+            now = time.perf_counter()
+            self.cpu_samples.append((cpu - last_cpu) / (now - last_time) * 100)
+            self.rss_samples.append(rss)
+            last_cpu, last_time = cpu, now
+
+
+class FleetSimulator:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.recorder = LatencyRecorder()
+        self.http = LatencyRecorder()
+        self.connect_slots = asyncio.Semaphore(args.connect_concurrency)
+        self.connected = 0
+        self.connect_errors = 0
+        self.client = AsyncIOMotorClient(str(settings.MONGO_URI))
+        self.db = self.client[str(settings.MONGO_DB_NAME)]
+        db_manager.client, db_manager.db = self.client, self.db
+        self.user_ids: List[str] = []
+        self.tokens: List[str] = []
+        self.imeis: List[str] = []
+        self.imei_by_device_id: Dict[str, str] = {}
+        # 等待数据库写入的事件: key -> publish时间 (话费求助没有标记，同一设备按FIFO匹配)
+        self._expected: Dict[Tuple[str, Optional[str], Optional[str]], Deque[float]] = defaultdict(deque)
+
+    def expect_db(self, key: Tuple[str, Optional[str], Optional[str]]) -> None:
+        self._expected[key].append(time.perf_counter())
+
+    def observed(self, key: Tuple[str, Optional[str], Optional[str]]) -> None:
+        pending = self._expected.get(key)
+        if pending:
+            self.recorder.record(key[0], time.perf_counter() - pending.popleft())
+
+    async def seed(self) -> None:
+        """创建模拟用户与设备 (每个用户 --devices-per-user 台)"""
+        users = (self.args.devices + self.args.devices_per_user - 1) // self.args.devices_per_user
+        run_id = uuid.uuid4().hex[:6]
+        for u in range(users):
+            user = await user_service.create_user(UserCreate(wxOpenid=f"{SIM_OPENID_PREFIX}{run_id}-{u}", nickName=f"fleetsim {u}"))
+            self.user_ids.append(str(user.id))
+            self.tokens.append(create_access_token(user.id))
+            for d in range(self.args.devices_per_user):
+                if len(self.imeis) >= self.args.devices:
+                    break
+                imei = f"99{run_id}{len(self.imeis):07d}"
+                device = await device_service.create_device_for_user(user.id, imei, f"sim watch {len(self.imeis)}")
+                self.imeis.append(imei)
+                self.imei_by_device_id[str(device.id)] = imei
+
+    async def cleanup(self) -> None:
+        device_filter = {"userId": {"$in": self.user_ids}}
+        device_ids = [doc["_id"] async for doc in self.db["devices"].find(device_filter, {"_id": 1})]
+        await self.db["notifications"].delete_many({"userId": {"$in": self.user_ids}})
+        await self.db["sos_alerts"].delete_many({"deviceId": {"$in": device_ids}})
+        await self.db["devices"].delete_many(device_filter)
+        await self.db["users"].delete_many({"_id": {"$in": self.user_ids}})
+
+    async def http_client(self, stop: asyncio.Event, index: int) -> None:
+        token = self.tokens[index % len(self.tokens)]
+        api = f"{self.args.base_url.rstrip('/')}{settings.API_V1_STR}"
+        async with httpx.AsyncClient(headers={"Authorization": f"Bearer {token}"}, timeout=10) as client:
+            while not stop.is_set():
+                for flow, path in (("GET /devices/", "/devices/"), ("GET /notifications/", "/notifications/?limit=20")):
+                    start = time.perf_counter()
+                    self.http.sent[flow] += 1
+                    try:
+                        response = await client.get(api + path)
+                        if response.status_code == 200:
+                            self.http.record(flow, time.perf_counter() - start)
+                        else:
+                            self.http.errors[flow] += 1
+                    except httpx.HTTPError:
+                        self.http.errors[flow] += 1
+                await asyncio.sleep(self.args.http_think_time)
+
+    async def run(self) -> None:
+        args = self.args
+        print(f"Seeding {args.devices} devices...")
+        await self.seed()
+        stop = asyncio.Event()
+        observer = DbObserver(self)
+        sampler = ResourceSampler([int(pid) for pid in args.server_pid.split(",") if pid.strip()] if args.server_pid else [])
+        watches = [VirtualWatch(self, imei) for imei in self.imeis]
+
+        background = [asyncio.create_task(observer.run(stop)), asyncio.create_task(sampler.run(stop))]
+        watch_tasks = [asyncio.create_task(watch.run(stop)) for watch in watches]
+        http_tasks = [asyncio.create_task(self.http_client(stop, i)) for i in range(args.http_clients)] if self.tokens else []
+
+        print(f"Running for {args.duration}s (format={args.format}) ...")
+        self_cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        elapsed = time.perf_counter() - start
+        self_cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+        # 给在途的数据库写入/下行留一点时间
+        await asyncio.sleep(args.drain)
+        for task in background + http_tasks:
+            task.cancel()
+        await asyncio.gather(*watch_tasks, *background, *http_tasks, return_exceptions=True)
+
+        self.print_report(elapsed, observer, sampler, self_cpu_end.ru_utime + self_cpu_end.ru_stime
+                          - self_cpu_start.ru_utime - self_cpu_start.ru_stime)
+        if not args.keep:
+            await self.cleanup()
+        self.client.close()
+
+    def print_report(self, elapsed: float, observer: DbObserver, sampler: ResourceSampler, sim_cpu: float) -> None:
+        header = f"  {'flow':<22} {'sent':>8} {'done':>8} {'err':>6} {'done/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+        for title, rows in (
+            (f"Device flows (db observation: {observer.mode})", self.recorder.report(elapsed)),
+            (f"Mini-program HTTP ({self.args.http_clients} clients)", self.http.report(elapsed)),
+        ):
+            print(f"\n=== {title} ===")
+            print(header)
+            for flow, sent, done, err, rate, p50, p95, p99, max_ms in rows:
+                print(f"  {flow:<22} {sent:>8} {done:>8} {err:>6} {rate:>9.1f} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {max_ms:>9.1f}")
+
+        print("\n=== Resources ===")
+        print(f"  devices connected: {self.connected}/{len(self.imeis)} (connect errors: {self.connect_errors})")
+        if sampler.cpu_samples:
+            print(f"  server CPU: avg {sum(sampler.cpu_samples) / len(sampler.cpu_samples):.1f}%  max {max(sampler.cpu_samples):.1f}%"
+                  f"  (100% = one core, pids {','.join(map(str, sampler.pids))})")
+            print(f"  server RSS: max {max(sampler.rss_samples) / 2**20:.1f} MiB")
+        else:
+            print("  server CPU/RSS: not sampled (pass --server-pid)")
+        print(f"  simulator CPU: {sim_cpu / elapsed * 100:.1f}%  (if near 100%, the simulator itself is the bottleneck)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="虚拟手表集群 + 小程序客户端 端到端压测")
+    parser.add_argument("--devices", type=int, default=100, help="虚拟手表数量")
+    parser.add_argument("--devices-per-user", type=int, default=2, help="每个模拟用户绑定的设备数")
+    parser.add_argument("--duration", type=float, default=60, help="压测时长(秒)")
+    parser.add_argument("--drain", type=float, default=3, help="停止发送后等待在途请求完成的时间(秒)")
+    parser.add_argument("--status-interval", type=float, default=60, help="心跳间隔(秒)")
+    parser.add_argument("--sos-rate", type=float, default=0.5, help="每台设备每小时SOS次数")
+    parser.add_argument("--bill-rate", type=float, default=0.5, help="每台设备每小时话费求助次数")
+    parser.add_argument("--time-rate", type=float, default=2, help="每台设备每小时报时请求次数")
+    parser.add_argument("--format", choices=[payload_codec.FORMAT_JSON, payload_codec.FORMAT_MSGPACK], default=payload_codec.FORMAT_JSON)
+    parser.add_argument("--http-clients", type=int, default=5, help="并发小程序客户端数")
+    parser.add_argument("--http-think-time", type=float, default=1.0, help="每个客户端两轮请求之间的间隔(秒)")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="后端HTTP地址")
+    parser.add_argument("--broker-host", default=settings.MQTT_BROKER_HOST)
+    parser.add_argument("--broker-port", type=int, default=settings.MQTT_BROKER_PORT)
+    parser.add_argument("--connect-concurrency", type=int, default=50, help="同时建立的MQTT连接数上限")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="无 change stream 时轮询数据库的间隔(秒)")
+    parser.add_argument("--server-pid", help="采样CPU/RSS的后端进程PID，多个用逗号分隔")
+    parser.add_argument("--keep", action="store_true", help="结束后保留模拟用户/设备数据")
+    args = parser.parse_args()
+    if args.format == payload_codec.FORMAT_MSGPACK and not payload_codec.msgpack_available():
+        parser.error("msgpack is not installed")
+    asyncio.run(FleetSimulator(args).run())
+
+if __name__ == "__main__":
+    main()
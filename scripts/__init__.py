@@ -0,0 +1,2 @@
+# scripts/__init__.py
+# 运维/开发命令行工具，在项目根目录下以 `python -m scripts.<name>` 运行
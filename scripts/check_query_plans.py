@@ -0,0 +1,282 @@
+# scripts/check_query_plans.py
+"""
+查询计划回归检查：验证每个服务函数发出的查询都能命中索引。
+
+在一个独立的数据库 (默认 <MONGO_DB_NAME>_plancheck，运行前后都会清空) 中：
+  1. 按 app/db/indexes.py 建索引
+  2. 通过服务函数写入一批种子数据 (多个用户/设备，保证全表扫描和索引扫描的差异可见)
+  3. 依次调用各服务函数，记录其发出的每条 find/update/delete/count/aggregate 命令
+  4. 对每种查询形态执行 explain("executionStats")，出现以下情况即判为失败:
+     - COLLSCAN (全集合扫描)
+     - SORT 阶段 (内存排序，没有可提供顺序的索引)
+     - docsExamined / 返回(或匹配)文档数 超过 --max-ratio
+
+用法 (需要一个可写的本地/测试 MongoDB，连接串取自 MONGO_URI):
+    python -m scripts.check_query_plans
+    python -m scripts.check_query_plans --users 50 --max-ratio 1.5 --keep
+
+存在失败时退出码为1，可直接用于CI。
+"""
+import argparse
+import asyncio
+import sys
+from datetime import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from app.core.config import settings
+from app.db.indexes import ensure_indexes
+from app.db.mongodb_utils import db_manager, get_sos_alert_collection
+from app.db.query_profiler import normalize_command
+from app.models.contact_models import ContactCreate, ContactUpdate
+from app.models.device_models import DeviceLocation, DeviceStatusUpdate, DeviceUpdate
+from app.models.entertainment_models import EntertainmentItemCreate, EntertainmentItemUpdate
+from app.models.notification_models import NotificationCreate, SosAlertCreate
+from app.models.reminder_models import ReminderCreate, ReminderUpdate
+from app.models.user_models import UserCreate
+from app.services import (
+    contact_service, device_service, device_unbind_service, entertainment_service, export_service, notification_service,
+    reminder_service, user_service,
+)
+
+# 需要 explain 的命令
+EXPLAINABLE_COMMANDS = frozenset({"find", "count", "distinct", "aggregate", "update", "delete", "findAndModify"})
+# 驱动附加的会话/路由字段，explain 时去掉
+_DRIVER_FIELDS = frozenset({"lsid", "txnNumber", "autocommit", "startTransaction", "$db", "$clusterTime", "$readPreference"})
+
+
+class CommandCapture(monitoring.CommandListener):
+    """记录当前场景发出的命令 (只在 scenario 不为 None 时记录)"""
+
+    def __init__(self, db_name: str):
+        self.db_name = db_name
+        self.scenario: Optional[str] = None
+        self.commands: List[Tuple[str, str, Dict[str, Any]]] = []
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if self.scenario and event.database_name == self.db_name and event.command_name in EXPLAINABLE_COMMANDS:
+            command = {k: v for k, v in event.command.items() if k not in _DRIVER_FIELDS}
+            self.commands.append((self.scenario, event.command_name, command))
+
+    def succeeded(self, event) -> None:
+        pass
+
+    def failed(self, event) -> None:
+        pass
+
+
+# --- explain 结果分析 ---
+def _find_first(node: Any, key: str) -> Any:
+    """在 explain 输出中找第一个名为 key 的子文档 (aggregate 的计划嵌在 stages[0].$cursor 中)"""
+    if isinstance(node, dict):
+        if key in node:
+            return node[key]
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        found = _find_first(child, key)
+        if found is not None:
+            return found
+    return None
+
+def _walk_stages(stage: Any) -> Iterator[Dict[str, Any]]:
+    if not isinstance(stage, dict):
+        return
+    yield stage
+    for key in ("queryPlan", "inputStage", "innerStage", "outerStage", "thenStage", "elseStage"):
+        yield from _walk_stages(stage.get(key))
+    for child in stage.get("inputStages") or ():
+        yield from _walk_stages(child)
+
+def analyze_explain(command_name: str, explain: Dict[str, Any], max_ratio: float) -> Tuple[List[str], Dict[str, Any]]:
+    """返回 (问题列表, 摘要)"""
+    problems: List[str] = []
+    winning_plan = _find_first(explain, "winningPlan") or {}
+    stages = [stage.get("stage") for stage in _walk_stages(winning_plan)]
+    if "COLLSCAN" in stages:
+        problems.append("COLLSCAN")
+    if "SORT" in stages:
+        problems.append("in-memory SORT")
+
+    stats = _find_first(explain, "executionStats") or {}
+    examined = stats.get("totalDocsExamined", 0)
+    if command_name in ("update", "delete", "findAndModify"):
+        execution_stages = list(_walk_stages(stats.get("executionStages")))
+        produced = max((stage.get("nMatched", stage.get("nWouldDelete", 0)) for stage in execution_stages), default=0)
+    else:
+        produced = stats.get("nReturned", 0)
+    ratio = examined / max(produced, 1)
+    if ratio > max_ratio:
+        problems.append(f"docsExamined/returned={ratio:.1f} > {max_ratio}")
+    summary = {
+        "plan": " <- ".join(stage for stage in stages if stage),
+        "docsExamined": examined,
+        "keysExamined": stats.get("totalKeysExamined", 0),
+        "returned": produced,
+    }
+    return problems, summary
+
+
+# --- 种子数据 ---
+async def seed(users: int, devices_per_user: int, items_per_device: int, notifications_per_user: int) -> Dict[str, Any]:
+    """通过服务函数写入种子数据，返回场景中使用的一组ID"""
+    ids: Dict[str, Any] = {}
+    for u in range(users):
+        user = await user_service.create_user(UserCreate(wxOpenid=f"plancheck-openid-{u}", nickName=f"user{u}"))
+        for d in range(devices_per_user):
+            imei = f"86{u:06d}{d:07d}"
+            device = await device_service.create_device_for_user(user.id, imei, f"device {u}-{d}")
+            for i in range(items_per_device):
+                contact = await contact_service.create_contact_for_device(
+                    device.id, user.id, ContactCreate(deviceId=device.id, name=f"c{i}", phone=f"138{u:04d}{i:04d}")
+                )
+                reminder = await reminder_service.create_reminder_for_device(
+                    device.id, user.id, ReminderCreate(deviceId=device.id, content=f"r{i}", time=time(8, i % 60), repeat=["1", "2"])
+                )
+                item = await entertainment_service.create_entertainment_item_for_device(
+                    device.id, user.id, EntertainmentItemCreate(deviceId=device.id, name=f"e{i}", url=f"https://example.com/{i}.mp3")
+                )
+                # 与 MQTT 的 SOS 处理一致直接插入，_id 由驱动生成 (ObjectId)
+                await get_sos_alert_collection().insert_one(SosAlertCreate(
+                    deviceId=device.id, userId=user.id, location=DeviceLocation(latitude=30.0, longitude=120.0)
+                ).model_dump(mode="json"))
+        for n in range(notifications_per_user):
+            notification = await notification_service.create_notification(NotificationCreate(
+                userId=user.id, deviceId=device.id, deviceName=device.name, type="SOS" if n % 10 == 0 else "Billing",
+                content=f"n{n}", isRead=n % 2 == 0, payload={"latitude": 30.0, "longitude": 120.0} if n % 10 == 0 else None,
+            ))
+        # 场景使用最后一个用户的数据
+        ids.update(user=user, device=device, contact=contact, reminder=reminder, item=item, notification=notification)
+    return ids
+
+
+def build_scenarios(ids: Dict[str, Any]) -> List[Tuple[str, Callable[[], Awaitable[Any]]]]:
+    user, device = ids["user"], ids["device"]
+    contact, reminder, item, notification = ids["contact"], ids["reminder"], ids["item"], ids["notification"]
+    # 删除类场景放在最后
+    return [
+        ("user_service.get_user_by_openid", lambda: user_service.get_user_by_openid(user.wxOpenid)),
+        ("user_service.get_user_by_id", lambda: user_service.get_user_by_id(user.id)),
+        ("user_service.update_user_info", lambda: user_service.update_user_info(user.id, "renamed", None)),
+        ("device_service.get_devices_by_user_id", lambda: device_service.get_devices_by_user_id(user.id)),
+        ("device_service.get_device_fields_by_user_id", lambda: device_service.get_device_fields_by_user_id(
+            user.id, frozenset({"id", "name", "battery", "isOnline"})
+        )),
+        ("device_service.get_device_by_id_and_user", lambda: device_service.get_device_by_id_and_user(device.id, user.id)),
+        ("device_service.get_device_by_imei", lambda: device_service.get_device_by_imei(device.deviceId)),
+        ("device_service.update_device_info", lambda: device_service.update_device_info(device.id, user.id, DeviceUpdate(name="renamed"))),
+        ("device_service.update_device_status_by_imei", lambda: device_service.update_device_status_by_imei(
+            device.deviceId, DeviceStatusUpdate(isOnline=True, battery=80, lastLocation=DeviceLocation(latitude=30.0, longitude=120.0))
+        )),
+        ("contact_service.check_device_ownership", lambda: contact_service.check_device_ownership(device.id, user.id)),
+        ("contact_service.get_contacts_for_device", lambda: contact_service.get_contacts_for_device(device.id, user.id)),
+        ("contact_service.get_contact_detail_for_device", lambda: contact_service.get_contact_detail_for_device(device.id, contact.id, user.id)),
+        ("contact_service.update_contact_for_device", lambda: contact_service.update_contact_for_device(
+            device.id, contact.id, user.id, ContactUpdate(name="renamed", isSosIntent=True)
+        )),
+        ("reminder_service.get_reminders_for_device", lambda: reminder_service.get_reminders_for_device(device.id, user.id)),
+        ("reminder_service.get_reminder_detail_for_device", lambda: reminder_service.get_reminder_detail_for_device(device.id, reminder.id, user.id)),
+        ("reminder_service.update_reminder_for_device", lambda: reminder_service.update_reminder_for_device(
+            device.id, reminder.id, user.id, ReminderUpdate(enabled=False)
+        )),
+        ("entertainment_service.get_entertainment_items_for_device", lambda: entertainment_service.get_entertainment_items_for_device(device.id, user.id)),
+        ("entertainment_service.update_entertainment_item_for_device", lambda: entertainment_service.update_entertainment_item_for_device(
+            device.id, item.id, user.id, EntertainmentItemUpdate(name="renamed")
+        )),
+        ("notification_service.create_notification", lambda: notification_service.create_notification(
+            NotificationCreate(userId=user.id, deviceId=device.id, type="LowBattery", content="low battery")
+        )),
+        ("notification_service.get_notifications_for_user", lambda: notification_service.get_notifications_for_user(user.id, 0, 20)),
+        ("notification_service.get_notification_fields_for_user", lambda: notification_service.get_notification_fields_for_user(
+            user.id, frozenset({"id", "title", "time", "isRead"}), 0, 20
+        )),
+        ("export_service.find_notifications", lambda: export_service.find_notifications(user.id).to_list(length=None)),
+        ("export_service.find_sos_alerts", lambda: export_service.find_sos_alerts(device.id).to_list(length=None)),
+        ("notification_service.get_notification_by_id_for_user", lambda: notification_service.get_notification_by_id_for_user(notification.id, user.id)),
+        ("notification_service.mark_notification_read", lambda: notification_service.mark_notification_read(notification.id, user.id)),
+        ("notification_service.mark_all_notifications_read_for_user", lambda: notification_service.mark_all_notifications_read_for_user(user.id)),
+        ("notification_service.delete_notification_for_user", lambda: notification_service.delete_notification_for_user(notification.id, user.id)),
+        ("notification_service.delete_all_notifications_for_user", lambda: notification_service.delete_all_notifications_for_user(user.id)),
+        ("contact_service.delete_contact_for_device", lambda: contact_service.delete_contact_for_device(device.id, contact.id, user.id)),
+        ("reminder_service.delete_reminder_for_device", lambda: reminder_service.delete_reminder_for_device(device.id, reminder.id, user.id)),
+        ("entertainment_service.delete_entertainment_item_for_device", lambda: entertainment_service.delete_entertainment_item_for_device(
+            device.id, item.id, user.id
+        )),
+        ("device_unbind_service.claim_tombstone", device_unbind_service.claim_tombstone),
+        # 级联删除在后台任务中执行，这里直接等待，记录其查询
+        ("device_unbind_service.tombstone_device+run_cascade", lambda: _unbind_and_cascade(device.id, user.id)),
+    ]
+
+async def _unbind_and_cascade(device_id, user_id) -> bool:
+    tombstone = await device_unbind_service.tombstone_device(device_id, user_id)
+    return bool(tombstone) and await device_unbind_service.run_cascade(tombstone)
+
+
+async def run(args: argparse.Namespace) -> int:
+    db_name = f"{settings.MONGO_DB_NAME}{args.db_suffix}"
+    if not args.db_suffix:
+        print("--db-suffix must not be empty: the check database is dropped before and after the run")
+        return 2
+    capture = CommandCapture(db_name)
+    client = AsyncIOMotorClient(str(settings.MONGO_URI), event_listeners=[capture])
+    db = client[db_name]
+    # 服务函数通过 get_database() 取库，直接指向检查用的库
+    db_manager.client, db_manager.db = client, db
+    await client.drop_database(db_name)
+    failures = 0
+    try:
+        await ensure_indexes(db)
+        ids = await seed(args.users, args.devices, args.items, args.notifications)
+
+        for name, call in build_scenarios(ids):
+            capture.scenario = name
+            try:
+                await call()
+            finally:
+                capture.scenario = None
+
+        # 同一场景中相同形态的查询只 explain 一次
+        seen = set()
+        print(f"\n{'scenario':<58} {'plan':<34} {'exam':>5} {'ret':>4}  result")
+        print("-" * 120)
+        for scenario, command_name, command in capture.commands:
+            shape = normalize_command(command_name, command)
+            if (scenario, shape) in seen:
+                continue
+            seen.add((scenario, shape))
+            explain = await db.command({"explain": command, "verbosity": "executionStats"})
+            problems, summary = analyze_explain(command_name, explain, args.max_ratio)
+            failures += bool(problems)
+            print(f"{scenario:<58} {summary['plan'][:34]:<34} {summary['docsExamined']:>5} {summary['returned']:>4}  "
+                  f"{'FAIL: ' + ', '.join(problems) if problems else 'ok'}")
+            if problems or args.verbose:
+                print(f"    {shape[0]}: {shape[1]}")
+    finally:
+        if not args.keep:
+            await client.drop_database(db_name)
+        client.close()
+
+    print(f"\n{len(seen)} query shapes checked, {failures} failed")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="验证服务函数的查询都能命中索引")
+    parser.add_argument("--db-suffix", default="_plancheck", help="检查用数据库名后缀 (运行前后会被清空)")
+    parser.add_argument("--users", type=int, default=20, help="种子用户数")
+    parser.add_argument("--devices", type=int, default=2, help="每个用户的设备数")
+    parser.add_argument("--items", type=int, default=5, help="每台设备的联系人/提醒/娱乐条目数")
+    parser.add_argument("--notifications", type=int, default=60, help="每个用户的通知数")
+    parser.add_argument("--max-ratio", type=float, default=2.0, help="docsExamined / 返回文档数 的上限")
+    parser.add_argument("--keep", action="store_true", help="结束后保留检查用数据库")
+    parser.add_argument("--verbose", "-v", action="store_true", help="打印每种查询形态")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    main()
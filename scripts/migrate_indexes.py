@@ -0,0 +1,50 @@
+# scripts/migrate_indexes.py
+"""
+按 app/db/indexes.py 中的 INDEX_SPECS 同步生产环境索引 (取代原先仅在 DEBUG 下执行的 create_db_indexes)。
+
+用法 (在项目根目录下，读取与服务相同的 .env / 环境变量):
+    python -m scripts.migrate_indexes --dry-run      # 只打印将要执行的操作
+    python -m scripts.migrate_indexes                # 创建缺失的索引
+    python -m scripts.migrate_indexes --drop-extra   # 同时删除定义中已不存在的旧索引
+
+只创建缺失的索引，已有索引不会重建；TTL 索引的 expireAfterSeconds 变化通过 collMod 原地修改，
+其他选项冲突的索引只报告，退出码为1，需人工处理。
+"""
+import argparse
+import asyncio
+import sys
+
+from app.db.indexes import ensure_indexes
+from app.db.mongodb_utils import close_mongo_connection, connect_to_mongo, get_database
+
+def _format_key(key) -> str:
+    return ", ".join(f"{field}:{direction}" for field, direction in key)
+
+async def run(dry_run: bool, drop_extra: bool) -> int:
+    await connect_to_mongo()
+    try:
+        actions = await ensure_indexes(get_database(), dry_run=dry_run, drop_extra=drop_extra)
+    finally:
+        await close_mongo_connection()
+
+    print(f"\n{'collection':<22} {'action':<9} index")
+    print("-" * 72)
+    for action in actions:
+        options = " ".join(f"{k}={v}" for k, v in action["options"].items())
+        line = f"{action['collection']:<22} {action['action']:<9} ({_format_key(action['key'])}) {options}"
+        if action["action"] in ("conflict", "modify"):
+            line += f"  <- existing: {action['existing']}"
+        print(line)
+    if dry_run:
+        print("\n(dry run, nothing changed)")
+    return 1 if any(action["action"] == "conflict" for action in actions) else 0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="同步 MongoDB 索引")
+    parser.add_argument("--dry-run", action="store_true", help="只打印将要执行的操作")
+    parser.add_argument("--drop-extra", action="store_true", help="删除 INDEX_SPECS 中未定义的索引 (_id 除外)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.dry_run, args.drop_extra)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# scripts/replay_journal.py
+"""
+把 MQTT 入站消息日志 (app/mqtt/journal.py，由 MQTT_JOURNAL_DIR 启用) 重新送入 AsyncMQTTClient 的处理流程，
+用于现场问题复现和基于真实流量的吞吐量测试。不连接 Broker：消息直接交给 _handle_message，
+发往设备的回复 (publish_message) 只计数不发送。
+
+用法 (在项目根目录下):
+    python -m scripts.replay_journal /var/lib/watch/journal                 # 最大速度，内存数据库
+    python -m scripts.replay_journal journal-xxx.mqj --speed 1              # 按录制时的时间间隔回放
+    python -m scripts.replay_journal /path/to/journal --speed 10 --filter sos_alert
+    python -m scripts.replay_journal /path/to/journal --mongo --db-name watch_incident_copy
+
+默认使用内存版 Motor 替身 (benchmarks/fake_motor.py)，并为日志中出现的每个IMEI预先创建设备，测得的是处理流程自身的开销；
+--mongo 连接 MONGO_URI，默认写入独立的 <MONGO_DB_NAME>_replay 库 (结束后保留)，可用 --db-name 指向从生产恢复的副本。
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import aiomqtt
+from prometheus_client import REGISTRY
+
+from app.core.config import settings
+from app.db.mongodb_utils import db_manager
+from app.db.indexes import ensure_indexes
+from app.models.user_models import UserCreate
+from app.mqtt import payload_codec
+from app.mqtt.journal import JournalRecord, read_journal
+from app.mqtt.mqtt_client import mqtt_client
+from app.services import device_service, user_service
+
+def _imei_of(topic: str) -> Optional[str]:
+    parts, _ = payload_codec.split_topic_format(topic.split('/'))
+    if len(parts) >= 3 and parts[0] == "devices":
+        return parts[1]
+    return None
+
+def load_records(path: str, topic_filter: Optional[str], limit: Optional[int]) -> List[JournalRecord]:
+    """一次性读入内存，避免回放计时中包含磁盘读取"""
+    records = []
+    for record in read_journal(path):
+        if topic_filter and topic_filter not in record[1]:
+            continue
+        records.append(record)
+        if limit and len(records) >= limit:
+            break
+    return records
+
+async def seed_devices(records: List[JournalRecord]) -> int:
+    """为日志中出现但数据库中不存在的IMEI创建设备 (统一挂在一个回放用户下)"""
+    imeis = {imei for _, topic, _ in records if (imei := _imei_of(topic))}
+    user = await user_service.get_user_by_openid("replay-journal")
+    if user is None:
+        user = await user_service.create_user(UserCreate(wxOpenid="replay-journal", nickName="replay"))
+    created = 0
+    for imei in sorted(imeis):
+        if await device_service.get_device_by_imei(imei) is None:
+            await device_service.create_device_for_user(user.id, imei, f"replay {imei[-4:]}")
+            created += 1
+    return created
+
+def _metric_totals(name: str) -> Dict[str, float]:
+    totals: Dict[str, float] = {}
+    for metric in REGISTRY.collect():
+        for sample in metric.samples:
+            if sample.name == name:
+                event = sample.labels.get("event_type", "")
+                totals[event] = totals.get(event, 0) + sample.value
+    return totals
+
+async def replay(records: List[JournalRecord], speed: float) -> Dict[str, float]:
+    """speed=0 表示不等待，尽可能快；否则按 (录制间隔 / speed) 回放"""
+    published: Counter = Counter()
+
+    async def record_publish(topic: str, payload, qos: int = 1):
+        published[topic.split('/')[-1]] += 1
+
+    mqtt_client.publish_message = record_publish # 只替换该实例的方法，不影响类
+    mqtt_client.journal = None # 回放时不再写日志
+
+    handled_before = _metric_totals("mqtt_messages_handled_total")
+    failed_before = _metric_totals("mqtt_messages_failed_total")
+    first_ts = records[0][0] if records else 0.0
+    start = time.perf_counter()
+    for received_at, topic, payload in records:
+        if speed > 0:
+            delay = (received_at - first_ts) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await mqtt_client._handle_message(aiomqtt.Message(topic, payload, 1, False, 0, None))
+    dispatched = time.perf_counter() - start
+    await mqtt_client.drain()
+    elapsed = time.perf_counter() - start
+
+    handled = _metric_totals("mqtt_messages_handled_total")
+    failed = _metric_totals("mqtt_messages_failed_total")
+    return {
+        "messages": len(records),
+        "dispatch_s": dispatched,
+        "elapsed_s": elapsed,
+        "recorded_s": (records[-1][0] - first_ts) if records else 0.0,
+        "handled": {k: v - handled_before.get(k, 0) for k, v in handled.items() if v - handled_before.get(k, 0)},
+        "failed": {k: v - failed_before.get(k, 0) for k, v in failed.items() if v - failed_before.get(k, 0)},
+        "published": dict(published),
+    }
+
+async def run(args: argparse.Namespace) -> int:
+    records = load_records(args.path, args.filter, args.limit)
+    if not records:
+        print("no journal records found")
+        return 1
+
+    if args.mongo:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(str(settings.MONGO_URI))
+        db_manager.client, db_manager.db = client, client[args.db_name or f"{settings.MONGO_DB_NAME}_replay"]
+    else:
+        from benchmarks import fake_motor
+        fake_motor.install("replay")
+    try:
+        await ensure_indexes(db_manager.db)
+        if not args.no_seed:
+            created = await seed_devices(records)
+            print(f"seeded {created} device(s)")
+        result = await replay(records, args.speed)
+    finally:
+        if args.mongo:
+            db_manager.client.close()
+
+    rate = result["messages"] / result["elapsed_s"] if result["elapsed_s"] else 0.0
+    print(f"\nmessages:   {result['messages']}  (recorded over {result['recorded_s']:.1f}s)")
+    print(f"elapsed:    {result['elapsed_s']:.3f}s  (dispatch {result['dispatch_s']:.3f}s)")
+    print(f"throughput: {rate:,.0f} msg/s")
+    for label in ("handled", "failed", "published"):
+        counts = ", ".join(f"{k}={v:.0f}" for k, v in sorted(result[label].items())) or "-"
+        print(f"{label + ':':<11} {counts}")
+    return 1 if result["failed"] else 0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="回放 MQTT 入站消息日志")
+    parser.add_argument("path", help="日志目录或单个 .mqj 段文件")
+    parser.add_argument("--speed", type=float, default=0.0, help="回放速度倍数，1 为录制时的节奏，0 为最大速度 (默认)")
+    parser.add_argument("--filter", help="只回放主题包含该字符串的消息")
+    parser.add_argument("--limit", type=int, help="最多回放的消息数")
+    parser.add_argument("--mongo", action="store_true", help="写入 MONGO_URI 指向的真实 mongod")
+    parser.add_argument("--db-name", help="--mongo 时使用的库名 (默认 <MONGO_DB_NAME>_replay)")
+    parser.add_argument("--no-seed", action="store_true", help="不为日志中的IMEI预建设备")
+    parser.add_argument("--log-level", default="WARNING", help="处理流程的日志级别 (默认 WARNING)")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+    sys.exit(asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# scripts/run_retention.py
+"""
+执行一轮数据保留任务 (见 app/services/retention_service.py)，适合由 cron 定时调用。
+
+用法 (在项目根目录下，读取与服务相同的 .env / 环境变量):
+    python -m scripts.run_retention              # 补齐已处理 SOS 记录的过期时间；删除到期文档 (配置了 RETENTION_ARCHIVE_DIR 时先归档)
+    python -m scripts.run_retention --backfill   # 上线后执行一次：给存量通知补上过期时间
+
+同一时间只应运行一个实例。
+"""
+import argparse
+import asyncio
+
+from app.db.mongodb_utils import close_mongo_connection, connect_to_mongo
+from app.services import retention_service
+
+async def run(backfill: bool) -> None:
+    await connect_to_mongo()
+    try:
+        if backfill:
+            print(f"notifications backfilled: {await retention_service.backfill_notification_expiry()}")
+        for name, value in (await retention_service.run_retention()).items():
+            print(f"{name}: {value}")
+    finally:
+        await close_mongo_connection()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="执行数据保留/归档")
+    parser.add_argument("--backfill", action="store_true", help="先给没有 expireAt 的存量通知设置过期时间")
+    args = parser.parse_args()
+    asyncio.run(run(args.backfill))
+
+if __name__ == "__main__":
+    main()